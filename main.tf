@@ -51,6 +51,9 @@ data "aws_iam_policy_document" "autoscaling_group_scheduler" {
       "autoscaling:SuspendProcesses",
       "autoscaling:ResumeProcesses",
       "autoscaling:UpdateAutoScalingGroup",
+      "autoscaling:CreateOrUpdateTags",
+      "autoscaling:DeleteTags",
+      "autoscaling:PutWarmPool",
       "autoscaling:DescribeAutoScalingInstances",
       "autoscaling:TerminateInstanceInAutoScalingGroup",
       "ec2:TerminateInstances",
@@ -73,7 +76,9 @@ data "aws_iam_policy_document" "spot_instance_scheduler" {
   statement {
     actions = [
       "ec2:DescribeInstances",
-      "ec2:TerminateSpotInstances",
+      "ec2:DescribeSpotInstanceRequests",
+      "ec2:CancelSpotInstanceRequests",
+      "ec2:TerminateInstances",
     ]
 
     resources = [
@@ -118,6 +123,7 @@ data "aws_iam_policy_document" "rds_scheduler" {
       "rds:StartDBInstance",
       "rds:StopDBInstance",
       "rds:DescribeDBClusters",
+      "rds:DescribeDBInstances",
     ]
 
     resources = [
@@ -139,7 +145,7 @@ data "aws_iam_policy_document" "ecs_scheduler" {
   statement {
     actions = [
       "ecs:UpdateService",
-      "ecs:DescribeService",
+      "ecs:DescribeServices",
     ]
 
     resources = [
@@ -166,6 +172,7 @@ data "aws_iam_policy_document" "cloudwatch_alarm_scheduler" {
   statement {
     actions = [
       "cloudwatch:DisableAlarmActions",
+      "cloudwatch:DescribeAlarms",
       "cloudwatch:EnableAlarmActions",
     ]
 
@@ -194,6 +201,79 @@ data "aws_iam_policy_document" "resource_groups_tagging_api" {
   }
 }
 
+resource "aws_iam_role_policy" "lambda_follow_up" {
+  count  = var.custom_iam_role_arn == null ? 1 : 0
+  name   = "${var.name}-lambda-follow-up"
+  role   = aws_iam_role.this[0].id
+  policy = data.aws_iam_policy_document.lambda_follow_up.json
+}
+
+data "aws_iam_policy_document" "lambda_follow_up" {
+  statement {
+    actions = [
+      "lambda:InvokeFunction",
+    ]
+
+    resources = [
+      aws_lambda_function.this.arn,
+    ]
+  }
+}
+
+resource "aws_iam_role_policy" "run_report" {
+  count  = var.custom_iam_role_arn == null && var.run_report_bucket != "" ? 1 : 0
+  name   = "${var.name}-run-report"
+  role   = aws_iam_role.this[0].id
+  policy = data.aws_iam_policy_document.run_report.json
+}
+
+data "aws_iam_policy_document" "run_report" {
+  statement {
+    actions = [
+      "s3:PutObject",
+    ]
+
+    resources = [
+      "arn:aws:s3:::${var.run_report_bucket}/run-reports/*",
+    ]
+  }
+}
+
+resource "aws_iam_role_policy" "assume_role_scheduler" {
+  count  = var.custom_iam_role_arn == null && length(var.scheduler_assume_role_arns) > 0 ? 1 : 0
+  name   = "${var.name}-assume-role-scheduler"
+  role   = aws_iam_role.this[0].id
+  policy = data.aws_iam_policy_document.assume_role_scheduler.json
+}
+
+data "aws_iam_policy_document" "assume_role_scheduler" {
+  statement {
+    actions = [
+      "sts:AssumeRole",
+    ]
+
+    resources = length(var.scheduler_assume_role_arns) > 0 ? var.scheduler_assume_role_arns : ["*"]
+  }
+}
+
+resource "aws_iam_role_policy" "xray_tracing" {
+  count  = var.custom_iam_role_arn == null && var.scheduler_tracing == "xray" ? 1 : 0
+  name   = "${var.name}-xray-tracing"
+  role   = aws_iam_role.this[0].id
+  policy = data.aws_iam_policy_document.xray_tracing.json
+}
+
+data "aws_iam_policy_document" "xray_tracing" {
+  statement {
+    actions = [
+      "xray:PutTraceSegments",
+      "xray:PutTelemetryRecords",
+    ]
+
+    resources = ["*"]
+  }
+}
+
 resource "aws_iam_role_policy" "lambda_logging" {
   count  = var.custom_iam_role_arn == null ? 1 : 0
   name   = "${var.name}-lambda-logging"
@@ -273,6 +353,7 @@ resource "aws_lambda_function" "this" {
       SCHEDULE_ACTION           = var.schedule_action
       TAG_KEY                   = local.scheduler_tag["key"]
       TAG_VALUE                 = local.scheduler_tag["value"]
+      TAG_EXPRESSION            = var.scheduler_tag_expression
 
       EC2_SCHEDULE              = tostring(var.ec2_schedule)
       ECS_SCHEDULE              = tostring(var.ecs_schedule)
@@ -280,12 +361,31 @@ resource "aws_lambda_function" "this" {
       AUTOSCALING_SCHEDULE      = tostring(var.autoscaling_schedule)
       CLOUDWATCH_ALARM_SCHEDULE = tostring(var.cloudwatch_alarm_schedule)
 
+      SCHEDULER_DEPENDENCIES    = var.scheduler_dependencies
+      RDS_READINESS_FOLLOW_UP   = tostring(var.rds_readiness_follow_up)
+      SCHEDULER_MAX_CONCURRENCY = tostring(var.scheduler_max_concurrency)
+      SCHEDULER_ENGINE          = var.scheduler_engine
+      EC2_STOP_MODE             = var.ec2_stop_mode
+      AUTOSCALING_SCHEDULE_MODE = var.autoscaling_schedule_mode
+      SCHEDULE_TAG              = var.scheduler_schedule_tag
+      RECONCILE_WINDOW          = var.reconcile_window
+      RUN_REPORT_BUCKET         = var.run_report_bucket
+      DEADLINE_SAFETY_MARGIN    = tostring(var.scheduler_deadline_safety_margin)
+      DISCOVERY_PAGE_SIZE       = tostring(var.scheduler_discovery_page_size)
+      ASSUME_ROLE_ARNS          = join(", ", var.scheduler_assume_role_arns)
+      ACCOUNTS_MAX_CONCURRENCY  = tostring(var.scheduler_accounts_max_concurrency)
+      TRACING                   = var.scheduler_tracing
+
       EXCLUDE_EC2_IDS_STATICS               = join(", ", var.scheduler_exclude_ec2_ids)
       EXCLUDE_EC2_IDS_FROM_URL              = var.scheduler_exclude_ec2_ids_from_url
       # EXCLUDE_EC2_IDS_FROM_SECRETS_MANAGER  = var.scheduler_exclude_ec2_ids_from_secrets_manager
     }
   }
 
+  tracing_config {
+    mode = var.scheduler_tracing == "xray" ? "Active" : "PassThrough"
+  }
+
   tags = var.tags
 }
 
@@ -1,33 +1,253 @@
 """Autoscaling instances scheduler."""
 
+import logging
+import sys
+import time
 from typing import Dict, List
 from collections.abc import Iterator
 
-import boto3
 from botocore.exceptions import ClientError
 
+from ..ec2.handler import apply_instances_action
+from ..libs.aws_sessions import get_client
+from ..libs.filter_resources_by_tags import SETTING_TAG_PREFIX
+from ..libs.pagination import PageCursor, paginate
+from ..libs.pipeline import BATCH_SIZE, batched, run_pipeline
+from ..libs.schedule_window import RUNNING, STOPPED
+from ..libs.tag_expression import compile_tags
 from ..libs.waiters import AwsWaiters
 from .exceptions import ec2_exception
 
+# Tag holding the capacity of a group stopped in capacity mode.
+SAVED_CAPACITY_TAG = SETTING_TAG_PREFIX + "saved-capacity"
+# Cursor key of the groups listing.
+GROUP_RESOURCE_TYPE = "autoscaling:group"
+# Lifecycle states of the group instances stopped and started with
+# their group, Standby and terminating instances are left alone.
+SCHEDULED_LIFECYCLE_STATES = ("InService", "Pending", "Pending:Wait", "Pending:Proceed")
+# Processes suspended by the scheduler in suspend mode, a group is only
+# considered stopped by the scheduler when all of them are suspended.
+SUSPENDED_PROCESSES = (
+    "Launch",
+    "Terminate",
+    "AddToLoadBalancer",
+    "AlarmNotification",
+    "AZRebalance",
+    "HealthCheck",
+    "InstanceRefresh",
+    "ReplaceUnhealthy",
+    "ScheduledActions",
+)
+# Keys of the group descriptions used by the scheduler, the other ones
+# are dropped as the pages are read.
+GROUP_KEYS = (
+    "AutoScalingGroupName",
+    "MinSize",
+    "MaxSize",
+    "DesiredCapacity",
+    "WarmPoolConfiguration",
+    "SuspendedProcesses",
+    "Tags",
+)
+
+
+def format_capacity(group: dict) -> str:
+    """Serialize the capacity of an autoscaling group in a tag value.
+
+    :param dict group:
+        The group returned by describe_auto_scaling_groups.
+
+    :return str:
+        The min, max and desired capacity, and the warm pool sizes
+        when the group has one. For example:
+        min=1,max=5,desired=3,warm-min=1,warm-max=-1
+    """
+    capacity = {
+        "min": group["MinSize"],
+        "max": group["MaxSize"],
+        "desired": group["DesiredCapacity"],
+    }
+    warm_pool = group.get("WarmPoolConfiguration")
+    if warm_pool is not None:
+        capacity["warm-min"] = warm_pool.get("MinSize", 0)
+        capacity["warm-max"] = warm_pool.get("MaxGroupPreparedCapacity", -1)
+    return ",".join(f"{key}={value}" for key, value in capacity.items())
+
+
+def is_scaled_to_zero(group: dict) -> bool:
+    """Return True when a group and its warm pool have no capacity.
+
+    :param dict group:
+        The group returned by describe_auto_scaling_groups.
+    """
+    capacity = (group["MinSize"], group["MaxSize"], group["DesiredCapacity"])
+    warm_pool = group.get("WarmPoolConfiguration")
+    if warm_pool is not None:
+        capacity += (
+            warm_pool.get("MinSize", 0),
+            warm_pool.get("MaxGroupPreparedCapacity", -1),
+        )
+    return not any(capacity)
+
+
+def parse_capacity(value: str) -> dict:
+    """Parse a capacity serialized by format_capacity.
+
+    :param str value:
+        The value of the saved capacity tag.
+
+    :raises ValueError:
+        The tag value is invalid.
+    """
+    capacity = {}
+    for item in value.split(","):
+        key, _, size = item.partition("=")
+        capacity[key] = int(size)
+    if not {"min", "max", "desired"} <= capacity.keys():
+        raise ValueError(f"Invalid saved capacity: {value}")
+    return capacity
+
+
+class GroupResult:
+    """Abstract scheduling result of an autoscaling group in a class."""
+
+    __slots__ = ("name", "mode", "status", "instance_count", "scheduled_count", "duration")
+
+    def __init__(self, name: str, mode: str) -> None:
+        """Initialize group result.
+
+        :param str name:
+            The autoscaling group name.
+        :param str mode:
+            The schedule mode of the group, suspend or capacity.
+        """
+        self.name = name
+        self.mode = mode
+        # suspended, resumed, scaled-to-0, restored or failed
+        self.status = "failed"
+        self.instance_count = 0
+        self.scheduled_count = 0
+        self.duration = 0.0
+
+    def __repr__(self) -> str:
+        """Return the group name and status."""
+        return f"GroupResult({self.name!r}, {self.status!r})"
+
+
+class GroupInstance:
+    """Abstract instance of an autoscaling group in a class."""
+
+    __slots__ = ("instance_id", "lifecycle_state", "health_status")
+
+    def __init__(self, instance_id: str, lifecycle_state: str, health_status: str) -> None:
+        """Initialize group instance.
+
+        :param str instance_id:
+            The ec2 instance id.
+        :param str lifecycle_state:
+            The lifecycle state in the group, like InService or Standby.
+        :param str health_status:
+            Healthy or Unhealthy.
+        """
+        self.instance_id = instance_id
+        self.lifecycle_state = sys.intern(lifecycle_state)
+        self.health_status = sys.intern(health_status)
+
+    def __repr__(self) -> str:
+        """Return the instance id and lifecycle state."""
+        return f"GroupInstance({self.instance_id!r}, {self.lifecycle_state!r})"
+
+
+def index_instances(group: dict) -> list[GroupInstance]:
+    """Return the instances of a group with their state.
+
+    :param dict group:
+        The group returned by describe_auto_scaling_groups.
+    """
+    return [
+        GroupInstance(
+            instance["InstanceId"],
+            instance.get("LifecycleState", "InService"),
+            instance.get("HealthStatus", "Healthy"),
+        )
+        for instance in group.get("Instances", [])
+    ]
+
+
+def compact_group(group: dict) -> dict:
+    """Return the part of a group description used by the scheduler.
+
+    The tags keep their key and value, the instances are kept in the
+    group index, see index_instances.
+
+    :param dict group:
+        The group returned by describe_auto_scaling_groups.
+    """
+    compact = {key: group[key] for key in GROUP_KEYS if key in group}
+    compact["Tags"] = [
+        {"Key": sys.intern(tag["Key"]), "Value": sys.intern(tag["Value"])}
+        for tag in group.get("Tags", [])
+    ]
+    if group.get("SuspendedProcesses"):
+        # Only the presence of suspended processes is read
+        compact["SuspendedProcesses"] = [
+            {"ProcessName": sys.intern(process["ProcessName"])}
+            for process in group["SuspendedProcesses"]
+        ]
+    return compact
+
 
 class AutoscalingScheduler:
     """Abstract autoscaling scheduler in a class."""
 
-    def __init__(self, region_name=None) -> None:
-        """Initialize autoscaling scheduler."""
-        if region_name:
-            self.ec2 = boto3.client("ec2", region_name=region_name)
-            self.asg = boto3.client("autoscaling", region_name=region_name)
-        else:
-            self.ec2 = boto3.client("ec2")
-            self.asg = boto3.client("autoscaling")
-        self.waiter = AwsWaiters(region_name=region_name)
+    def __init__(
+        self,
+        region_name=None,
+        session=None,
+        mode="suspend",
+        max_workers=10,
+        page_size=None,
+        cursors=None,
+        resource_ids=None,
+    ) -> None:
+        """Initialize autoscaling scheduler.
 
-    def stop(self, aws_tags: list[dict]) -> None:
+        :param str mode:
+            The schedule mode of the groups without the
+            scheduler:asg-mode tag. suspend stops the group instances
+            with suspended processes, capacity saves the group capacity
+            in a tag and sets it to 0 until the start.
+        :param int max_workers:
+            Maximum number of groups scheduled at the same time.
+        :param int page_size:
+            The number of groups described per page, at most 100.
+        :param dict cursors:
+            The autoscaling:group page token to resume the groups
+            listing from.
+        :param list[str] resource_ids:
+            Only schedule these groups, default all the tagged ones.
+        """
+        self.ec2 = get_client("ec2", region_name, session)
+        self.asg = get_client("autoscaling", region_name, session)
+        self.waiter = AwsWaiters(region_name=region_name, session=session)
+        self.mode = mode
+        self.max_workers = max_workers
+        self.page_size = page_size
+        self.resume_tokens = dict(cursors or {})
+        self.resource_ids = set(resource_ids) if resource_ids else None
+        self.cursors = {}
+        self.results = []
+        # Instances of each described group, see describe_groups
+        self.index = {}
+
+    def stop(self, aws_tags: list[dict], to_exclude=None) -> None:
         """Aws autoscaling suspend function.
 
         Suspend autoscaling group and stop its instances
-        with defined tag.
+        with defined tag. Groups in capacity mode are scaled
+        to 0 instead. Groups are scheduled concurrently while the
+        next ones are described, see results for the outcome of
+        each group.
 
         :param list[map] aws_tags:
             Aws tags to use for filter resources.
@@ -40,32 +260,27 @@ class AutoscalingScheduler:
                     ]
                 }
             ]
+        :param to_exclude:
+            The excluded group names and instance ids.
         """
-        tag_key = aws_tags[0]["Key"]
-        tag_value = "".join(aws_tags[0]["Values"])
-        asg_name_list = self.list_groups(tag_key, tag_value)
-        instance_id_list = self.list_instances(asg_name_list)
-
-        for asg_name in asg_name_list:
-            try:
-                self.asg.suspend_processes(AutoScalingGroupName=asg_name)
-                print(f"Suspend autoscaling group {asg_name}")
-            except ClientError as exc:
-                ec2_exception("instance", asg_name, exc)
+        to_exclude = set(to_exclude or [])
+        self.results = []
+        run_pipeline(
+            self.describe_groups(aws_tags, to_exclude),
+            lambda groups: self.results.append(self.stop_group(groups[0], to_exclude)),
+            batch_size=1,
+            workers=self.max_workers,
+        )
+        self.print_results()
 
-        # Stop autoscaling instance
-        for instance_id in instance_id_list:
-            try:
-                self.ec2.stop_instances(InstanceIds=[instance_id])
-                print(f"Stop autoscaling instances {instance_id}")
-            except ClientError as exc:
-                ec2_exception("autoscaling group", instance_id, exc)
-
-    def start(self, aws_tags: list[dict]) -> None:
+    def start(self, aws_tags: list[dict], to_exclude=None) -> None:
         """Aws autoscaling resume function.
 
         Resume autoscaling group and start its instances
-        with defined tag.
+        with defined tag. Groups in capacity mode get their
+        saved capacity back. Groups are scheduled concurrently while
+        the next ones are described, see results for the outcome of
+        each group.
 
         :param list[map] aws_tags:
             Aws tags to use for filter resources
@@ -78,61 +293,333 @@ class AutoscalingScheduler:
                     ]
                 }
             ]
+        :param to_exclude:
+            The excluded group names and instance ids.
+        """
+        to_exclude = set(to_exclude or [])
+        self.results = []
+        run_pipeline(
+            self.describe_groups(aws_tags, to_exclude),
+            lambda groups: self.results.append(self.start_group(groups[0], to_exclude)),
+            batch_size=1,
+            workers=self.max_workers,
+        )
+        self.print_results()
+
+    def reconcile(self, aws_tags, desired_state, to_exclude=None) -> None:
+        """Aws autoscaling reconcile function.
+
+        Stop or start the tagged groups whose state differs from the
+        state wanted now, see libs.schedule_window. A group is stopped
+        when its capacity is saved in capacity mode, or when all the
+        SUSPENDED_PROCESSES are suspended in suspend mode: the processes
+        suspended by hand, like AZRebalance, are left alone.
+
+        :param list[map] aws_tags:
+            Aws tags to use for filter resources.
+        :param callable desired_state:
+            Function returning the state wanted for the tags of a
+            group, running, stopped or None to leave it.
+        """
+        to_exclude = set(to_exclude or [])
+        self.results = []
+        run_pipeline(
+            self.describe_groups(aws_tags, to_exclude),
+            lambda groups: self.reconcile_group(groups[0], desired_state, to_exclude),
+            batch_size=1,
+            workers=self.max_workers,
+        )
+        self.print_results()
+
+    def reconcile_group(self, group: dict, desired_state, to_exclude=()) -> None:
+        """Stop or start a group when its state differs from the wanted one."""
+        tags = self.group_tags(group)
+        state = desired_state(tags)
+        if self.group_mode(group) == "capacity":
+            stopped = SAVED_CAPACITY_TAG in tags
+        else:
+            suspended = {
+                process["ProcessName"] for process in group.get("SuspendedProcesses", [])
+            }
+            stopped = suspended.issuperset(SUSPENDED_PROCESSES)
+        if state == STOPPED and not stopped:
+            self.results.append(self.stop_group(group, to_exclude))
+        elif state == RUNNING and stopped:
+            self.results.append(self.start_group(group, to_exclude))
+
+    def stop_group(self, group: dict, to_exclude=()) -> GroupResult:
+        """Suspend a group and stop its instances, or scale it to 0.
+
+        :param dict group:
+            The group returned by describe_auto_scaling_groups.
+        :param to_exclude:
+            The excluded instance ids.
         """
-        tag_key = aws_tags[0]["Key"]
-        tag_value = "".join(aws_tags[0]["Values"])
-        asg_name_list = self.list_groups(tag_key, tag_value)
-        instance_id_list = self.list_instances(asg_name_list)
-        instance_running_ids = []
-
-        # Start autoscaling instance
-        for instance_id in instance_id_list:
+        started_at = time.monotonic()
+        asg_name = group["AutoScalingGroupName"]
+        result = GroupResult(asg_name, self.group_mode(group))
+        if result.mode == "capacity":
+            result.status = "scaled-to-0" if self.save_capacity(group) else "failed"
+        else:
             try:
-                self.ec2.start_instances(InstanceIds=[instance_id])
-                print(f"Start autoscaling instances {instance_id}")
+                self.asg.suspend_processes(
+                    AutoScalingGroupName=asg_name, ScalingProcesses=list(SUSPENDED_PROCESSES)
+                )
+                print(f"Suspend autoscaling group {asg_name}")
+                result.status = "suspended"
             except ClientError as exc:
-                ec2_exception("instance", instance_id, exc)
-            else:
-                instance_running_ids.append(instance_id)
+                ec2_exception("autoscaling group", asg_name, exc, self.asg.meta.region_name)
+            instance_ids = self.group_instance_ids(group, to_exclude)
+            result.instance_count = len(self.group_instances(group))
+            for batch in batched(instance_ids, BATCH_SIZE):
+                result.scheduled_count += len(
+                    apply_instances_action(self.ec2, "stop", batch, "autoscaling instances")
+                )
+        result.duration = round(time.monotonic() - started_at, 1)
+        return result
 
-        self.waiter.instance_running(instance_ids=instance_running_ids)
+    def start_group(self, group: dict, to_exclude=()) -> GroupResult:
+        """Start the instances of a group and resume it, or restore its capacity.
 
-        for asg_name in asg_name_list:
+        The group processes are resumed once its started instances
+        are running.
+
+        :param dict group:
+            The group returned by describe_auto_scaling_groups.
+        :param to_exclude:
+            The excluded instance ids.
+        """
+        started_at = time.monotonic()
+        asg_name = group["AutoScalingGroupName"]
+        result = GroupResult(asg_name, self.group_mode(group))
+        if result.mode == "capacity":
+            result.status = "restored" if self.restore_capacity(group) else "failed"
+        else:
+            instance_ids = self.group_instance_ids(group, to_exclude)
+            result.instance_count = len(self.group_instances(group))
+            running_ids = []
+            for batch in batched(instance_ids, BATCH_SIZE):
+                running_ids += apply_instances_action(
+                    self.ec2, "start", batch, "autoscaling instances"
+                )
+            result.scheduled_count = len(running_ids)
+            self.waiter.instance_running(instance_ids=running_ids)
             try:
-                self.asg.resume_processes(AutoScalingGroupName=asg_name)
+                self.asg.resume_processes(
+                    AutoScalingGroupName=asg_name, ScalingProcesses=list(SUSPENDED_PROCESSES)
+                )
                 print(f"Resume autoscaling group {asg_name}")
+                result.status = "resumed"
             except ClientError as exc:
-                ec2_exception("autoscaling group", asg_name, exc)
+                ec2_exception("autoscaling group", asg_name, exc, self.asg.meta.region_name)
+        result.duration = round(time.monotonic() - started_at, 1)
+        return result
+
+    def print_results(self) -> None:
+        """Print the result of each group, the slowest first."""
+        for result in sorted(self.results, key=lambda result: result.duration, reverse=True):
+            print(
+                f"Autoscaling group {result.name} {result.status} in {result.duration}s"
+                f" ({result.scheduled_count}/{result.instance_count} instances)"
+            )
+
+    def save_capacity(self, group: dict) -> bool:
+        """Save the capacity of a group in a tag and scale it to 0.
+
+        The warm pool of the group, if any, is emptied too. A group
+        whose capacity is already saved is scaled to 0 again when it
+        still has capacity, for example after a failed update, without
+        overwriting the saved capacity.
+        Return False when the group capacity is not saved.
+
+        :param dict group:
+            The group returned by describe_auto_scaling_groups.
+        """
+        asg_name = group["AutoScalingGroupName"]
+        saved = SAVED_CAPACITY_TAG in self.group_tags(group)
+        if saved and is_scaled_to_zero(group):
+            logging.info(f"{asg_name} capacity already saved.")
+            return True
+        try:
+            if saved:
+                logging.warning(
+                    f"{asg_name} capacity already saved but not 0, "
+                    "saved capacity kept and scaled to 0 again."
+                )
+            else:
+                self.asg.create_or_update_tags(
+                    Tags=[
+                        {
+                            "ResourceId": asg_name,
+                            "ResourceType": "auto-scaling-group",
+                            "Key": SAVED_CAPACITY_TAG,
+                            "Value": format_capacity(group),
+                            "PropagateAtLaunch": False,
+                        }
+                    ]
+                )
+            self.asg.update_auto_scaling_group(
+                AutoScalingGroupName=asg_name, MinSize=0, MaxSize=0, DesiredCapacity=0
+            )
+            if "WarmPoolConfiguration" in group:
+                self.asg.put_warm_pool(
+                    AutoScalingGroupName=asg_name, MinSize=0, MaxGroupPreparedCapacity=0
+                )
+            print(f"Scale autoscaling group {asg_name} to 0")
+        except ClientError as exc:
+            ec2_exception("autoscaling group", asg_name, exc, self.asg.meta.region_name)
+            return False
+        return True
 
-    def list_groups(self, tag_key: str, tag_value: str) -> list[str]:
+    def restore_capacity(self, group: dict) -> bool:
+        """Restore the capacity saved by save_capacity.
+
+        Return False when the group capacity is not restored.
+
+        :param dict group:
+            The group returned by describe_auto_scaling_groups.
+        """
+        asg_name = group["AutoScalingGroupName"]
+        saved_capacity = self.group_tags(group).get(SAVED_CAPACITY_TAG)
+        if saved_capacity is None:
+            logging.info(f"{asg_name} has no saved capacity.")
+            return True
+        try:
+            capacity = parse_capacity(saved_capacity)
+            self.asg.update_auto_scaling_group(
+                AutoScalingGroupName=asg_name,
+                MinSize=capacity["min"],
+                MaxSize=capacity["max"],
+                DesiredCapacity=capacity["desired"],
+            )
+            if "warm-min" in capacity:
+                self.asg.put_warm_pool(
+                    AutoScalingGroupName=asg_name,
+                    MinSize=capacity["warm-min"],
+                    MaxGroupPreparedCapacity=capacity["warm-max"],
+                )
+            self.asg.delete_tags(
+                Tags=[
+                    {
+                        "ResourceId": asg_name,
+                        "ResourceType": "auto-scaling-group",
+                        "Key": SAVED_CAPACITY_TAG,
+                    }
+                ]
+            )
+            print(f"Restore autoscaling group {asg_name} capacity {saved_capacity}")
+        except ValueError as exc:
+            logging.error(f"autoscaling group {asg_name}: {exc}")
+            return False
+        except ClientError as exc:
+            ec2_exception("autoscaling group", asg_name, exc, self.asg.meta.region_name)
+            return False
+        return True
+
+    def group_instance_ids(self, group: dict, to_exclude=()) -> list[str]:
+        """Return the instances of a group to stop or start.
+
+        The instances come from the index built while describing the
+        groups, those in Standby, leaving the group or excluded are
+        skipped.
+
+        :param dict group:
+            The group returned by describe_auto_scaling_groups.
+        :param to_exclude:
+            The excluded instance ids.
+        """
+        asg_name = group["AutoScalingGroupName"]
+        instance_ids = []
+        for instance in self.group_instances(group):
+            if instance.instance_id in to_exclude:
+                logging.info(f"{instance.instance_id} found in exclude list.")
+            elif instance.lifecycle_state not in SCHEDULED_LIFECYCLE_STATES:
+                logging.info(
+                    f"{instance.instance_id} of {asg_name} skipped in {instance.lifecycle_state}."
+                )
+            else:
+                instance_ids.append(instance.instance_id)
+        return instance_ids
+
+    def group_instances(self, group: dict) -> list[GroupInstance]:
+        """Return the indexed instances of a group."""
+        instances = self.index.get(group["AutoScalingGroupName"])
+        return index_instances(group) if instances is None else instances
+
+    def is_excluded(self, group: dict, to_exclude=()) -> bool:
+        """Return True when a group is excluded by name or by tag."""
+        return (
+            group["AutoScalingGroupName"] in to_exclude
+            or self.group_tags(group).get(SETTING_TAG_PREFIX + "exclude", "false").lower()
+            == "true"
+        )
+
+    def group_mode(self, group: dict) -> str:
+        """Return the schedule mode of a group, suspend or capacity."""
+        return self.group_tags(group).get(SETTING_TAG_PREFIX + "asg-mode", self.mode)
+
+    @staticmethod
+    def group_tags(group: dict) -> dict:
+        """Return the tags of a group as a key/value dict."""
+        return {tag["Key"]: tag["Value"] for tag in group["Tags"]}
+
+    def describe_groups(self, aws_tags, to_exclude=()) -> Iterator[dict]:
+        """Aws autoscaling describe function.
+
+        The instances of the matching groups, with their lifecycle
+        state and health, are kept in index so they are not described
+        again.
+
+        :param list[map] aws_tags:
+            Aws tags to use for filter resources, as TagFilters or
+            a tag expression, see libs.tag_expression.
+        :param to_exclude:
+            The excluded group names.
+
+        :yield Iterator[dict]:
+            The Auto Scaling groups matching the tags
+        """
+        expression = compile_tags(aws_tags)
+        cursor = PageCursor(self.resume_tokens.pop(GROUP_RESOURCE_TYPE, None), self.page_size)
+        self.cursors[GROUP_RESOURCE_TYPE] = cursor
+        for group in paginate(
+            self.asg.describe_auto_scaling_groups,
+            "NextToken",
+            "AutoScalingGroups",
+            cursor,
+            size_name="MaxRecords",
+        ):
+            if not expression.matches(self.group_tags(group)):
+                continue
+            if self.resource_ids and group["AutoScalingGroupName"] not in self.resource_ids:
+                continue
+            if self.is_excluded(group, to_exclude):
+                logging.info(f"{group['AutoScalingGroupName']} found in exclude list.")
+                continue
+            self.index[group["AutoScalingGroupName"]] = index_instances(group)
+            yield compact_group(group)
+
+    def list_groups(self, aws_tags) -> list[str]:
         """Aws autoscaling list function.
 
         List name of all autoscaling groups with
         specific tag and return it in list.
 
-        :param str tag_key:
-            Aws tag key to use for filter resources
-        :param str tag_value:
-            Aws tag value to use for filter resources
+        :param list[map] aws_tags:
+            Aws tags to use for filter resources, as TagFilters or
+            a tag expression, see libs.tag_expression.
 
         :return list asg_name_list:
             The names of the Auto Scaling groups
         """
-        asg_name_list = []
-        paginator = self.asg.get_paginator("describe_auto_scaling_groups")
-
-        for page in paginator.paginate():
-            for group in page["AutoScalingGroups"]:
-                for tag in group["Tags"]:
-                    if tag["Key"] == tag_key and tag["Value"] == tag_value:
-                        asg_name_list.append(group["AutoScalingGroupName"])
-        return asg_name_list
+        return [group["AutoScalingGroupName"] for group in self.describe_groups(aws_tags)]
 
     def list_instances(self, asg_name_list: list[str]) -> Iterator[str]:
         """Aws autoscaling instance list function.
 
         List name of all instances in the autoscaling groups
-        and return it in list.
+        and return it in list. Only the groups missing from the index
+        are described.
 
         :param list asg_name_list:
             The names of the Auto Scaling groups.
@@ -140,11 +627,13 @@ class AutoscalingScheduler:
         :yield Iterator[str]:
             The names of the instances in Auto Scaling groups.
         """
-        if not asg_name_list:
-            return iter([])
-        paginator = self.asg.get_paginator("describe_auto_scaling_groups")
-
-        for page in paginator.paginate(AutoScalingGroupNames=asg_name_list):
-            for scalinggroup in page["AutoScalingGroups"]:
-                for instance in scalinggroup["Instances"]:
-                    yield instance["InstanceId"]
+        missing = [name for name in asg_name_list if name not in self.index]
+        if missing:
+            paginator = self.asg.get_paginator("describe_auto_scaling_groups")
+            for page in paginator.paginate(AutoScalingGroupNames=missing):
+                for scalinggroup in page["AutoScalingGroups"]:
+                    self.index[scalinggroup["AutoScalingGroupName"]] = index_instances(scalinggroup)
+
+        for asg_name in asg_name_list:
+            for instance in self.index.get(asg_name, []):
+                yield instance.instance_id
@@ -2,15 +2,19 @@
 
 """Exception function for all aws scheduler."""
 
-import logging
-
 from botocore.exceptions import ClientError
 
+from ..libs.error_classifier import record_error
+
 
-def cloudwatch_exception(resource_name: str, resource_id: str, exception: ClientError):
+def cloudwatch_exception(
+    resource_name: str, resource_id: str, exception: ClientError, region_name=None
+) -> None:
     """Exception raised during execution of Cloudwatch scheduler.
 
-    Log Cloudwatch exceptions on the specific aws resources.
+    Count the Cloudwatch exceptions on the specific aws resources, they
+    are logged in a summary at the end of the invocation, see
+    libs.error_classifier.
 
     :param str resource_name:
         Aws resource name
@@ -18,5 +22,7 @@ def cloudwatch_exception(resource_name: str, resource_id: str, exception: Client
         Aws resource id
     :param str exception:
         Human-readable string describing the exception
+    :param str region_name:
+        Aws region of the resource
     """
-    logging.error(f"{resource_name} {resource_id}: {exception.response['Error']['Message']}")
+    record_error("cloudwatch_alarm", resource_name, resource_id, exception, region_name)
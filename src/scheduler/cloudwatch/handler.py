@@ -1,27 +1,46 @@
 """Cloudwatch alarm action scheduler."""
 
-import boto3
+import logging
+
 from botocore.exceptions import ClientError
 
+from ..libs.aws_sessions import get_client
 from ..libs.filter_resources_by_tags import FilterByTags
+from ..libs.schedule_window import RUNNING, STOPPED
 from .exceptions import cloudwatch_exception
 
+# Maximum number of alarms of an enable or disable alarm actions call.
+ALARM_BATCH_SIZE = 100
+
 
 class CloudWatchAlarmScheduler:
     """Abstract Cloudwatch alarm scheduler in a class."""
 
-    def __init__(self, region_name=None) -> None:
-        """Initialize Cloudwatch alarm scheduler."""
-        if region_name:
-            self.cloudwatch = boto3.client("cloudwatch", region_name=region_name)
-        else:
-            self.cloudwatch = boto3.client("cloudwatch")
-        self.tag_api = FilterByTags(region_name=region_name)
+    def __init__(
+        self, region_name=None, session=None, page_size=None, cursors=None, resource_ids=None
+    ) -> None:
+        """Initialize Cloudwatch alarm scheduler.
+
+        :param int page_size:
+            The number of tagged resources listed per page.
+        :param dict cursors:
+            The page token to resume a resource type listing from, see
+            libs.filter_resources_by_tags.FilterByTags.
+        :param list[str] resource_ids:
+            Only schedule these resources, default all the tagged ones.
+        """
+        self.cloudwatch = get_client("cloudwatch", region_name, session)
+        self.tag_api = FilterByTags(
+            region_name, session, page_size, cursors, resource_ids
+        )
+        # Discovery position of each listed resource type
+        self.cursors = self.tag_api.cursors
 
-    def stop(self, aws_tags: list[dict]) -> None:
+    def stop(self, aws_tags: list[dict], to_exclude=None) -> None:
         """Aws Cloudwatch alarm disable function.
 
-        Disable Cloudwatch alarm with defined tags.
+        Disable Cloudwatch alarm with defined tags, by chunks of 100
+        alarms.
 
         :param list[map] aws_tags:
             Aws tags to use for filter resources.
@@ -35,18 +54,13 @@ class CloudWatchAlarmScheduler:
                 }
             ]
         """
-        for alarm_arn in self.tag_api.get_resources("cloudwatch:alarm", aws_tags):
-            alarm_name = alarm_arn.split(":")[-1]
-            try:
-                self.cloudwatch.disable_alarm_actions(AlarmNames=[alarm_name])
-                print(f"Disable Cloudwatch alarm {alarm_name}")
-            except ClientError as exc:
-                cloudwatch_exception("cloudwatch alarm", alarm_name, exc)
+        self._set_alarm_actions(aws_tags, to_exclude, "disable")
 
-    def start(self, aws_tags: list[dict]) -> None:
+    def start(self, aws_tags: list[dict], to_exclude=None) -> None:
         """Aws Cloudwatch alarm enable function.
 
-        Enable Cloudwatch alarm with defined tags.
+        Enable Cloudwatch alarm with defined tags, by chunks of 100
+        alarms.
 
         :param list[map] aws_tags:
             Aws tags to use for filter resources.
@@ -60,10 +74,101 @@ class CloudWatchAlarmScheduler:
                 }
             ]
         """
-        for alarm_arn in self.tag_api.get_resources("cloudwatch:alarm", aws_tags):
-            alarm_name = alarm_arn.split(":")[-1]
+        self._set_alarm_actions(aws_tags, to_exclude, "enable")
+
+    def _set_alarm_actions(self, aws_tags, to_exclude, operation) -> None:
+        """Enable or disable the actions of the tagged alarms.
+
+        Alarms are updated by chunks of ALARM_BATCH_SIZE as they are
+        listed, a chunk failing is sent again alarm by alarm to update
+        the others.
+
+        :param str operation:
+            enable or disable.
+        """
+        to_exclude = set(to_exclude or [])
+        chunk = []
+        for alarm in self.tag_api.get_resources("cloudwatch:alarm", aws_tags):
+            if alarm.is_excluded(to_exclude):
+                logging.info(f"{alarm.resource_id} found in exclude list.")
+                continue
+            chunk.append(alarm.resource_id)
+            if len(chunk) == ALARM_BATCH_SIZE:
+                self._send_alarm_actions(operation, chunk)
+                chunk = []
+        if chunk:
+            self._send_alarm_actions(operation, chunk)
+
+    def _send_alarm_actions(self, operation, alarm_names) -> None:
+        """Send an enable or disable alarm actions call."""
+        try:
+            send = getattr(self.cloudwatch, f"{operation}_alarm_actions")
+            send(AlarmNames=alarm_names)
+        except ClientError as exc:
+            if len(alarm_names) > 1:
+                for alarm_name in alarm_names:
+                    self._send_alarm_actions(operation, [alarm_name])
+                return
+            region_name = self.cloudwatch.meta.region_name
+            cloudwatch_exception("cloudwatch alarm", alarm_names[0], exc, region_name)
+        else:
+            for alarm_name in alarm_names:
+                print(f"{operation.capitalize()} Cloudwatch alarm {alarm_name}")
+
+    def reconcile(self, aws_tags, desired_state, to_exclude=None) -> None:
+        """Aws Cloudwatch alarm reconcile function.
+
+        Enable or disable the actions of the tagged alarms whose
+        actions state differs from the state wanted now, see
+        libs.schedule_window. Alarms are described and updated by
+        chunks of 100.
+
+        :param list[map] aws_tags:
+            Aws tags to use for filter resources.
+        :param callable desired_state:
+            Function returning the state wanted for the tags of an
+            alarm, running to enable its actions, stopped to disable
+            them or None to leave it.
+        """
+        to_exclude = set(to_exclude or [])
+        desired = {}
+        for alarm in self.tag_api.get_resources("cloudwatch:alarm", aws_tags):
+            if alarm.is_excluded(to_exclude):
+                logging.info(f"{alarm.resource_id} found in exclude list.")
+                continue
+            state = desired_state(alarm.tags)
+            if state:
+                desired[alarm.resource_id] = state
+
+        alarm_names = list(desired)
+        for i in range(0, len(alarm_names), ALARM_BATCH_SIZE):
+            chunk = alarm_names[i:i + ALARM_BATCH_SIZE]
             try:
-                self.cloudwatch.enable_alarm_actions(AlarmNames=[alarm_name])
-                print(f"Enable Cloudwatch alarm {alarm_name}")
+                alarms = self.cloudwatch.describe_alarms(AlarmNames=chunk)["MetricAlarms"]
             except ClientError as exc:
-                cloudwatch_exception("cloudwatch alarm", alarm_name, exc)
+                cloudwatch_exception(
+                    "cloudwatch alarms", ",".join(chunk), exc, self.cloudwatch.meta.region_name
+                )
+                continue
+            to_enable, to_disable = [], []
+            for alarm in alarms:
+                alarm_name = alarm["AlarmName"]
+                if desired[alarm_name] == RUNNING and not alarm["ActionsEnabled"]:
+                    to_enable.append(alarm_name)
+                elif desired[alarm_name] == STOPPED and alarm["ActionsEnabled"]:
+                    to_disable.append(alarm_name)
+            for operation, verb, names in (
+                ("enable_alarm_actions", "Enable", to_enable),
+                ("disable_alarm_actions", "Disable", to_disable),
+            ):
+                if not names:
+                    continue
+                try:
+                    getattr(self.cloudwatch, operation)(AlarmNames=names)
+                except ClientError as exc:
+                    cloudwatch_exception(
+                        "cloudwatch alarms", ",".join(names), exc, self.cloudwatch.meta.region_name
+                    )
+                else:
+                    for alarm_name in names:
+                        print(f"{verb} Cloudwatch alarm {alarm_name}")
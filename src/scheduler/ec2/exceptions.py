@@ -2,16 +2,19 @@
 
 """Exception function for all aws scheduler."""
 
-import logging
-
 from botocore.exceptions import ClientError
 
+from ..libs.error_classifier import record_error
+
 
-def ec2_exception(resource_name: str, resource_id: str, exception: ClientError) -> None:
+def ec2_exception(
+    resource_name: str, resource_id: str, exception: ClientError, region_name=None
+) -> None:
     """Exception raised during execution of ec2 scheduler.
 
-    Log instance, spot instance and autoscaling groups exceptions
-    on the specific aws resources.
+    Count the instance and spot instance exceptions on the specific aws resources, they
+    are logged in a summary at the end of the invocation, see
+    libs.error_classifier.
 
     :param str resource_name:
         Aws resource name
@@ -19,17 +22,7 @@ def ec2_exception(resource_name: str, resource_id: str, exception: ClientError)
         Aws resource id
     :param str exception:
         Human-readable string describing the exception
+    :param str region_name:
+        Aws region of the resource
     """
-    info_codes = ["IncorrectInstanceState"]
-    warning_codes = [
-        "UnsupportedOperation",
-        "IncorrectInstanceState",
-        "InvalidParameterCombination",
-    ]
-
-    if exception.response["Error"]["Code"] in info_codes:
-        logging.info(f"{resource_name} {resource_id}: {exception.response['Error']['Message']}")
-    elif exception.response["Error"]["Code"] in warning_codes:
-        logging.warning(f"{resource_name} {resource_id}: {exception.response['Error']['Message']}")
-    else:
-        logging.error(f"{resource_name} {resource_id}: {exception.response['Error']['Message']}")
+    record_error("ec2", resource_name, resource_id, exception, region_name)
@@ -1,32 +1,219 @@
 """ec2 instances scheduler."""
 import logging
+import time
+from collections.abc import Iterator
 from typing import Dict, List
 
-import boto3
 from botocore.exceptions import ClientError
 
-from ..libs.filter_resources_by_tags import FilterByTags
+from ..libs.aws_sessions import get_client
+from ..libs.deadline import DeadlineExceeded, wait_budget
+from ..libs.filter_resources_by_tags import FilterByTags, TaggedResource
+from ..libs.pipeline import run_pipeline
+from ..libs.schedule_window import RUNNING, STOPPED
+from ..libs.waiters import AwsWaiters
 from .exceptions import ec2_exception
 
+# Tag added by aws on the instances launched by an autoscaling group.
+ASG_NAME_TAG = "aws:autoscaling:groupName"
+
+# Scheduling classes of the instances, see classify_instances.
+ON_DEMAND = "on-demand"
+SPOT_STOP = "spot-stop"
+SPOT_HIBERNATE = "spot-hibernate"
+SPOT_TERMINATE = "spot-terminate"
+HIBERNATE = "hibernate"
+# State reason of the instances stopped by a hibernation.
+HIBERNATED_REASON = "Client.UserInitiatedHibernate"
+
+
+def apply_instances_action(
+    ec2, action: str, instance_ids: list[str], label="instances", params=None
+) -> list[str]:
+    """Stop, start or terminate a batch of ec2 instances in one api call.
+
+    A single instance in a wrong state fails the whole call, the batch
+    is then retried instance by instance to schedule the others.
+
+    :param ec2:
+        The boto3 ec2 client.
+    :param str action:
+        The instance action, stop, start or terminate.
+    :param list[str] instance_ids:
+        The instance ids of the batch.
+    :param str label:
+        The resource name printed with each scheduled instance.
+    :param dict params:
+        Extra parameters of the api call, for example Hibernate.
+
+    :return list[str]:
+        The ids of the instances successfully scheduled.
+    """
+    if not instance_ids:
+        return []
+    params = params or {}
+    call = getattr(ec2, f"{action}_instances")
+    try:
+        call(InstanceIds=instance_ids, **params)
+    except ClientError:
+        scheduled_ids = []
+        for instance_id in instance_ids:
+            try:
+                call(InstanceIds=[instance_id], **params)
+            except ClientError as exc:
+                ec2_exception("instance", instance_id, exc, ec2.meta.region_name)
+            else:
+                print(f"{action.capitalize()} {label} {instance_id}")
+                scheduled_ids.append(instance_id)
+        return scheduled_ids
+
+    for instance_id in instance_ids:
+        print(f"{action.capitalize()} {label} {instance_id}")
+    return instance_ids
+
+
+def classify_instances(ec2, instance_ids: list[str], hibernate_ids=()) -> dict:
+    """Split a batch of instances by scheduling class.
+
+    One describe_instances call gives the lifecycle and hibernation
+    capability of the batch and one describe_spot_instance_requests
+    call the behavior of its spot instances. Spot instances of a
+    persistent request interrupted by a stop or a hibernation can be
+    stopped, the other ones can only be terminated. Spot instances
+    without a spot request are scheduled as on-demand instances.
+
+    :param ec2:
+        The boto3 ec2 client.
+    :param list[str] instance_ids:
+        The instance ids of the batch.
+    :param hibernate_ids:
+        The on-demand instances to hibernate, those without the
+        hibernation enabled are classified on-demand.
+
+    :return dict:
+        The instance ids of each class, the spot request ids of the
+        instances to terminate and the instances stopped by a
+        hibernation. For example:
+        {
+            'on-demand': ['i-0123456789abcdef0'],
+            'hibernate': [],
+            'spot-stop': [],
+            'spot-hibernate': [],
+            'spot-terminate': ['i-0123456789abcdef1'],
+            'spot-requests': ['sir-0123456'],
+            'hibernated': [],
+        }
+    """
+    classes = {
+        ON_DEMAND: [],
+        HIBERNATE: [],
+        SPOT_STOP: [],
+        SPOT_HIBERNATE: [],
+        SPOT_TERMINATE: [],
+        "spot-requests": [],
+        "hibernated": [],
+    }
+    try:
+        reservations = ec2.describe_instances(InstanceIds=instance_ids)["Reservations"]
+    except ClientError as exc:
+        # Unknown lifecycle, the action falls back to on-demand calls
+        ec2_exception("instances", ",".join(instance_ids), exc, ec2.meta.region_name)
+        classes[ON_DEMAND] = list(instance_ids)
+        return classes
+
+    spot_requests = {}
+    for reservation in reservations:
+        for instance in reservation["Instances"]:
+            instance_id = instance["InstanceId"]
+            if instance.get("StateReason", {}).get("Code") == HIBERNATED_REASON:
+                classes["hibernated"].append(instance_id)
+            if instance.get("InstanceLifecycle") == "spot":
+                request_id = instance.get("SpotInstanceRequestId")
+                if request_id:
+                    spot_requests[request_id] = instance_id
+                else:
+                    # Spot instances launched by a fleet have no request to describe
+                    logging.warning(
+                        f"spot instance {instance_id} without spot request, "
+                        "scheduled as on-demand."
+                    )
+                    classes[ON_DEMAND].append(instance_id)
+            elif instance_id not in hibernate_ids:
+                classes[ON_DEMAND].append(instance_id)
+            elif instance.get("HibernationOptions", {}).get("Configured"):
+                classes[HIBERNATE].append(instance_id)
+            else:
+                logging.info(f"instance {instance_id} not enabled for hibernation, stopped.")
+                classes[ON_DEMAND].append(instance_id)
+    if not spot_requests:
+        return classes
+
+    try:
+        requests = ec2.describe_spot_instance_requests(
+            SpotInstanceRequestIds=list(spot_requests)
+        )
+    except ClientError as exc:
+        ec2_exception(
+            "spot instances", ",".join(spot_requests.values()), exc, ec2.meta.region_name
+        )
+        return classes
+
+    for request in requests["SpotInstanceRequests"]:
+        instance_id = spot_requests[request["SpotInstanceRequestId"]]
+        behavior = request.get("InstanceInterruptionBehavior", "terminate")
+        if request.get("Type") == "persistent" and behavior == "stop":
+            classes[SPOT_STOP].append(instance_id)
+        elif request.get("Type") == "persistent" and behavior == "hibernate":
+            classes[SPOT_HIBERNATE].append(instance_id)
+        else:
+            classes[SPOT_TERMINATE].append(instance_id)
+            classes["spot-requests"].append(request["SpotInstanceRequestId"])
+    return classes
+
 
 class InstanceScheduler:
     """Abstract ec2 scheduler in a class."""
 
-    def __init__(self, region_name=None) -> None:
-        """Initialize ec2 scheduler."""
-        if region_name:
-            self.ec2 = boto3.client("ec2", region_name=region_name)
-            self.asg = boto3.client("autoscaling", region_name=region_name)
-        else:
-            self.ec2 = boto3.client("ec2")
-            self.asg = boto3.client("autoscaling")
-        self.tag_api = FilterByTags(region_name=region_name)
+    def __init__(
+        self,
+        region_name=None,
+        session=None,
+        stop_mode="stop",
+        page_size=None,
+        cursors=None,
+        resource_ids=None,
+    ) -> None:
+        """Initialize ec2 scheduler.
+
+        :param str stop_mode:
+            The stop mode of the instances without the
+            scheduler:stop-mode tag, stop or hibernate.
+        :param int page_size:
+            The number of tagged resources listed per page.
+        :param dict cursors:
+            The page token to resume a resource type listing from, see
+            libs.filter_resources_by_tags.FilterByTags.
+        :param list[str] resource_ids:
+            Only schedule these resources, default all the tagged ones.
+        """
+        self.ec2 = get_client("ec2", region_name, session)
+        self.tag_api = FilterByTags(
+            region_name, session, page_size, cursors, resource_ids
+        )
+        # Discovery position of each listed resource type
+        self.cursors = self.tag_api.cursors
+        self.waiter = AwsWaiters(region_name=region_name, session=session)
+        self.stop_mode = stop_mode
+        # Stop mode and start time of each started instance
+        self.started = {}
+        self.running_times = {}
 
     def stop(self, aws_tags: list[dict], to_exclude=None) -> None:
         """Aws ec2 instance stop function.
 
         Stop ec2 instances with defined tags and disable its Cloudwatch
-        alarms.
+        alarms. Instances are stopped in batches while the next tagging
+        api pages are still fetched.
 
         :param list[map] aws_tags:
             Aws tags to use for filter resources.
@@ -40,29 +227,23 @@ class InstanceScheduler:
                 }
             ]
         """
-        if to_exclude is None:
-            to_exclude = []
-
-        for instance_arn in self.tag_api.get_resources("ec2:instance", aws_tags):
-            instance_id = instance_arn.split("/")[-1]
-
-            if instance_id in to_exclude:
-                logging.info(f"{instance_id} found in exclude list.")
-                continue
-
-            try:
-                if not self.asg.describe_auto_scaling_instances(
-                        InstanceIds=[instance_id]
-                )["AutoScalingInstances"]:
-                    self.ec2.stop_instances(InstanceIds=[instance_id])
-                    print(f"Stop instances {instance_id}")
-            except ClientError as exc:
-                ec2_exception("instance", instance_id, exc)
+        run_pipeline(
+            self.list_instances(aws_tags, to_exclude),
+            lambda instances: self.stop_batch(
+                [instance.resource_id for instance in instances],
+                [
+                    instance.resource_id
+                    for instance in instances
+                    if instance.get_setting("stop-mode", self.stop_mode) == HIBERNATE
+                ],
+            ),
+        )
 
     def start(self, aws_tags: list[dict], to_exclude=None) -> None:
         """Aws ec2 instance start function.
 
-        Start ec2 instances with defined tags.
+        Start ec2 instances with defined tags. Instances are started
+        in batches while the next tagging api pages are still fetched.
 
         Aws tags to use for filter resources
             Aws tags to use for filter resources.
@@ -76,21 +257,178 @@ class InstanceScheduler:
                 }
             ]
         """
-        if to_exclude is None:
-            to_exclude = []
+        run_pipeline(
+            self.list_instances(aws_tags, to_exclude),
+            lambda instances: self.start_batch([instance.resource_id for instance in instances]),
+        )
 
-        for instance_arn in self.tag_api.get_resources("ec2:instance", aws_tags):
-            instance_id = instance_arn.split("/")[-1]
+    def stop_batch(self, instance_ids: list[str], hibernate_ids=()) -> None:
+        """Stop a batch of instances according to their class.
 
-            if instance_id in to_exclude:
-                logging.info(f"{instance_id} found in exclude list.")
-                continue
+        On-demand instances and stoppable spot instances are stopped.
+        The instances in hibernate mode with the hibernation enabled and
+        the spot instances of requests interrupted by a hibernation are
+        hibernated. The other spot instances are terminated after their
+        request is cancelled, so they are not replaced.
 
+        :param list[str] instance_ids:
+            The instance ids of the batch.
+        :param hibernate_ids:
+            The instance ids of the batch in hibernate mode.
+        """
+        classes = classify_instances(self.ec2, instance_ids, set(hibernate_ids))
+        apply_instances_action(self.ec2, "stop", classes[ON_DEMAND] + classes[SPOT_STOP])
+        apply_instances_action(
+            self.ec2, "stop", classes[HIBERNATE], "hibernated instances", {"Hibernate": True}
+        )
+        apply_instances_action(
+            self.ec2, "stop", classes[SPOT_HIBERNATE], "spot instances", {"Hibernate": True}
+        )
+        if classes["spot-requests"]:
             try:
-                if not self.asg.describe_auto_scaling_instances(
-                        InstanceIds=[instance_id]
-                )["AutoScalingInstances"]:
-                    self.ec2.start_instances(InstanceIds=[instance_id])
-                    print(f"Start instances {instance_id}")
+                self.ec2.cancel_spot_instance_requests(
+                    SpotInstanceRequestIds=classes["spot-requests"]
+                )
             except ClientError as exc:
-                ec2_exception("instance", instance_id, exc)
+                ec2_exception(
+                    "spot requests", ",".join(classes["spot-requests"]), exc, self.ec2.meta.region_name
+                )
+        apply_instances_action(self.ec2, "terminate", classes[SPOT_TERMINATE], "spot instances")
+
+    def start_batch(self, instance_ids: list[str]) -> None:
+        """Start a batch of instances according to their class.
+
+        Terminated spot instances cannot be started and are skipped.
+
+        :param list[str] instance_ids:
+            The instance ids of the batch.
+        """
+        classes = classify_instances(self.ec2, instance_ids)
+        for instance_id in classes[SPOT_TERMINATE]:
+            logging.info(f"spot instance {instance_id} cannot be started.")
+        started_at = time.time()
+        hibernated = set(classes["hibernated"])
+        for instance_id in apply_instances_action(
+            self.ec2,
+            "start",
+            classes[ON_DEMAND] + classes[SPOT_STOP] + classes[SPOT_HIBERNATE],
+        ):
+            mode = HIBERNATE if instance_id in hibernated else "stop"
+            self.started[instance_id] = (mode, started_at)
+
+    def reconcile(self, aws_tags, desired_state, to_exclude=None) -> None:
+        """Aws ec2 instance reconcile function.
+
+        Stop or start the tagged instances whose state differs from
+        the state wanted now, see libs.schedule_window.
+
+        :param list[map] aws_tags:
+            Aws tags to use for filter resources.
+        :param callable desired_state:
+            Function returning the state wanted for the tags of an
+            instance, running, stopped or None to leave it.
+        """
+        run_pipeline(
+            self.list_instances(aws_tags, to_exclude),
+            lambda instances: self.reconcile_batch(instances, desired_state),
+        )
+
+    def reconcile_batch(self, instances: list[TaggedResource], desired_state) -> None:
+        """Reconcile a batch of instances with one describe call.
+
+        :param list[TaggedResource] instances:
+            The instances of the batch.
+        :param callable desired_state:
+            Function returning the state wanted for the tags of an
+            instance.
+        """
+        desired = {instance.resource_id: desired_state(instance.tags) for instance in instances}
+        instance_ids = [instance_id for instance_id, state in desired.items() if state]
+        if not instance_ids:
+            return
+        try:
+            reservations = self.ec2.describe_instances(InstanceIds=instance_ids)["Reservations"]
+        except ClientError as exc:
+            ec2_exception("instances", ",".join(instance_ids), exc, self.ec2.meta.region_name)
+            return
+        actual = {
+            instance["InstanceId"]: instance["State"]["Name"]
+            for reservation in reservations
+            for instance in reservation["Instances"]
+        }
+        to_stop = [
+            instance_id
+            for instance_id in instance_ids
+            if desired[instance_id] == STOPPED and actual.get(instance_id) == RUNNING
+        ]
+        to_start = [
+            instance_id
+            for instance_id in instance_ids
+            if desired[instance_id] == RUNNING and actual.get(instance_id) == STOPPED
+        ]
+        if to_stop:
+            self.stop_batch(
+                to_stop,
+                [
+                    instance.resource_id
+                    for instance in instances
+                    if instance.resource_id in to_stop
+                    and instance.get_setting("stop-mode", self.stop_mode) == HIBERNATE
+                ],
+            )
+        if to_start:
+            self.start_batch(to_start)
+
+    def list_instances(self, aws_tags: list[dict], to_exclude=None) -> Iterator[TaggedResource]:
+        """Aws ec2 instance list function.
+
+        :param list[map] aws_tags:
+            Aws tags to use for filter resources.
+        :param to_exclude:
+            The excluded instance ids.
+
+        :yield Iterator[TaggedResource]:
+            The tagged instances to schedule, without the autoscaling
+            group instances.
+        """
+        to_exclude = set(to_exclude or [])
+
+        for instance in self.tag_api.get_resources("ec2:instance", aws_tags):
+            instance_id = instance.resource_id
+
+            if instance.is_excluded(to_exclude):
+                logging.info(f"{instance_id} found in exclude list.")
+                continue
+
+            # Autoscaling group instances are scheduled with their group
+            if ASG_NAME_TAG in instance.tags:
+                continue
+
+            yield instance
+
+    def wait_until_ready(self) -> None:
+        """Wait the instances started by this scheduler are running.
+
+        The time to running of each instance is recorded by the stop
+        mode it is resumed from, in running_times, to compare the
+        start duration of hibernated and stopped instances. The wait is
+        bounded by the remaining invocation time, see libs.deadline.
+
+        :raises DeadlineExceeded:
+            The invocation deadline is reached before the instances
+            are running.
+        """
+        started_at = {instance_id: started for instance_id, (_, started) in self.started.items()}
+        budget = wait_budget(300)
+        times = self.waiter.instance_running_times(started_at, timeout=budget)
+        if budget < 300 and len(times) < len(started_at):
+            raise DeadlineExceeded(
+                f"instances {sorted(started_at.keys() - times.keys())} not running "
+                "before the invocation deadline"
+            )
+        for instance_id, elapsed in times.items():
+            mode = self.started[instance_id][0]
+            self.running_times.setdefault(mode, {})[instance_id] = elapsed
+        for mode, mode_times in self.running_times.items():
+            average = round(sum(mode_times.values()) / len(mode_times), 1)
+            print(f"{len(mode_times)} instances started from {mode} running after {average}s on average")
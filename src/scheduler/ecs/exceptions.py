@@ -2,16 +2,19 @@
 
 """Exception function for all aws scheduler."""
 
-import logging
-
 from botocore.exceptions import ClientError
 
+from ..libs.error_classifier import record_error
+
 
-def ecs_exception(resource_name: str, resource_id: str, exception: ClientError) -> None:
+def ecs_exception(
+    resource_name: str, resource_id: str, exception: ClientError, region_name=None
+) -> None:
     """Exception raised during execution of ecs scheduler.
 
-    Log instance, spot instance and autoscaling groups exceptions
-    on the specific aws resources.
+    Count the ecs service exceptions on the specific aws resources, they
+    are logged in a summary at the end of the invocation, see
+    libs.error_classifier.
 
     :param str resource_name:
         Aws resource name
@@ -19,17 +22,7 @@ def ecs_exception(resource_name: str, resource_id: str, exception: ClientError)
         Aws resource id
     :param str exception:
         Human-readable string describing the exception
+    :param str region_name:
+        Aws region of the resource
     """
-    info_codes = ["ClusterNotFoundException"]
-    warning_codes = [
-        "ServiceNotActiveException",
-        "ServiceNotFoundException",
-        "InvalidParameterException",
-    ]
-
-    if exception.response["Error"]["Code"] in info_codes:
-        logging.info(f"{resource_name} {resource_id}: {exception.response['Error']['Message']}")
-    elif exception.response["Error"]["Code"] in warning_codes:
-        logging.warning(f"{resource_name} {resource_id}: {exception.response['Error']['Message']}")
-    else:
-        logging.error(f"{resource_name} {resource_id}: {exception.response['Error']['Message']}")
+    record_error("ecs", resource_name, resource_id, exception, region_name)
@@ -1,26 +1,42 @@
 """ecs service scheduler."""
 
+import logging
 from typing import Dict, List
 
-import boto3
-from botocore.exceptions import ClientError
+from botocore.exceptions import ClientError, WaiterError
 
+from ..libs.aws_sessions import get_client
+from ..libs.deadline import DeadlineExceeded, wait_budget
 from ..libs.filter_resources_by_tags import FilterByTags
+from ..libs.schedule_window import RUNNING, STOPPED
 from .exceptions import ecs_exception
 
 
 class EcsScheduler:
     """Abstract ECS Service scheduler in a class."""
 
-    def __init__(self, region_name=None) -> None:
-        """Initialize ECS service scheduler."""
-        if region_name:
-            self.ecs = boto3.client("ecs", region_name=region_name)
-        else:
-            self.ecs = boto3.client("ecs")
-        self.tag_api = FilterByTags(region_name=region_name)
+    def __init__(
+        self, region_name=None, session=None, page_size=None, cursors=None, resource_ids=None
+    ) -> None:
+        """Initialize ECS service scheduler.
+
+        :param int page_size:
+            The number of tagged resources listed per page.
+        :param dict cursors:
+            The page token to resume a resource type listing from, see
+            libs.filter_resources_by_tags.FilterByTags.
+        :param list[str] resource_ids:
+            Only schedule these resources, default all the tagged ones.
+        """
+        self.ecs = get_client("ecs", region_name, session)
+        self.tag_api = FilterByTags(
+            region_name, session, page_size, cursors, resource_ids
+        )
+        # Discovery position of each listed resource type
+        self.cursors = self.tag_api.cursors
+        self.started_services = {}
 
-    def stop(self, aws_tags: list[dict]) -> None:
+    def stop(self, aws_tags: list[dict], to_exclude=None) -> None:
         """Aws ecs instance stop function.
 
         Stop ecs service with defined tags and disable its Cloudwatch
@@ -38,20 +54,17 @@ class EcsScheduler:
                 }
             ]
         """
-        for service_arn in self.tag_api.get_resources("ecs:service", aws_tags):
-            service_name = service_arn.split("/")[-1]
-            cluster_name = service_arn.split("/")[-2]
-            try:
-                self.ecs.update_service(
-                    cluster=cluster_name, service=service_name, desiredCount=0
-                )
-                print(
-                    f"Stop ECS Service {service_name} on Cluster {cluster_name}"
-                )
-            except ClientError as exc:
-                ecs_exception("ECS Service", service_name, exc)
-
-    def start(self, aws_tags: list[dict]) -> None:
+        to_exclude = set(to_exclude or [])
+        for service in self.tag_api.get_resources("ecs:service", aws_tags):
+            service_name = service.resource_id
+            # Services with the old arn format belong to the default cluster
+            cluster_name = service.parent_id or "default"
+            if service.is_excluded(to_exclude):
+                logging.info(f"{service_name} found in exclude list.")
+                continue
+            self._update_service(cluster_name, service, "stop")
+
+    def start(self, aws_tags: list[dict], to_exclude=None) -> None:
         """Aws ec2 instance start function.
 
         Start ec2 instances with defined tags.
@@ -68,15 +81,110 @@ class EcsScheduler:
                 }
             ]
         """
-        for service_arn in self.tag_api.get_resources("ecs:service", aws_tags):
-            service_name = service_arn.split("/")[-1]
-            cluster_name = service_arn.split("/")[-2]
-            try:
-                self.ecs.update_service(
-                    cluster=cluster_name, service=service_name, desiredCount=1
-                )
-                print(
-                    f"Start ECS Service {service_name} on Cluster {cluster_name}"
-                )
-            except ClientError as exc:
-                ecs_exception("ECS Service", service_name, exc)
+        to_exclude = set(to_exclude or [])
+        for service in self.tag_api.get_resources("ecs:service", aws_tags):
+            service_name = service.resource_id
+            # Services with the old arn format belong to the default cluster
+            cluster_name = service.parent_id or "default"
+            if service.is_excluded(to_exclude):
+                logging.info(f"{service_name} found in exclude list.")
+                continue
+            self._update_service(cluster_name, service, "start")
+
+    def reconcile(self, aws_tags, desired_state, to_exclude=None) -> None:
+        """Aws ecs service reconcile function.
+
+        Scale to 0 or back to their desired count the tagged services
+        whose task count differs from the state wanted now, see
+        libs.schedule_window. Services are described by chunks of 10
+        per cluster.
+
+        :param list[map] aws_tags:
+            Aws tags to use for filter resources.
+        :param callable desired_state:
+            Function returning the state wanted for the tags of a
+            service, running, stopped or None to leave it.
+        """
+        to_exclude = set(to_exclude or [])
+        services = {}
+        for service in self.tag_api.get_resources("ecs:service", aws_tags):
+            if service.is_excluded(to_exclude):
+                logging.info(f"{service.resource_id} found in exclude list.")
+                continue
+            state = desired_state(service.tags)
+            if state:
+                # Services with the old arn format belong to the default cluster
+                services.setdefault(service.parent_id or "default", []).append((service, state))
+
+        for cluster_name, cluster_services in services.items():
+            for i in range(0, len(cluster_services), 10):
+                chunk = cluster_services[i:i + 10]
+                try:
+                    described = self.ecs.describe_services(
+                        cluster=cluster_name,
+                        services=[service.resource_id for service, _ in chunk],
+                    )["services"]
+                except ClientError as exc:
+                    ecs_exception("ECS Cluster", cluster_name, exc, self.ecs.meta.region_name)
+                    continue
+                desired_counts = {
+                    service["serviceName"]: service["desiredCount"] for service in described
+                }
+                for service, state in chunk:
+                    service_name = service.resource_id
+                    if service_name not in desired_counts:
+                        continue
+                    if state == STOPPED and desired_counts[service_name] > 0:
+                        self._update_service(cluster_name, service, "stop")
+                    elif state == RUNNING and desired_counts[service_name] == 0:
+                        self._update_service(cluster_name, service, "start")
+
+    def _update_service(self, cluster_name: str, service, action: str) -> None:
+        """Scale a service to 0 or to its scheduler:desired-count tag."""
+        service_name = service.resource_id
+        try:
+            # The scheduler:desired-count tag overrides the started task count
+            desired_count = int(service.get_setting("desired-count", 1)) if action == "start" else 0
+            self.ecs.update_service(
+                cluster=cluster_name, service=service_name, desiredCount=desired_count
+            )
+            print(f"{action.capitalize()} ECS Service {service_name} on Cluster {cluster_name}")
+        except ClientError as exc:
+            ecs_exception("ECS Service", service_name, exc, self.ecs.meta.region_name)
+        else:
+            if action == "start":
+                self.started_services.setdefault(cluster_name, []).append(service_name)
+
+    def wait_until_ready(self) -> None:
+        """Wait the ecs services started by this scheduler are stable.
+
+        The wait is bounded by the remaining invocation time, see
+        libs.deadline.
+
+        :raises DeadlineExceeded:
+            The invocation deadline is reached during the wait.
+        """
+        waiter = self.ecs.get_waiter("services_stable")
+        for cluster_name, service_names in self.started_services.items():
+            # The waiter accepts up to 10 services per call
+            for i in range(0, len(service_names), 10):
+                chunk = service_names[i:i + 10]
+                max_attempts = int(wait_budget(15 * 40) // 15)
+                if not max_attempts:
+                    raise DeadlineExceeded(
+                        f"ECS Services {chunk} on Cluster {cluster_name} not waited "
+                        "before the invocation deadline"
+                    )
+                try:
+                    waiter.wait(
+                        cluster=cluster_name,
+                        services=chunk,
+                        WaiterConfig={"Delay": 15, "MaxAttempts": max_attempts},
+                    )
+                except WaiterError as exc:
+                    if max_attempts < 40:
+                        raise DeadlineExceeded(
+                            f"ECS Services {chunk} on Cluster {cluster_name} not stable "
+                            "before the invocation deadline"
+                        ) from exc
+                    logging.error(f"ECS Services on Cluster {cluster_name} not stable: {exc}")
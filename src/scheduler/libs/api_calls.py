@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+"""Count of the aws api calls sent by the schedulers."""
+
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from .aws_sessions import register_handlers
+
+# Operations reading the resources, every other operation changes them.
+READ_PREFIXES = ("Describe", "Get", "List")
+
+
+def is_mutating(operation_name: str) -> bool:
+    """Return True when an api operation changes the resources.
+
+    :param str operation_name:
+        The api operation name, for example StopInstances.
+    """
+    return not operation_name.startswith(READ_PREFIXES)
+
+
+class ApiCallCounter:
+    """Abstract count of aws api calls by operation in a class."""
+
+    def __init__(self) -> None:
+        """Initialize empty api call counter."""
+        self.calls = Counter()
+        # Calls by client service and operation, like ("ec2", "StopInstances")
+        self.service_calls = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, model, **kwargs) -> None:
+        """Count an api call, botocore before-call event handler."""
+        with self._lock:
+            self.calls[model.name] += 1
+            self.service_calls[(model.service_model.service_name, model.name)] += 1
+
+    @property
+    def mutating_calls(self) -> int:
+        """Return the number of calls changing the resources."""
+        with self._lock:
+            return sum(count for name, count in self.calls.items() if is_mutating(name))
+
+
+@contextmanager
+def count_api_calls(session=None):
+    """Count the api calls of the session clients used in the block.
+
+    The clients created in the block and the clients cached by
+    libs.aws_sessions.get_client are counted, other clients created
+    before the block are not.
+
+    :param boto3.session.Session session:
+        The session of the counted clients, default the boto3 default
+        session used by libs.aws_sessions.get_client.
+
+    :return ApiCallCounter:
+        The counter of the calls.
+    """
+    counter = ApiCallCounter()
+    with register_handlers(session, [("before-call", counter.count)]):
+        yield counter
@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+
+"""Asyncio execution engine of the scheduler actions.
+
+Optional backend selected with SCHEDULER_ENGINE=async. A single event
+loop pages the tagging api and sends the stop and start calls of a
+service concurrently, each aws service of a region being limited by
+its own semaphore. The aiobotocore package must be shipped with the
+lambda to use it.
+
+Only the services whose resources need no classification before
+their action, ecs services and cloudwatch alarms, run on this engine.
+The ec2 instances, with their spot and hibernation classes, and the
+rds databases, with their cluster members and read replicas, keep the
+threaded schedulers. The calls of the engine are counted and recorded
+like the threaded ones, see libs.aws_sessions.session_handlers.
+
+The invocation deadline is checked before each page of resources is
+listed and before its calls are sent. Once reached, the calls in
+flight are awaited and the listing position is kept in cursors, like
+libs.filter_resources_by_tags.FilterByTags, to resume the service in
+a new invocation.
+"""
+
+import asyncio
+import contextlib
+import logging
+import os
+from collections import defaultdict
+
+from botocore.exceptions import ClientError
+
+from ..cloudwatch.exceptions import cloudwatch_exception
+from ..ecs.exceptions import ecs_exception
+from ..ecs.handler import EcsScheduler
+from .aws_sessions import session_handlers
+from .deadline import check_deadline
+from .filter_resources_by_tags import TaggedResource, compact_tags
+from .pagination import PageCursor
+from .tag_expression import compile_tags
+from .tracing import span
+
+try:
+    from aiobotocore.config import AioConfig
+    from aiobotocore.session import get_session
+except ImportError:
+    get_session = None
+
+# Maximum number of api calls in flight per aws service of a region.
+SERVICE_CONCURRENCY = 20
+
+# Maximum number of alarms of an enable or disable alarm actions call.
+ALARM_BATCH_SIZE = 100
+
+
+def _ecs_service_calls(resources, action):
+    calls = []
+    for resource in resources:
+        # Services with the old arn format belong to the default cluster
+        cluster_name = resource.parent_id or "default"
+        desired_count = 0
+        if action == "start":
+            desired_count = int(resource.get_setting("desired-count", 1))
+        params = {
+            "cluster": cluster_name,
+            "service": resource.resource_id,
+            "desiredCount": desired_count,
+        }
+        calls.append(("update_service", params, [resource]))
+    return calls
+
+
+def _cloudwatch_alarm_calls(resources, action):
+    operation = "enable" if action == "start" else "disable"
+    return [
+        (
+            f"{operation}_alarm_actions",
+            {"AlarmNames": [resource.resource_id for resource in chunk]},
+            chunk,
+        )
+        for chunk in (
+            resources[i:i + ALARM_BATCH_SIZE]
+            for i in range(0, len(resources), ALARM_BATCH_SIZE)
+        )
+    ]
+
+
+def _ecs_message(resource, action):
+    cluster_name = resource.parent_id or "default"
+    return (
+        f"{action.capitalize()} ECS Service {resource.resource_id} "
+        f"on Cluster {cluster_name}"
+    )
+
+
+def _cloudwatch_alarm_message(resource, action):
+    verb = "Enable" if action == "start" else "Disable"
+    return f"{verb} Cloudwatch alarm {resource.resource_id}"
+
+
+# Resource types of each scheduler service, with their exception
+# handler, resource name, the api calls of an action on a page of
+# resources and the message printed for each scheduled resource.
+SERVICE_RESOURCES = {
+    "ecs": [
+        ("ecs:service", ecs_exception, "ECS Service", _ecs_service_calls, _ecs_message)
+    ],
+    "cloudwatch_alarm": [
+        (
+            "cloudwatch:alarm",
+            cloudwatch_exception,
+            "cloudwatch alarm",
+            _cloudwatch_alarm_calls,
+            _cloudwatch_alarm_message,
+        )
+    ],
+}
+
+
+class AsyncScheduler:
+    """Abstract asyncio scheduler of an aws service in a class."""
+
+    def __init__(
+        self,
+        service_name,
+        region_name=None,
+        session=None,
+        concurrency=SERVICE_CONCURRENCY,
+        page_size=None,
+        cursors=None,
+        resource_ids=None,
+    ) -> None:
+        """Initialize asyncio scheduler.
+
+        :param str service_name:
+            The scheduled service, one of SERVICE_RESOURCES.
+        :param int concurrency:
+            Maximum number of api calls in flight per aws service.
+        :param int page_size:
+            The number of tagged resources listed per page.
+        :param dict cursors:
+            The page token to resume the listing of a resource type
+            from, by resource type.
+        :param list[str] resource_ids:
+            Only schedule these resources, default all the tagged ones.
+
+        :raises ImportError:
+            The aiobotocore package is not installed.
+        """
+        if get_session is None:
+            raise ImportError(
+                "The async scheduler engine requires the aiobotocore package"
+            )
+        self.service_name = service_name
+        self.region_name = region_name
+        self.session = session
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.resume_tokens = dict(cursors or {})
+        self.resource_ids = set(resource_ids) if resource_ids else None
+        self.cursors = {}
+        self.started = defaultdict(list)
+
+    def stop(self, aws_tags: list[dict], to_exclude=None) -> None:
+        """Stop the resources of the service with defined tags.
+
+        :param list[map] aws_tags:
+            Aws tags to use for filter resources, see
+            libs.filter_resources_by_tags.FilterByTags.get_resources.
+
+        :raises DeadlineExceeded:
+            The invocation deadline is reached, the resources listed
+            before are scheduled.
+        """
+        asyncio.run(self._run("stop", aws_tags, to_exclude))
+
+    def start(self, aws_tags: list[dict], to_exclude=None) -> None:
+        """Start the resources of the service with defined tags.
+
+        :param list[map] aws_tags:
+            Aws tags to use for filter resources, see
+            libs.filter_resources_by_tags.FilterByTags.get_resources.
+
+        :raises DeadlineExceeded:
+            The invocation deadline is reached, the resources listed
+            before are scheduled.
+        """
+        asyncio.run(self._run("start", aws_tags, to_exclude))
+
+    def wait_until_ready(self) -> None:
+        """Wait the ecs services started by this scheduler are stable."""
+        if self.started.get("ecs:service"):
+            ecs_scheduler = EcsScheduler(
+                region_name=self.region_name, session=self.session
+            )
+            for resource in self.started["ecs:service"]:
+                ecs_scheduler.started_services.setdefault(
+                    resource.parent_id or "default", []
+                ).append(resource.resource_id)
+            ecs_scheduler.wait_until_ready()
+
+    async def _run(self, action, aws_tags, to_exclude) -> None:
+        """Discover and schedule all the resource types of the service."""
+        expression = compile_tags(aws_tags)
+        to_exclude = set(to_exclude or [])
+        resources = SERVICE_RESOURCES[self.service_name]
+        client_names = {"resourcegroupstaggingapi"}
+        client_names.update(spec[0].split(":")[0] for spec in resources)
+
+        async with contextlib.AsyncExitStack() as stack:
+            clients = {
+                name: await stack.enter_async_context(self._create_client(name))
+                for name in client_names
+            }
+            for client in clients.values():
+                # The api call counter and the run report see the calls
+                for event_name, handler, unique_id in session_handlers(self.session):
+                    client.meta.events.register(
+                        event_name, handler, unique_id=unique_id
+                    )
+            semaphores = {
+                name: asyncio.Semaphore(self.concurrency) for name in client_names
+            }
+            results = await asyncio.gather(
+                *[
+                    self._schedule_type(
+                        clients, semaphores, action, expression, to_exclude, *spec
+                    )
+                    for spec in resources
+                ],
+                return_exceptions=True,
+            )
+        # Raised once all the resource types finished their calls in flight
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    def _create_client(self, service_name):
+        """Create an aiobotocore client with the scheduler credentials."""
+        credentials = {}
+        if self.session is not None:
+            frozen = self.session.get_credentials().get_frozen_credentials()
+            credentials = {
+                "aws_access_key_id": frozen.access_key,
+                "aws_secret_access_key": frozen.secret_key,
+                "aws_session_token": frozen.token,
+            }
+        return get_session().create_client(
+            service_name,
+            region_name=self.region_name,
+            endpoint_url=os.getenv("AWS_ENDPOINT_URL") or None,
+            config=AioConfig(max_pool_connections=self.concurrency),
+            **credentials,
+        )
+
+    async def _schedule_type(
+        self,
+        clients,
+        semaphores,
+        action,
+        expression,
+        to_exclude,
+        resource_type,
+        handler,
+        name,
+        build_calls,
+        message,
+    ) -> None:
+        """Page the resources of a type and schedule each page as it comes.
+
+        The cursor token only moves to the next page once the calls of
+        the current page are sent.
+        """
+        service = resource_type.split(":")[0]
+        tagging = clients["resourcegroupstaggingapi"]
+        cursor = PageCursor(self.resume_tokens.pop(resource_type, None), self.page_size)
+        self.cursors[resource_type] = cursor
+        tasks = []
+        with span("batch", resource_type=resource_type) as current:
+            try:
+                while True:
+                    check_deadline()
+                    request = {
+                        "TagFilters": expression.tag_filters,
+                        "ResourceTypeFilters": [resource_type],
+                    }
+                    if cursor.token:
+                        request["PaginationToken"] = cursor.token
+                    if cursor.page_size:
+                        request["ResourcesPerPage"] = cursor.page_size
+                    page = await tagging.get_resources(**request)
+                    cursor.pages += 1
+                    page_resources = []
+                    for resource_tag_map in page.get("ResourceTagMappingList", []):
+                        cursor.items += 1
+                        tags = compact_tags(resource_tag_map["Tags"])
+                        if not expression.matches(tags):
+                            continue
+                        resource = TaggedResource(resource_tag_map["ResourceARN"], tags)
+                        if not resource.is_selected(self.resource_ids):
+                            continue
+                        if resource.is_excluded(to_exclude):
+                            logging.info(
+                                f"{resource.resource_id} found in exclude list."
+                            )
+                            continue
+                        page_resources.append(resource)
+                    # Checked before the calls, the page is listed again on resume
+                    check_deadline()
+                    tasks += [
+                        asyncio.ensure_future(
+                            self._call(
+                                clients[service],
+                                semaphores[service],
+                                action,
+                                call,
+                                (handler, name, build_calls, message),
+                            )
+                        )
+                        for call in build_calls(page_resources, action)
+                    ]
+                    cursor.token = page.get("PaginationToken") or None
+                    if cursor.token is None:
+                        break
+            finally:
+                scheduled = [
+                    resource
+                    for succeeded in await asyncio.gather(*tasks)
+                    for resource in succeeded
+                ]
+                if current is not None:
+                    current.attributes["size"] = len(scheduled)
+                if action == "start":
+                    self.started[resource_type] += scheduled
+
+    async def _call(self, client, semaphore, action, call, spec) -> list:
+        """Send a stop or start call, return the resources scheduled.
+
+        A call of several resources failing is sent again resource by
+        resource to schedule the others.
+        """
+        operation, params, resources = call
+        handler, name, build_calls, message = spec
+        error = None
+        async with semaphore:
+            try:
+                await getattr(client, operation)(**params)
+            except ClientError as exc:
+                error = exc
+        if error is None:
+            for resource in resources:
+                print(message(resource, action))
+            return resources
+        if len(resources) > 1:
+            retried = await asyncio.gather(
+                *[
+                    self._call(client, semaphore, action, single_call, spec)
+                    for resource in resources
+                    for single_call in build_calls([resource], action)
+                ]
+            )
+            return [resource for succeeded in retried for resource in succeeded]
+        handler(name, resources[0].resource_id, error, self.region_name)
+        return []
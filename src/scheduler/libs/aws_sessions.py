@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+"""Aws sessions and clients shared by the schedulers."""
+
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import boto3
+
+from .warm_cache import WarmCache
+
+# boto3 sessions are not thread safe, client creation must be serialized.
+_CLIENT_LOCK = threading.Lock()
+
+# Clients reused by the invocations of a warm lambda, by service,
+# region, session and endpoint, sized for a run by size_clients.
+CLIENTS_MIN_SIZE = 256
+CLIENTS = WarmCache("clients", ttl=3600, max_size=CLIENTS_MIN_SIZE)
+
+# Clients of a scheduler service in a region, like ec2 and the tagging
+# api, and clients outside of the regions, like sts, lambda or s3.
+CLIENTS_PER_SERVICE = 2
+GLOBAL_CLIENTS = 8
+
+# Event handlers registered by register_handlers, with their session.
+_HANDLERS = []
+
+
+def default_session() -> boto3.session.Session:
+    """Return the boto3 default session, created when missing."""
+    with _CLIENT_LOCK:
+        if boto3.DEFAULT_SESSION is None:
+            boto3.setup_default_session()
+        return boto3.DEFAULT_SESSION
+
+
+def get_client(service_name: str, region_name=None, session=None):
+    """Return a boto3 client, cached between invocations.
+
+    :param str service_name:
+        The name of the aws service, for example ec2 or rds.
+    :param str region_name:
+        The aws region of the client, default use the session region.
+    :param boto3.session.Session session:
+        The session used to build the client, default use the
+        lambda credentials.
+
+    The AWS_ENDPOINT_URL environment variable sends the calls to
+    another endpoint, for example a local moto server.
+
+    :return:
+        The low-level boto3 client.
+    """
+    endpoint_url = os.getenv("AWS_ENDPOINT_URL") or None
+    session = session or default_session()
+
+    def _create():
+        with _CLIENT_LOCK:
+            return session.client(service_name, region_name=region_name, endpoint_url=endpoint_url)
+
+    return CLIENTS.get((service_name, region_name, session, endpoint_url), _create)
+
+
+def size_clients(accounts: int, regions: int, services: int) -> None:
+    """Size the client cache for the clients of a run.
+
+    A run builds clients for each account, region and service, the
+    cache keeps them all to not evict clients within an invocation.
+
+    :param int accounts:
+        The number of scheduled accounts.
+    :param int regions:
+        The number of scheduled regions.
+    :param int services:
+        The number of scheduled services.
+    """
+    run_clients = accounts * regions * services * CLIENTS_PER_SERVICE + GLOBAL_CLIENTS
+    CLIENTS.resize(max(CLIENTS_MIN_SIZE, run_clients))
+
+
+@contextmanager
+def register_handlers(session, handlers):
+    """Register botocore event handlers on the clients of a session.
+
+    Clients copy the handlers of their session when they are created,
+    the handlers are registered on the session for the new clients and
+    on the cached clients of the session, then removed from both.
+
+    :param boto3.session.Session session:
+        The session of the clients, default the boto3 default session.
+    :param handlers:
+        The event name and handler pairs, for example
+        [("before-call", counter.count)].
+    """
+    session = session or default_session()
+    registered = [
+        (event_name, handler, f"scheduler-{event_name}-{id(handler)}")
+        for event_name, handler in handlers
+    ]
+    emitters = [session.events] + [
+        client.meta.events
+        for (_, _, client_session, _), client in CLIENTS.items()
+        if client_session is session
+    ]
+    for emitter in emitters:
+        for event_name, handler, unique_id in registered:
+            emitter.register(event_name, handler, unique_id=unique_id)
+    with _CLIENT_LOCK:
+        _HANDLERS.extend((session, *item) for item in registered)
+    try:
+        yield
+    finally:
+        with _CLIENT_LOCK:
+            _HANDLERS[:] = [item for item in _HANDLERS if item[1:] not in registered]
+        emitters += [
+            client.meta.events
+            for (_, _, client_session, _), client in CLIENTS.items()
+            if client_session is session
+        ]
+        for emitter in emitters:
+            for event_name, handler, unique_id in registered:
+                emitter.unregister(event_name, handler, unique_id=unique_id)
+
+
+def session_handlers(session=None) -> list:
+    """Return the event handlers registered on a session.
+
+    Clients built outside of the session, like the aiobotocore clients
+    of libs.async_engine, register them to be counted and recorded.
+
+    :param boto3.session.Session session:
+        The session of the handlers, default the boto3 default session.
+
+    :return list:
+        The event name, handler and unique id of each handler.
+    """
+    session = session or default_session()
+    with _CLIENT_LOCK:
+        return [item[1:] for item in _HANDLERS if item[0] is session]
+
+
+def account_id_from_role_arn(role_arn: str) -> str:
+    """Return the aws account id of an iam role arn.
+
+    :param str role_arn:
+        The iam role arn, for example
+        arn:aws:iam::123456789012:role/scheduler
+    """
+    return role_arn.split(":")[4]
+
+
+class AssumeRoleSessions:
+    """Abstract cached assumed role sessions in a class."""
+
+    def __init__(self, session_name="lambda-scheduler", expiry_margin=300) -> None:
+        """Initialize the assumed role session cache.
+
+        :param str session_name:
+            The role session name sent to aws sts.
+        :param int expiry_margin:
+            Number of seconds before the credentials expiration
+            a new role is assumed.
+        """
+        self.session_name = session_name
+        self.expiry_margin = timedelta(seconds=expiry_margin)
+        self._sessions = {}
+        # One lock per role, the accounts assume their roles in parallel
+        self._role_locks = {}
+        self._lock = threading.Lock()
+
+    def get_session(self, role_arn: str) -> boto3.session.Session:
+        """Return a session with the credentials of the role.
+
+        Credentials are cached until their expiration, a warm lambda
+        only calls sts for the roles with expired credentials.
+
+        :param str role_arn:
+            The arn of the iam role to assume.
+        """
+        with self._lock:
+            role_lock = self._role_locks.setdefault(role_arn, threading.Lock())
+        with role_lock:
+            cached = self._sessions.get(role_arn)
+            if cached and cached[1] - self.expiry_margin > datetime.now(timezone.utc):
+                return cached[0]
+
+            sts = get_client("sts")
+            credentials = sts.assume_role(
+                RoleArn=role_arn, RoleSessionName=self.session_name
+            )["Credentials"]
+            session = boto3.session.Session(
+                aws_access_key_id=credentials["AccessKeyId"],
+                aws_secret_access_key=credentials["SecretAccessKey"],
+                aws_session_token=credentials["SessionToken"],
+            )
+            self._sessions[role_arn] = (session, credentials["Expiration"])
+            return session
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+"""Time budget of the lambda invocation.
+
+The deadline of the running invocation is checked before each
+scheduler and each batch of resources, and bounds the readiness
+waits, see wait_budget. A readiness wait cut by the deadline raises
+DeadlineExceeded, its wave and the next ones are then checkpointed.
+When the remaining time drops under the safety margin, the work
+stops cleanly and the unfinished regions and services are handed to
+a new invocation, see main.request_checkpoint.
+"""
+
+import math
+
+# Seconds kept before the lambda timeout to finish the in-flight calls.
+DEFAULT_SAFETY_MARGIN = 60
+
+
+class DeadlineExceeded(Exception):
+    """The time budget of the invocation is spent."""
+
+
+class Deadline:
+    """Abstract time budget of a lambda invocation in a class."""
+
+    def __init__(self, context=None, safety_margin=DEFAULT_SAFETY_MARGIN) -> None:
+        """Initialize invocation deadline.
+
+        :param context:
+            The lambda context, default no deadline.
+        :param int safety_margin:
+            Number of seconds kept before the lambda timeout.
+        """
+        self.context = context
+        self.safety_margin = safety_margin
+
+    def remaining(self) -> float:
+        """Return the seconds left before the safety margin."""
+        if self.context is None:
+            return math.inf
+        return self.context.get_remaining_time_in_millis() / 1000 - self.safety_margin
+
+    def expired(self) -> bool:
+        """Return True when the work must stop."""
+        return self.remaining() <= 0
+
+    def check(self) -> None:
+        """Stop the work when the deadline is reached.
+
+        :raises DeadlineExceeded:
+            The remaining time is under the safety margin.
+        """
+        if self.expired():
+            raise DeadlineExceeded(
+                f"Less than {self.safety_margin} seconds left before the lambda timeout"
+            )
+
+
+# Deadline of the running invocation, set by main.lambda_handler.
+_current = Deadline()
+
+
+def set_deadline(deadline: Deadline) -> None:
+    """Set the deadline of the running invocation.
+
+    :param Deadline deadline:
+        The new deadline, Deadline() to remove it.
+    """
+    global _current
+    _current = deadline
+
+
+def check_deadline() -> None:
+    """Check the deadline of the running invocation.
+
+    :raises DeadlineExceeded:
+        The remaining time is under the safety margin.
+    """
+    _current.check()
+
+
+def wait_budget(timeout: float) -> float:
+    """Return the seconds a wait can last in the running invocation.
+
+    :param float timeout:
+        The maximum duration of the wait.
+
+    :return float:
+        The timeout, or the time left before the safety margin when
+        shorter, 0 once the deadline is reached.
+    """
+    return max(0.0, min(timeout, _current.remaining()))
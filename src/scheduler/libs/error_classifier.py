@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+"""Classification and aggregation of the aws errors of the schedulers.
+
+The errors are classified by code in ERROR_CLASSES and counted by
+account, service, region and code. One summary line per class is logged
+at the end of the invocation, with a few sampled resources, instead of
+one line per failed resource.
+
+The action of a class is applied by main.lambda_handler once the
+errors are flushed: the resources with retry errors are scheduled again
+by a checkpoint invocation, after a backoff, and the accounts with fail
+errors are marked failed. The errors are handled per resource, they
+never fail the invocation.
+"""
+
+import contextvars
+import logging
+import threading
+from contextlib import contextmanager
+
+from botocore.exceptions import ClientError
+
+# Actions expected for an error class.
+RETRY = "retry"
+SKIP = "skip"
+FAIL = "fail"
+
+_LOG_LEVELS = {"info": logging.INFO, "warning": logging.WARNING, "error": logging.ERROR}
+
+# Severity and action of the error codes. Keys prefixed with a service
+# name override the class of a code for this service only.
+ERROR_CLASSES = {
+    "AccessDenied": ("error", SKIP),
+    "AccessDeniedException": ("error", SKIP),
+    "UnauthorizedOperation": ("error", SKIP),
+    "IncorrectInstanceState": ("info", SKIP),
+    "IncorrectState": ("info", SKIP),
+    "InvalidInstanceID.NotFound": ("info", SKIP),
+    "DBInstanceNotFound": ("info", SKIP),
+    "ResourceNotFound": ("info", SKIP),
+    "ResourceNotFoundException": ("info", SKIP),
+    "ResourceInUse": ("warning", SKIP),
+    "ScalingActivityInProgress": ("warning", RETRY),
+    "UnsupportedOperation": ("warning", SKIP),
+    "InvalidParameterCombination": ("warning", SKIP),
+    "InsufficientInstanceCapacity": ("warning", RETRY),
+    "rds:InvalidParameterCombination": ("info", SKIP),
+    "DBClusterNotFoundFault": ("info", SKIP),
+    "InvalidDBClusterStateFault": ("warning", SKIP),
+    "InvalidDBInstanceState": ("warning", SKIP),
+    "ClusterNotFoundException": ("info", SKIP),
+    "ServiceNotActiveException": ("warning", SKIP),
+    "ServiceNotFoundException": ("warning", SKIP),
+    "InvalidParameterException": ("warning", SKIP),
+    "Throttling": ("warning", RETRY),
+    "ThrottlingException": ("warning", RETRY),
+    "RequestLimitExceeded": ("warning", RETRY),
+    "TooManyRequestsException": ("warning", RETRY),
+}
+DEFAULT_CLASS = ("error", FAIL)
+
+# Suffixes of the codes of missing and busy resources, skipped when the
+# code is not in ERROR_CLASSES.
+SKIPPED_SUFFIXES = (
+    "NotFound",
+    "NotFoundFault",
+    "NotFoundException",
+    "State",
+    "StateFault",
+    "StateException",
+)
+
+# Number of resources sampled in the summary of an error class.
+MAX_SAMPLES = 3
+
+# Aws account of the errors recorded by the running thread, see
+# account_errors.
+_ACCOUNT = contextvars.ContextVar("scheduler_error_account", default="")
+
+
+@contextmanager
+def account_errors(account_id: str):
+    """Record the errors of the block for an aws account.
+
+    The worker threads of the block inherit the account through
+    libs.tracing.propagate.
+
+    :param str account_id:
+        The aws account id of the scheduled resources.
+    """
+    token = _ACCOUNT.set(account_id)
+    try:
+        yield
+    finally:
+        _ACCOUNT.reset(token)
+
+
+def classify_error(service: str, code: str) -> tuple:
+    """Return the severity and action of an error code.
+
+    :param str service:
+        The scheduler service, for example ec2 or rds.
+    :param str code:
+        The aws error code.
+    """
+    error_class = ERROR_CLASSES.get(f"{service}:{code}") or ERROR_CLASSES.get(code)
+    if error_class is None and code.endswith(SKIPPED_SUFFIXES):
+        return ("info", SKIP)
+    return error_class or DEFAULT_CLASS
+
+
+class ErrorAggregator:
+    """Abstract aggregated errors of an invocation in a class."""
+
+    def __init__(self, max_samples=MAX_SAMPLES) -> None:
+        """Initialize empty error aggregator.
+
+        :param int max_samples:
+            The number of resources sampled per error class.
+        """
+        self.max_samples = max_samples
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self, service, resource_name, resource_id, exception: ClientError, region_name=None
+    ) -> tuple:
+        """Count an error of a resource.
+
+        :param str service:
+            The scheduler service, for example ec2 or rds.
+        :param str resource_name:
+            Aws resource name
+        :param str resource_id:
+            Aws resource id
+        :param ClientError exception:
+            The error of the aws api.
+        :param str region_name:
+            The aws region of the resource.
+
+        The ids of the resources with retry errors are kept, a comma
+        separated resource_id names the resources of a batch call.
+
+        :return tuple:
+            The severity and action of the error.
+        """
+        code = exception.response["Error"]["Code"]
+        message = exception.response["Error"].get("Message", "")
+        logging.debug(f"{resource_name} {resource_id}: {code} {message}")
+        key = (_ACCOUNT.get(), service, region_name or "", code)
+        severity, action = classify_error(service, code)
+        with self._lock:
+            entry = self._errors.setdefault(
+                key, {"count": 0, "samples": [], "resource_ids": {}}
+            )
+            entry["count"] += 1
+            if len(entry["samples"]) < self.max_samples:
+                entry["samples"].append(f"{resource_name} {resource_id}: {message}")
+            if action == RETRY:
+                for item in str(resource_id).split(","):
+                    if item.strip():
+                        entry["resource_ids"][item.strip()] = None
+        return severity, action
+
+    def summary(self) -> list[dict]:
+        """Return the error classes, the most frequent first."""
+        with self._lock:
+            items = sorted(self._errors.items(), key=lambda item: -item[1]["count"])
+        summary = []
+        for (account, service, region, code), entry in items:
+            severity, action = classify_error(service, code)
+            summary.append(
+                {
+                    "account": account,
+                    "service": service,
+                    "region": region,
+                    "code": code,
+                    "severity": severity,
+                    "action": action,
+                    "count": entry["count"],
+                    "samples": list(entry["samples"]),
+                    "resource_ids": list(entry["resource_ids"]),
+                }
+            )
+        return summary
+
+    def clear(self) -> None:
+        """Forget the recorded errors without logging them."""
+        with self._lock:
+            self._errors.clear()
+
+    def flush(self) -> list[dict]:
+        """Log one line per error class and clear the errors.
+
+        :return list[dict]:
+            The summary of the logged errors.
+        """
+        summary = self.summary()
+        self.clear()
+        for item in summary:
+            logging.log(
+                _LOG_LEVELS[item["severity"]],
+                f"{item['count']} {item['code']} errors on {item['service']} "
+                f"{item['region']} {item['account']} ({item['action']}), "
+                "for example "
+                + "; ".join(item["samples"]),
+            )
+        return summary
+
+
+# Errors of the running invocation, flushed by main.lambda_handler.
+ERRORS = ErrorAggregator()
+
+
+def record_error(service, resource_name, resource_id, exception, region_name=None) -> tuple:
+    """Count an error in the errors of the running invocation.
+
+    See ErrorAggregator.record.
+    """
+    return ERRORS.record(service, resource_name, resource_id, exception, region_name)
+
+
+def retry_units(summary: list[dict]) -> list[dict]:
+    """Return the account, service, region and resources of the retry errors.
+
+    :param list[dict] summary:
+        The errors summary, see ErrorAggregator.summary.
+    """
+    units = {}
+    for item in summary:
+        if item["action"] != RETRY:
+            continue
+        key = (item["account"], item["service"], item["region"])
+        unit = units.setdefault(
+            key,
+            {
+                "account": key[0],
+                "service": key[1],
+                "region": key[2],
+                "resource_ids": [],
+            },
+        )
+        unit["resource_ids"] += [
+            resource_id
+            for resource_id in item["resource_ids"]
+            if resource_id not in unit["resource_ids"]
+        ]
+    return list(units.values())
+
+
+def failed_accounts(summary: list[dict]) -> dict:
+    """Return the number of fail errors of each account.
+
+    :param list[dict] summary:
+        The errors summary, see ErrorAggregator.summary.
+    """
+    accounts = {}
+    for item in summary:
+        if item["action"] == FAIL:
+            accounts[item["account"]] = accounts.get(item["account"], 0) + item["count"]
+    return accounts
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+"""Scheduler configuration from lambda environment and event payload."""
+
+import os
+from distutils.util import strtobool
+
+from .orchestrator import DEFAULT_DEPENDENCIES, parse_dependencies
+from .schedule_window import parse_schedule
+from .tag_expression import parse_tag_expression
+
+SCHEDULE_ACTIONS = ("start", "stop", "track", "schedule", "reconcile")
+SERVICE_NAMES = ("autoscaling", "ec2", "ecs", "rds", "cloudwatch_alarm")
+
+# Keys allowed in the lambda event payload to override the environment.
+EVENT_SCHEMA = {
+    "action": {"type": str, "enum": SCHEDULE_ACTIONS},
+    "regions": {"type": list, "items": str},
+    "services": {"type": list, "items": str, "enum": SERVICE_NAMES},
+    "tags": {"type": list, "items": dict},
+    "tag_expression": {"type": str},
+    "exclude": {"type": list, "items": str},
+    "dependencies": {"type": dict},
+    "started_at": {"type": (int, float)},
+    "reconcile_window": {"type": str},
+    "checkpoint": {"type": list, "items": dict},
+    "attempt": {"type": int},
+}
+
+
+def validate_event(event: dict) -> dict:
+    """Validate the scheduler overrides of a lambda event.
+
+    Events sent by a cloudwatch event rule without custom input
+    don't contain overrides and are ignored.
+
+    :param dict event:
+        The lambda event payload. For example:
+        {
+            'action': 'stop',
+            'regions': ['eu-west-1'],
+            'services': ['ec2', 'rds'],
+            'tags': [{'Key': 'tostop', 'Values': ['true']}],
+            'tag_expression': 'tostop=true AND NOT env=prod*',
+            'exclude': ['i-0123456789abcdef0'],
+            'dependencies': {'ec2': ['rds'], 'cloudwatch_alarm': ['ec2']},
+            'reconcile_window': 'Europe/Paris 08:00-20:00 MON-FRI',
+        }
+
+    :raises ValueError:
+        The event doesn't match EVENT_SCHEMA.
+
+    :return dict:
+        The validated overrides.
+    """
+    if not event:
+        return {}
+    if not isinstance(event, dict):
+        raise ValueError(f"Invalid event type: {type(event).__name__}")
+    if event.get("source") == "aws.events":
+        return {}
+
+    for key, value in event.items():
+        rule = EVENT_SCHEMA.get(key)
+        if rule is None:
+            raise ValueError(f"Unknown event key: {key}")
+        if not isinstance(value, rule["type"]) or isinstance(value, bool):
+            raise ValueError(f"Invalid event key {key}: {value!r}")
+        items = value if isinstance(value, list) else [value]
+        for item in items:
+            if "items" in rule and not isinstance(item, rule["items"]):
+                raise ValueError(f"Invalid event key {key}: expected {rule['items'].__name__} items")
+            if "enum" in rule and item not in rule["enum"]:
+                raise ValueError(f"Invalid event key {key}: {item} not in {rule['enum']}")
+
+    for tag in event.get("tags", []):
+        if not isinstance(tag.get("Key"), str) or not all(
+            isinstance(value, str) for value in tag.get("Values", [])
+        ):
+            raise ValueError(f"Invalid event tag filter: {tag}")
+    for service, needs in event.get("dependencies", {}).items():
+        if service not in SERVICE_NAMES or not isinstance(needs, list) or not all(
+            need in SERVICE_NAMES for need in needs
+        ):
+            raise ValueError(f"Invalid event dependencies of {service}: {needs}")
+    if "tag_expression" in event:
+        parse_tag_expression(event["tag_expression"])
+    for unit in event.get("checkpoint", []):
+        if (
+            unit.get("service") not in SERVICE_NAMES
+            or not isinstance(unit.get("region"), str)
+            or not isinstance(unit.get("cursors", {}), dict)
+            or not isinstance(unit.get("resource_ids", []), list)
+            or not isinstance(unit.get("retry", 0), int)
+        ):
+            raise ValueError(f"Invalid event checkpoint: {unit}")
+    if event.get("reconcile_window"):
+        parse_schedule(event["reconcile_window"])
+    return event
+
+
+def load_config(event: dict) -> dict:
+    """Build the scheduler configuration.
+
+    Values are read from the lambda environment, then overridden by
+    the keys of the lambda event.
+
+    :param dict event:
+        The lambda event payload, see validate_event.
+
+    :return dict:
+        The action, regions, services, tags, exclude, dependencies,
+        rds_follow_up, ec2_stop_mode, autoscaling_mode, schedule_tag,
+        reconcile_window and page_size keys. tags is a tag expression
+        string when TAG_EXPRESSION or the event tag_expression key is
+        defined. exclude is None when the exclusion list comes from
+        the environment.
+    """
+    config = {
+        "action": os.getenv("SCHEDULE_ACTION"),
+        "regions": os.getenv("AWS_REGIONS").replace(" ", "").split(","),
+        "services": [
+            service
+            for service in SERVICE_NAMES
+            if strtobool(os.getenv(f"{service.upper()}_SCHEDULE", "false"))
+        ],
+        "tags": [{"Key": os.getenv("TAG_KEY"), "Values": [os.getenv("TAG_VALUE")]}],
+        "exclude": None,
+        "dependencies": DEFAULT_DEPENDENCIES,
+        "rds_follow_up": strtobool(os.getenv("RDS_READINESS_FOLLOW_UP", "false")),
+        "ec2_stop_mode": os.getenv("EC2_STOP_MODE", "stop"),
+        "autoscaling_mode": os.getenv("AUTOSCALING_SCHEDULE_MODE", "suspend"),
+        "schedule_tag": os.getenv("SCHEDULE_TAG", "schedule"),
+        "reconcile_window": os.getenv("RECONCILE_WINDOW", ""),
+        "page_size": int(os.getenv("DISCOVERY_PAGE_SIZE", "0")) or None,
+    }
+    if os.getenv("SCHEDULER_DEPENDENCIES"):
+        config["dependencies"] = parse_dependencies(os.getenv("SCHEDULER_DEPENDENCIES"))
+    if os.getenv("TAG_EXPRESSION"):
+        config["tags"] = parse_tag_expression(os.getenv("TAG_EXPRESSION")).text
+    if config["reconcile_window"]:
+        parse_schedule(config["reconcile_window"])
+    config.update(validate_event(event))
+    if "tag_expression" in config:
+        config["tags"] = config.pop("tag_expression")
+    return config
@@ -1,27 +1,148 @@
 """Filter aws resouces with tags."""
 
+import sys
 from collections.abc import Iterator
 
-import boto3
+from .aws_sessions import get_client
+from .pagination import PageCursor, paginate
+from .tag_expression import compile_tags
+
+# Prefix of the tags holding per resource scheduler settings,
+# for example scheduler:exclude = true.
+SETTING_TAG_PREFIX = "scheduler:"
+
+
+class TaggedResource:
+    """Abstract aws resource returned by the tagging api in a class."""
+
+    __slots__ = (
+        "arn",
+        "partition",
+        "service",
+        "region",
+        "account_id",
+        "resource_type",
+        "parent_id",
+        "resource_id",
+        "tags",
+    )
+
+    def __init__(self, arn: str, tags: dict) -> None:
+        """Parse the resource arn.
+
+        :param str arn:
+            The resource arn, the resource part can use the
+            type/id, type/parent/id or type:id format. For example:
+            arn:aws:ec2:eu-west-1:123456789012:instance/i-0123456789
+            arn:aws:ecs:eu-west-1:123456789012:service/cluster/service
+            arn:aws:rds:eu-west-1:123456789012:db:database
+        :param dict tags:
+            The resource tags, as a key/value dict.
+
+        The arn parts repeated across resources, like the region or
+        an ecs cluster name, are interned and shared by the resources.
+        """
+        self.arn = arn
+        self.tags = tags
+        _, partition, service, region, account_id, resource = arn.split(":", 5)
+        self.partition = sys.intern(partition)
+        self.service = sys.intern(service)
+        self.region = sys.intern(region)
+        self.account_id = sys.intern(account_id)
+        slash, colon = resource.find("/"), resource.find(":")
+        self.parent_id = None
+        if colon != -1 and (slash == -1 or colon < slash):
+            resource_type, self.resource_id = resource.split(":", 1)
+        elif slash != -1:
+            resource_type, path = resource.split("/", 1)
+            if "/" in path:
+                parent_id, self.resource_id = path.rsplit("/", 1)
+                self.parent_id = sys.intern(parent_id)
+            else:
+                self.resource_id = path
+        else:
+            resource_type, self.resource_id = "", resource
+        self.resource_type = sys.intern(resource_type)
+
+    def get_setting(self, name: str, default=None):
+        """Return a scheduler setting defined by the resource tags.
+
+        :param str name:
+            The setting name, read from the scheduler:<name> tag.
+        :param default:
+            Value returned when the resource doesn't have the tag.
+        """
+        return self.tags.get(SETTING_TAG_PREFIX + name, default)
+
+    def is_excluded(self, to_exclude=()) -> bool:
+        """Return True when the resource must not be scheduled.
+
+        :param to_exclude:
+            The excluded resource ids, resources tagged with
+            scheduler:exclude = true are excluded too.
+        """
+        if self.resource_id in to_exclude:
+            return True
+        return self.get_setting("exclude", "false").lower() == "true"
+
+    def is_selected(self, resource_ids=None) -> bool:
+        """Return True when the resource or its parent is in resource_ids.
+
+        :param resource_ids:
+            The selected resource ids, None to select all resources.
+        """
+        if resource_ids is None:
+            return True
+        return self.resource_id in resource_ids or self.parent_id in resource_ids
+
+    def __repr__(self) -> str:
+        """Return the resource arn."""
+        return f"TaggedResource({self.arn!r})"
+
+
+def compact_tags(tags: list[dict]) -> dict:
+    """Return api tags as a key/value dict sharing the repeated strings.
+
+    Tag keys and most values, like true or prod, are the same on many
+    resources, interned they are stored once per inventory instead of
+    once per resource.
+
+    :param list[dict] tags:
+        The tags returned by the api, with Key and Value items.
+    """
+    return {sys.intern(tag["Key"]): sys.intern(tag["Value"]) for tag in tags}
 
 
 class FilterByTags:
     """Abstract Filter aws resources by tags in a class."""
 
-    def __init__(self, region_name=None) -> None:
-        """Initialize resourcegroupstaggingapi client."""
-        if region_name:
-            self.rgta = boto3.client(
-                "resourcegroupstaggingapi", region_name=region_name
-            )
-        else:
-            self.rgta = boto3.client("resourcegroupstaggingapi")
+    def __init__(
+        self, region_name=None, session=None, page_size=None, cursors=None, resource_ids=None
+    ) -> None:
+        """Initialize resourcegroupstaggingapi client.
+
+        :param int page_size:
+            The number of resources per page, at most 100.
+        :param dict cursors:
+            The page token to resume the listing of a resource type
+            from, by resource type.
+        :param list[str] resource_ids:
+            Only return these resources, or the resources of these
+            parents like an ecs cluster, default all of them.
+        """
+        self.rgta = get_client("resourcegroupstaggingapi", region_name, session)
+        self.page_size = page_size
+        self.resume_tokens = dict(cursors or {})
+        self.resource_ids = set(resource_ids) if resource_ids else None
+        self.cursors = {}
 
-    def get_resources(self, resource_type, aws_tags) -> Iterator[str]:
+    def get_resources(self, resource_type, aws_tags) -> Iterator[TaggedResource]:
         """Filter aws resources using resource type and defined tags.
 
         Returns all the tagged defined resources that are located in
-        the specified Region for the AWS account.
+        the specified Region for the AWS account. The position of the
+        listing is kept in cursors, a resume token of the resource type
+        is only used by its first listing.
 
         :param str resource_type:
             The constraints on the resources that you want returned.
@@ -42,13 +163,27 @@ class FilterByTags:
                     ]
                 },
             ]
-        :yield Iterator[str]:
-            The ids of the resources
+            A tag expression string or TagExpression is also accepted,
+            see libs.tag_expression. Its terms the api understands are
+            sent as TagFilters, the whole expression is evaluated on
+            the returned tags.
+        :yield Iterator[TaggedResource]:
+            The resources with their parsed arn and tags
         """
-        paginator = self.rgta.get_paginator("get_resources")
-        page_iterator = paginator.paginate(
-            TagFilters=aws_tags, ResourceTypeFilters=[resource_type]
-        )
-        for page in page_iterator:
-            for resource_tag_map in page["ResourceTagMappingList"]:
-                yield resource_tag_map["ResourceARN"]
+        expression = compile_tags(aws_tags)
+        cursor = PageCursor(self.resume_tokens.pop(resource_type, None), self.page_size)
+        self.cursors[resource_type] = cursor
+        for resource_tag_map in paginate(
+            self.rgta.get_resources,
+            "PaginationToken",
+            "ResourceTagMappingList",
+            cursor,
+            size_name="ResourcesPerPage",
+            TagFilters=expression.tag_filters,
+            ResourceTypeFilters=[resource_type],
+        ):
+            tags = compact_tags(resource_tag_map["Tags"])
+            if expression.matches(tags):
+                resource = TaggedResource(resource_tag_map["ResourceARN"], tags)
+                if resource.is_selected(self.resource_ids):
+                    yield resource
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+"""Asynchronous invocations of the scheduler lambda."""
+
+import json
+
+from .aws_sessions import get_client
+
+
+def invoke_async(function_arn: str, payload: dict) -> None:
+    """Invoke a lambda function without waiting its result.
+
+    :param str function_arn:
+        The arn of the lambda function, usually the invoked function
+        arn of the lambda context.
+    :param dict payload:
+        The event sent to the lambda function.
+    """
+    get_client("lambda").invoke(
+        FunctionName=function_arn,
+        InvocationType="Event",
+        Payload=json.dumps(payload).encode(),
+    )
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+"""Dependency aware orchestration of the service schedulers."""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from .deadline import DeadlineExceeded, check_deadline
+from .schedule_window import RUNNING, STOPPED
+from .tracing import propagate, span
+
+# Services started before the services which depend on them:
+# databases first, then applications, then their alarms.
+DEFAULT_DEPENDENCIES = {
+    "autoscaling": ["rds"],
+    "ec2": ["rds"],
+    "ecs": ["rds"],
+    "cloudwatch_alarm": ["autoscaling", "ec2", "ecs", "rds"],
+}
+
+
+def parse_dependencies(value: str) -> dict:
+    """Parse a dependency graph definition.
+
+    :param str value:
+        Comma separated service:dependency|dependency items, for example
+        ``ec2:rds, cloudwatch_alarm:ec2|rds``.
+
+    :return dict:
+        The dependencies of each service.
+    """
+    dependencies = {}
+    for item in value.replace(" ", "").split(","):
+        if not item:
+            continue
+        service, _, needs = item.partition(":")
+        dependencies[service] = [need for need in needs.split("|") if need]
+    return dependencies
+
+
+def build_waves(services: list[str], dependencies: dict) -> list[list[str]]:
+    """Group services in waves of the start order.
+
+    Each wave only contains services whose dependencies are in the
+    previous waves. Dependencies on services which are not scheduled
+    are ignored.
+
+    :param list[str] services:
+        The services to schedule.
+    :param dict dependencies:
+        The dependencies of each service, see DEFAULT_DEPENDENCIES.
+
+    :raises ValueError:
+        The dependency graph has a cycle.
+
+    :return list[list[str]]:
+        The services of each wave, in start order.
+    """
+    remaining = {
+        service: {need for need in dependencies.get(service, []) if need in services}
+        for service in services
+    }
+    waves = []
+    while remaining:
+        wave = [
+            service for service in services if service in remaining and not remaining[service]
+        ]
+        if not wave:
+            raise ValueError(f"Dependency cycle between services: {sorted(remaining)}")
+        for service in wave:
+            del remaining[service]
+        for needs in remaining.values():
+            needs.difference_update(wave)
+        waves.append(wave)
+    return waves
+
+
+def run_waves(waves: list[list], action: str, max_workers=10, labels=None, **kwargs) -> list:
+    """Run the scheduler action wave after wave.
+
+    The schedulers of a wave run in parallel. Except when stopping,
+    the next wave only begins when the wait_until_ready method of the
+    schedulers returned. Stop runs the waves in reverse order without
+    readiness checks. Reconcile, which stops and starts resources, runs
+    twice with a desired_state split in two: the resources to stop in
+    the stop order, then the resources to start in the start order.
+
+    The invocation deadline is checked before each scheduler, see
+    libs.deadline. Once reached, the running schedulers finish their
+    batch in flight and the next waves don't run. The readiness waits
+    are bounded by the remaining invocation time: a wait reaching the
+    deadline returns its wave unfinished with the next waves, the wave
+    being run again to wait the resources still starting.
+
+    :param list[list] waves:
+        The scheduler objects of each wave, in start order.
+    :param str action:
+        The scheduler method to call, for example start or stop.
+    :param int max_workers:
+        Maximum number of schedulers running at the same time.
+    :param dict labels:
+        The tracing span attributes of each scheduler, by id, for
+        example its service and region.
+    :param kwargs:
+        Arguments of the scheduler method.
+
+    :raises Exception:
+        The first error of a wave, the next waves don't run.
+
+    :return list:
+        The schedulers stopped or not run because of the deadline.
+    """
+    labels = labels or {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if action == "reconcile" and "desired_state" in kwargs:
+            desired_state = kwargs.pop("desired_state")
+            unfinished = _run_in_order(
+                executor,
+                list(reversed(waves)),
+                action,
+                labels,
+                False,
+                desired_state=_desired_only(desired_state, STOPPED),
+                **kwargs,
+            )
+            if unfinished:
+                # The starts of all the schedulers run in the new invocation
+                return unfinished + [
+                    strategy
+                    for wave in waves
+                    for strategy in wave
+                    if strategy not in unfinished
+                ]
+            return _run_in_order(
+                executor,
+                waves,
+                action,
+                labels,
+                True,
+                desired_state=_desired_only(desired_state, RUNNING),
+                **kwargs,
+            )
+        if action == "stop":
+            return _run_in_order(
+                executor, list(reversed(waves)), action, labels, False, **kwargs
+            )
+        return _run_in_order(executor, waves, action, labels, True, **kwargs)
+
+
+def _desired_only(desired_state, state):
+    """Return a desired_state function leaving the resources of the other states."""
+    return lambda tags: state if desired_state(tags) == state else None
+
+
+def _spans(prefix, wave, labels):
+    """Return the tracing span name and attributes of the schedulers of a wave."""
+    spans = []
+    for strategy in wave:
+        attributes = labels.get(id(strategy), {})
+        name = " ".join(
+            value for value in (attributes.get("service"), attributes.get("region")) if value
+        )
+        spans.append((f"{prefix} {name or type(strategy).__name__}", attributes))
+    return spans
+
+
+def _run_in_order(executor, waves, action, labels, wait_ready, **kwargs) -> list:
+    """Run the waves in the given order, see run_waves.
+
+    :param bool wait_ready:
+        Wait the schedulers of a wave are ready before the next wave.
+
+    :return list:
+        The schedulers stopped or not run because of the deadline.
+    """
+    for index, wave in enumerate(waves):
+        unfinished = _wait_all(
+            executor,
+            [getattr(strategy, action) for strategy in wave],
+            _spans(action, wave, labels),
+            **kwargs,
+        )
+        later = [strategy for next_wave in waves[index + 1:] for strategy in next_wave]
+        if unfinished:
+            # The stopped schedulers and the next waves run in a new invocation
+            return [wave[i] for i in unfinished] + later
+        ready = [strategy for strategy in wave if hasattr(strategy, "wait_until_ready")]
+        if wait_ready and _wait_all(
+            executor,
+            [strategy.wait_until_ready for strategy in ready],
+            _spans("ready", ready, labels),
+        ):
+            # The wave is run again to wait its resources are ready
+            return wave + later
+    return []
+
+
+def _call_before_deadline(call, trace=("scheduler", {}), **kwargs):
+    """Run a call in its tracing span unless the invocation deadline is reached."""
+    with span(trace[0], **trace[1]):
+        check_deadline()
+        return call(**kwargs)
+
+
+def _wait_all(executor, calls: list, spans=None, **kwargs) -> list[int]:
+    """Run calls in the executor and raise the first error.
+
+    :param list calls:
+        The functions to run.
+    :param list spans:
+        The tracing span name and attributes of each call.
+
+    :return list[int]:
+        The index of the calls stopped by the deadline.
+    """
+    spans = spans or [("scheduler", {})] * len(calls)
+    futures = [
+        executor.submit(propagate(_call_before_deadline), call, trace, **kwargs)
+        for call, trace in zip(calls, spans)
+    ]
+    errors, unfinished = [], []
+    for index, future in enumerate(futures):
+        try:
+            future.result()
+        except DeadlineExceeded as err:
+            logging.warning(f"Scheduler stopped: {err}")
+            unfinished.append(index)
+        except Exception as err:
+            logging.error(f"Scheduler error: {err}")
+            errors.append(err)
+    if errors:
+        raise errors[0]
+    return unfinished
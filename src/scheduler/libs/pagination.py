@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+"""Resumable paging of the aws list apis."""
+
+from collections.abc import Iterator
+
+
+class PageCursor:
+    """Abstract position of a paged listing in a class."""
+
+    __slots__ = ("token", "page_size", "pages", "items")
+
+    def __init__(self, token=None, page_size=None) -> None:
+        """Initialize page cursor.
+
+        :param str token:
+            The token of the next page, default start from the first
+            page.
+        :param int page_size:
+            The number of items requested per page, default the api
+            default.
+        """
+        self.token = token
+        self.page_size = page_size
+        self.pages = 0
+        self.items = 0
+
+    def to_dict(self) -> dict:
+        """Return the cursor position, for the run metrics."""
+        return {"token": self.token, "pages": self.pages, "items": self.items}
+
+    def __repr__(self) -> str:
+        """Return the cursor position."""
+        return f"PageCursor(pages={self.pages}, items={self.items}, token={self.token!r})"
+
+
+def paginate(
+    operation, token_name: str, result_key: str, cursor: PageCursor, size_name=None, **params
+) -> Iterator[dict]:
+    """Yield the items of a paged api from the cursor position.
+
+    The cursor token only moves to the next page once all the items
+    of the current page were consumed, so a sweep stopped between two
+    items resumes without skipping any of them.
+
+    :param callable operation:
+        The client method of the api, for example rgta.get_resources.
+    :param str token_name:
+        The request and response key of the page token, for example
+        PaginationToken or NextToken.
+    :param str result_key:
+        The response key of the items.
+    :param PageCursor cursor:
+        The position of the listing, updated while paging.
+    :param str size_name:
+        The request key of the page size, for example MaxRecords.
+    :param params:
+        The other parameters of the api.
+    """
+    while True:
+        request = dict(params)
+        if cursor.token:
+            request[token_name] = cursor.token
+        if size_name and cursor.page_size:
+            request[size_name] = cursor.page_size
+        page = operation(**request)
+        cursor.pages += 1
+        for item in page.get(result_key, []):
+            cursor.items += 1
+            yield item
+        cursor.token = page.get(token_name) or None
+        if cursor.token is None:
+            return
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""Bounded pipeline from resource discovery to scheduler actions."""
+
+import logging
+import queue
+import threading
+from collections.abc import Iterable, Iterator
+from itertools import islice
+
+from .deadline import check_deadline
+from .tracing import propagate, span
+
+# Number of resources sent in one api call.
+BATCH_SIZE = 50
+# Number of batches waiting for a worker before discovery pauses.
+MAX_PENDING_BATCHES = 4
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    """Group items in lists of at most size items.
+
+    :param Iterable items:
+        The items to group, consumed lazily.
+    :param int size:
+        The maximum number of items of a batch.
+    """
+    iterator = iter(items)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+def run_pipeline(
+    items: Iterable,
+    consume,
+    batch_size=BATCH_SIZE,
+    workers=2,
+    max_pending=MAX_PENDING_BATCHES,
+) -> None:
+    """Consume items in batches while they are still discovered.
+
+    The items are read in the calling thread, usually a generator
+    paging an aws api, and grouped in batches sent to worker threads
+    through a bounded queue. Discovery pauses when max_pending batches
+    wait for a worker, so memory doesn't grow with the fleet size.
+    The invocation deadline is checked before each batch. With tracing,
+    the discovery and the consumption of each batch are spans of the
+    calling span.
+
+    :param Iterable items:
+        The items to consume, for example resource ids.
+    :param callable consume:
+        Function called by the workers with each batch.
+    :param int batch_size:
+        The maximum number of items of a batch.
+    :param int workers:
+        The number of threads consuming the batches.
+    :param int max_pending:
+        The maximum number of batches waiting for a worker.
+
+    :raises Exception:
+        The first error of the discovery or of a worker, the remaining
+        batches are not consumed.
+    :raises DeadlineExceeded:
+        The invocation deadline is reached, the queued batches are
+        consumed before.
+    """
+    batches = queue.Queue(maxsize=max_pending)
+    errors = []
+
+    def _worker():
+        while True:
+            batch = batches.get()
+            if batch is None:
+                return
+            if errors:
+                continue
+            try:
+                with span("batch", size=len(batch)):
+                    consume(batch)
+            except Exception as err:
+                logging.error(f"Pipeline batch error: {err}")
+                errors.append(err)
+
+    threads = [threading.Thread(target=propagate(_worker), daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        iterator = batched(items, batch_size)
+        while not errors:
+            # Checked before reading the batch, no discovered item is dropped
+            check_deadline()
+            with span("discover"):
+                batch = next(iterator, None)
+            if batch is None:
+                break
+            batches.put(batch)
+    finally:
+        for _ in threads:
+            batches.put(None)
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
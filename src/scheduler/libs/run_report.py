@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+"""Run report of the resource actions sent by the scheduler.
+
+The mutating api calls of the scheduler clients are recorded in memory,
+one row per resource with its timing, outcome and error code. At the
+end of the invocation the report is written as gzipped NDJSON in one
+object, under a date partition, to RUN_REPORT_BUCKET or to the local
+RUN_REPORT_DIR directory.
+
+The report stays a single PUT per invocation: the region and service
+are columns of each row, the rows being sorted by region and service,
+instead of key partitions which would need one object each.
+"""
+
+import gzip
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from .api_calls import is_mutating
+from .aws_sessions import get_client, register_handlers
+
+# Parameters holding the resources of a mutating call.
+RESOURCE_PARAMS = (
+    "InstanceIds",
+    "SpotInstanceRequestIds",
+    "AlarmNames",
+    "DBInstanceIdentifier",
+    "DBClusterIdentifier",
+    "AutoScalingGroupName",
+    "service",
+    "Tags",
+)
+
+# Key of the call timing in the botocore request context.
+_CONTEXT_KEY = "scheduler_run_report"
+
+
+class ReportRow:
+    """Abstract result of an action on one resource in a class."""
+
+    __slots__ = (
+        "account",
+        "region",
+        "service",
+        "operation",
+        "resource_id",
+        "outcome",
+        "error_code",
+        "started_at",
+        "duration_ms",
+    )
+
+    def __init__(
+        self,
+        account,
+        region,
+        service,
+        operation,
+        resource_id,
+        outcome,
+        error_code,
+        started_at,
+        duration_ms,
+    ) -> None:
+        """Initialize report row."""
+        self.account = account
+        self.region = region
+        self.service = service
+        self.operation = operation
+        self.resource_id = resource_id
+        self.outcome = outcome
+        self.error_code = error_code
+        self.started_at = started_at
+        self.duration_ms = duration_ms
+
+    def to_dict(self) -> dict:
+        """Return the row columns."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def resource_ids(params: dict) -> list[str]:
+    """Return the resources of the parameters of a mutating call.
+
+    :param dict params:
+        The parameters of the api call. The tags of the autoscaling
+        tag calls name their group in ResourceId.
+    """
+    for name in RESOURCE_PARAMS:
+        value = params.get(name)
+        if name == "Tags" and value:
+            value = list(dict.fromkeys(tag.get("ResourceId", "") for tag in value))
+        if value:
+            return list(value) if isinstance(value, list) else [value]
+    return [""]
+
+
+class RunReport:
+    """Abstract report of a scheduler invocation in a class."""
+
+    def __init__(self, action: str, run_id=None) -> None:
+        """Initialize empty run report.
+
+        :param str action:
+            The scheduler action of the invocation.
+        :param str run_id:
+            The identifier of the invocation, default a random uuid.
+        """
+        self.action = action
+        self.run_id = run_id or str(uuid.uuid4())
+        self.started_at = datetime.now(timezone.utc)
+        self.rows = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def recording(self, session=None, account=""):
+        """Record the mutating calls of the session clients used in the block.
+
+        :param boto3.session.Session session:
+            The session of the recorded clients, default the boto3
+            default session, see libs.aws_sessions.register_handlers.
+        :param str account:
+            The aws account id of the session.
+        """
+        def _before(params, model, context, **kwargs):
+            if is_mutating(model.name):
+                context[_CONTEXT_KEY] = (resource_ids(params), time.time(), model)
+
+        def _after(context, http_response, parsed, **kwargs):
+            call = context.pop(_CONTEXT_KEY, None)
+            if call is None:
+                return
+            error_code = ""
+            if http_response.status_code >= 300:
+                error_code = parsed.get("Error", {}).get("Code") or "HttpError"
+            self.add(account, context.get("client_region"), call, error_code)
+
+        def _error(context, exception, **kwargs):
+            # Connection errors are emitted without the operation model
+            call = context.pop(_CONTEXT_KEY, None)
+            if call is not None:
+                error_code = type(exception).__name__
+                self.add(account, context.get("client_region"), call, error_code)
+
+        handlers = (
+            ("before-parameter-build", _before),
+            ("after-call", _after),
+            ("after-call-error", _error),
+        )
+        with register_handlers(session, handlers):
+            yield self
+
+    def add(self, account, region, call, error_code) -> None:
+        """Add the rows of a mutating api call.
+
+        :param tuple call:
+            The resource ids, start time and operation model of the call.
+        """
+        ids, started_at, model = call
+        duration_ms = int((time.time() - started_at) * 1000)
+        started = datetime.fromtimestamp(started_at, timezone.utc).isoformat()
+        rows = [
+            ReportRow(
+                account,
+                region,
+                model.service_model.service_name,
+                model.name,
+                resource_id,
+                "failed" if error_code else "success",
+                error_code,
+                started,
+                duration_ms,
+            )
+            for resource_id in ids
+        ]
+        with self._lock:
+            self.rows += rows
+
+    def object_key(self) -> str:
+        """Return the key of the report, partitioned by date.
+
+        The region and service are report columns, see the module
+        docstring.
+        """
+        return (
+            f"run-reports/date={self.started_at:%Y-%m-%d}/"
+            f"{self.action}-{self.started_at:%H%M%S}-{self.run_id}.ndjson.gz"
+        )
+
+    def to_ndjson(self) -> bytes:
+        """Return the gzipped NDJSON content of the report."""
+        with self._lock:
+            # Sorted rows compress better and group the partitions
+            rows = sorted(
+                self.rows, key=lambda row: (row.region, row.service, row.started_at)
+            )
+        header = {"run_id": self.run_id, "action": self.action}
+        lines = (
+            json.dumps({**header, **row.to_dict()}, separators=(",", ":")) for row in rows
+        )
+        return gzip.compress("\n".join(lines).encode("utf-8"))
+
+    def write(self, bucket=None, directory=None):
+        """Write the report in one object.
+
+        :param str bucket:
+            The s3 bucket of the report.
+        :param str directory:
+            The local directory of the report, used instead of the
+            bucket, for example by the tests.
+
+        :return str:
+            The location of the report, None when nothing is written.
+        """
+        if not self.rows or not (bucket or directory):
+            return None
+        key = self.object_key()
+        body = self.to_ndjson()
+        if directory:
+            path = os.path.join(directory, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as report_file:
+                report_file.write(body)
+            return path
+        get_client("s3").put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=body,
+            ContentType="application/x-ndjson",
+            ContentEncoding="gzip",
+        )
+        return f"s3://{bucket}/{key}"
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+"""Time-window schedules read from the resource tags.
+
+A schedule gives the timezone, the daily running window and optionally
+the days of the week when the resource runs:
+
+    Europe/Paris 08:00-20:00 MON-FRI
+
+- The window end can be before its start to run overnight, for example
+  ``22:00-06:00``, the days then apply to the window start.
+- Days accept ranges and lists separated by ``+`` or ``,``, for
+  example ``MON-WED+FRI``. Without days the window applies every day.
+- ``24:00`` ends the window at midnight.
+
+Schedules are parsed once and cached, the state wanted for a resource
+is evaluated once per distinct schedule in a run.
+"""
+
+import logging
+import re
+from datetime import datetime, timezone
+from functools import lru_cache
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:
+    ZoneInfo = None
+
+# States wanted for a resource.
+RUNNING = "running"
+STOPPED = "stopped"
+
+DAYS = ("MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN")
+_WINDOW = re.compile(r"^(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2})$")
+
+
+class ScheduleWindow:
+    """Abstract compiled time-window schedule in a class."""
+
+    __slots__ = ("text", "timezone", "start", "end", "days")
+
+    def __init__(self, text: str, tzinfo, start: int, end: int, days: frozenset) -> None:
+        """Initialize compiled schedule.
+
+        :param str text:
+            The source of the schedule.
+        :param tzinfo:
+            The timezone of the window.
+        :param int start:
+            The window start, in minutes after midnight.
+        :param int end:
+            The window end, in minutes after midnight.
+        :param frozenset days:
+            The weekdays of the window start, monday is 0.
+        """
+        self.text = text
+        self.timezone = tzinfo
+        self.start = start
+        self.end = end
+        self.days = days
+
+    def is_active(self, now: datetime) -> bool:
+        """Return True when the resource must be running.
+
+        :param datetime now:
+            The current time, timezone aware.
+        """
+        local = now.astimezone(self.timezone)
+        minutes = local.hour * 60 + local.minute
+        weekday = local.weekday()
+        if self.start <= self.end:
+            return weekday in self.days and self.start <= minutes < self.end
+        # Overnight window started today or the day before
+        if minutes >= self.start:
+            return weekday in self.days
+        return minutes < self.end and (weekday - 1) % 7 in self.days
+
+    def __repr__(self) -> str:
+        """Return the schedule source."""
+        return f"ScheduleWindow({self.text!r})"
+
+
+@lru_cache(maxsize=256)
+def parse_schedule(text: str) -> ScheduleWindow:
+    """Parse and compile a schedule.
+
+    :param str text:
+        The schedule, for example ``Europe/Paris 08:00-20:00 MON-FRI``.
+
+    :raises ValueError:
+        The schedule is invalid.
+    """
+    parts = text.split()
+    if len(parts) not in (2, 3):
+        raise ValueError(f"Invalid schedule {text!r}: expected 'timezone HH:MM-HH:MM [days]'")
+    tzinfo = _parse_timezone(parts[0])
+    match = _WINDOW.match(parts[1])
+    if not match:
+        raise ValueError(f"Invalid schedule {text!r}: invalid window {parts[1]!r}")
+    start_hour, start_minute, end_hour, end_minute = (int(group) for group in match.groups())
+    start, end = start_hour * 60 + start_minute, end_hour * 60 + end_minute
+    if start_minute > 59 or end_minute > 59 or start >= 24 * 60 or end > 24 * 60:
+        raise ValueError(f"Invalid schedule {text!r}: invalid window {parts[1]!r}")
+    days = _parse_days(parts[2]) if len(parts) == 3 else frozenset(range(7))
+    return ScheduleWindow(text, tzinfo, start, end, days)
+
+
+def _parse_timezone(name: str):
+    """Return the tzinfo of a timezone name."""
+    if name.upper() == "UTC":
+        return timezone.utc
+    if ZoneInfo is None:
+        raise ValueError(f"Invalid schedule timezone {name!r}: only UTC is supported")
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Invalid schedule timezone {name!r}")
+
+
+def _parse_days(value: str) -> frozenset:
+    """Parse days like MON-FRI or SAT+SUN into weekday numbers."""
+    days = set()
+    for item in re.split(r"[+,]", value.upper()):
+        first, _, last = item.partition("-")
+        if first not in DAYS or (last and last not in DAYS):
+            raise ValueError(f"Invalid schedule days {value!r}")
+        start = DAYS.index(first)
+        count = (DAYS.index(last) - start) % 7 + 1 if last else 1
+        days.update((start + offset) % 7 for offset in range(count))
+    return frozenset(days)
+
+
+def desired_state_from_tag(tag_key: str, now=None, default=None):
+    """Build the function giving the state wanted for a resource.
+
+    :param str tag_key:
+        The tag holding the schedule of a resource.
+    :param datetime now:
+        The evaluation time, default now.
+    :param str default:
+        The schedule of the resources without the tag, default
+        leave them as they are.
+
+    :return callable:
+        Function taking the tag dict of a resource and returning
+        RUNNING, STOPPED, or None when the resource has no valid
+        schedule.
+    """
+    now = now or datetime.now(timezone.utc)
+    states = {}
+
+    def _desired_state(tags: dict):
+        text = tags.get(tag_key) or default
+        if not text:
+            return None
+        if text not in states:
+            try:
+                states[text] = RUNNING if parse_schedule(text).is_active(now) else STOPPED
+            except ValueError as exc:
+                logging.error(f"{exc}")
+                states[text] = None
+        return states[text]
+
+    return _desired_state
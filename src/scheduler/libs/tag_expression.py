@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+"""Boolean tag expressions used to select aws resources.
+
+An expression combines tag terms with AND, OR, NOT and parentheses:
+
+    env=prod|staging AND NOT keep-alive AND (team=web-* OR owner)
+
+- ``key`` matches resources with the tag key, whatever its value.
+- ``key=a|b`` matches resources with one of the tag values.
+- ``key!=a|b`` matches resources without one of the tag values.
+- Values accept glob wildcards (``*``, ``?`` and ``[seq]``).
+- Keys and values with spaces or reserved characters can be quoted
+  with double quotes.
+
+Expressions are compiled once into a predicate on the tag dict of a
+resource. The terms of the top-level AND which the resource groups
+tagging api understands are also pushed down as TagFilters, so the api
+returns fewer resources to evaluate.
+"""
+
+import re
+from fnmatch import fnmatchcase
+
+from .warm_cache import WarmCache
+
+# Compiled tag selections, kept by warm lambdas.
+TAG_PREDICATES = WarmCache("tag_predicates", ttl=3600, max_size=64)
+
+_TOKEN = re.compile(
+    r'\s*(?:(?P<paren>[()])|(?P<op>!=|=)|(?P<pipe>\|)'
+    r'|"(?P<quoted>[^"]*)"|(?P<word>[^\s()=!|"]+))'
+)
+_KEYWORDS = ("AND", "OR", "NOT")
+_GLOB_CHARS = ("*", "?", "[")
+
+
+class TagExpression:
+    """Abstract compiled tag expression in a class."""
+
+    __slots__ = ("text", "tag_filters", "_predicate")
+
+    def __init__(self, text: str, predicate, tag_filters: list[dict]) -> None:
+        """Initialize compiled tag expression.
+
+        :param str text:
+            The source of the expression.
+        :param callable predicate:
+            Function returning True when a tag dict matches.
+        :param list[map] tag_filters:
+            The TagFilters pushed down to the tagging api.
+        """
+        self.text = text
+        self.tag_filters = tag_filters
+        self._predicate = predicate
+
+    def matches(self, tags: dict) -> bool:
+        """Evaluate the expression on the tags of a resource.
+
+        :param dict tags:
+            The resource tags, as a key/value dict.
+        """
+        return self._predicate(tags)
+
+    def __repr__(self) -> str:
+        """Return the expression source."""
+        return f"TagExpression({self.text!r})"
+
+
+def compile_tags(aws_tags) -> TagExpression:
+    """Compile the tag selection given to a scheduler.
+
+    :param aws_tags:
+        Either a tag expression string, a compiled TagExpression or a
+        list of TagFilters. For example:
+        [
+            {
+                'Key': 'string',
+                'Values': [
+                    'string',
+                ]
+            },
+        ]
+
+    :raises ValueError:
+        The tag expression is invalid.
+    """
+    if isinstance(aws_tags, TagExpression):
+        return aws_tags
+    if isinstance(aws_tags, str):
+        return parse_tag_expression(aws_tags)
+    return _from_tag_filters(
+        tuple((tag["Key"], tuple(tag.get("Values") or ())) for tag in aws_tags)
+    )
+
+
+@TAG_PREDICATES.cached
+def _from_tag_filters(tag_filters: tuple) -> TagExpression:
+    """Compile TagFilters, an AND of keys matching one of their values."""
+    node = ("and", [("tag", key, values or None, False) for key, values in tag_filters])
+    text = " AND ".join(
+        f"{key}={'|'.join(values)}" if values else key for key, values in tag_filters
+    )
+    return TagExpression(text, _compile(node), _push_down(node))
+
+
+@TAG_PREDICATES.cached
+def parse_tag_expression(text: str) -> TagExpression:
+    """Parse and compile a tag expression.
+
+    :param str text:
+        The tag expression, for example ``env=prod AND NOT keep-alive``.
+
+    :raises ValueError:
+        The tag expression is invalid.
+    """
+    parser = _Parser(_tokenize(text))
+    node = parser.parse_or()
+    if parser.peek() is not None:
+        raise ValueError(f"Invalid tag expression {text!r}: unexpected {parser.peek()[1]!r}")
+    return TagExpression(text, _compile(node), _push_down(node))
+
+
+def _tokenize(text: str) -> list[tuple]:
+    """Split a tag expression into (kind, value) tokens."""
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if not match or match.end() == position:
+            raise ValueError(f"Invalid tag expression {text!r} at position {position}")
+        position = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "word" and value in _KEYWORDS:
+            kind = "keyword"
+        elif kind == "quoted":
+            kind = "word"
+        tokens.append((kind, value))
+    return tokens
+
+
+class _Parser:
+    """Recursive descent parser of tag expressions."""
+
+    def __init__(self, tokens: list[tuple]) -> None:
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def next(self, kind: str, value=None) -> str:
+        token = self.peek()
+        if token is None or token[0] != kind or (value and token[1] != value):
+            found = token[1] if token else "end of expression"
+            raise ValueError(f"Invalid tag expression: expected {value or kind}, found {found!r}")
+        self.position += 1
+        return token[1]
+
+    def accept(self, kind: str, value=None) -> bool:
+        token = self.peek()
+        if token and token[0] == kind and (value is None or token[1] == value):
+            self.position += 1
+            return True
+        return False
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.accept("keyword", "OR"):
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def parse_and(self):
+        nodes = [self.parse_not()]
+        while self.accept("keyword", "AND"):
+            nodes.append(self.parse_not())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def parse_not(self):
+        if self.accept("keyword", "NOT"):
+            return ("not", self.parse_not())
+        if self.accept("paren", "("):
+            node = self.parse_or()
+            self.next("paren", ")")
+            return node
+        return self.parse_term()
+
+    def parse_term(self):
+        key = self.next("word")
+        token = self.peek()
+        if not token or token[0] != "op":
+            return ("tag", key, None, False)
+        self.position += 1
+        values = [self.next("word")]
+        while self.accept("pipe"):
+            values.append(self.next("word"))
+        return ("tag", key, tuple(values), token[1] == "!=")
+
+
+def _compile(node):
+    """Compile a parsed expression node into a predicate on a tag dict."""
+    kind = node[0]
+    if kind == "and":
+        predicates = [_compile(child) for child in node[1]]
+        return lambda tags: all(predicate(tags) for predicate in predicates)
+    if kind == "or":
+        predicates = [_compile(child) for child in node[1]]
+        return lambda tags: any(predicate(tags) for predicate in predicates)
+    if kind == "not":
+        predicate = _compile(node[1])
+        return lambda tags: not predicate(tags)
+
+    _, key, values, negate = node
+    if values is None:
+        return lambda tags: key in tags
+    exact = frozenset(value for value in values if not _is_glob(value))
+    patterns = tuple(value for value in values if _is_glob(value))
+
+    def _match(tags):
+        value = tags.get(key)
+        found = value is not None and (
+            value in exact or any(fnmatchcase(value, pattern) for pattern in patterns)
+        )
+        return found != negate
+
+    return _match
+
+
+def _push_down(node) -> list[dict]:
+    """Extract the TagFilters equivalent to the top-level AND terms."""
+    terms = node[1] if node[0] == "and" else [node]
+    tag_filters = []
+    for term in terms:
+        if term[0] != "tag" or term[3]:
+            continue
+        _, key, values, _ = term
+        if values is None:
+            tag_filters.append({"Key": key})
+        elif not any(_is_glob(value) for value in values):
+            tag_filters.append({"Key": key, "Values": list(values)})
+    return tag_filters
+
+
+def _is_glob(value: str) -> bool:
+    """Return True when a tag value contains glob wildcards."""
+    return any(char in value for char in _GLOB_CHARS)
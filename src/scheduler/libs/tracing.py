@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+"""Tracing spans of the scheduler runs.
+
+With the TRACING environment variable, lambda_handler opens a span for
+the invocation, one for each account, one for each service scheduler
+of a region and one for the discovery and the action of each batch of the
+schedulers. The spans follow the work in the worker threads, see
+propagate.
+
+- memory keeps the spans in TRACER.spans, for the tests.
+- file appends the spans as NDJSON lines to TRACING_FILE.
+- xray sends the spans as X-Ray subsegments, with the boto calls
+  captured by the aws-xray-sdk patch. The aws-xray-sdk package must
+  be shipped with the lambda and its active tracing enabled.
+
+The local exporters log the critical path of the invocation, the
+chain of the spans ending last, to find what a concurrent run waits.
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import partial
+
+try:
+    from aws_xray_sdk.core import patch, xray_recorder
+except ImportError:
+    xray_recorder = None
+
+TRACING_MODES = ("", "memory", "file", "xray")
+
+_CURRENT_SPAN = contextvars.ContextVar("scheduler_span", default=None)
+
+
+class Span:
+    """Abstract timed step of a scheduler run in a class."""
+
+    __slots__ = ("name", "span_id", "parent_id", "attributes", "start", "end", "entity")
+
+    def __init__(self, name: str, parent_id=None, attributes=None) -> None:
+        """Initialize started span.
+
+        :param str name:
+            The span name, for example lambda_handler or ec2 eu-west-1.
+        :param str parent_id:
+            The id of the enclosing span, None for the root span.
+        :param dict attributes:
+            The searchable values of the span, like its region.
+        """
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.start = time.time()
+        self.end = None
+        # X-Ray segment or subsegment of the span
+        self.entity = None
+
+    @property
+    def duration(self) -> float:
+        """Return the seconds between the start and the end of the span."""
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self) -> dict:
+        """Return the span fields exported."""
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "attributes": self.attributes,
+            "start": self.start,
+            "end": self.end,
+        }
+
+
+class Tracer:
+    """Abstract span recorder and exporter in a class."""
+
+    def __init__(self) -> None:
+        """Initialize disabled tracer."""
+        self.mode = ""
+        self.path = None
+        self.spans = []
+        self._patched = False
+        self._lock = threading.Lock()
+
+    def configure(self, mode="", path=None) -> None:
+        """Select the exporter of the spans.
+
+        :param str mode:
+            memory, file, xray, or an empty string to disable tracing.
+        :param str path:
+            The NDJSON file of the file exporter.
+
+        :raises ValueError:
+            The mode is unknown or the file exporter has no path.
+        :raises ImportError:
+            The aws-xray-sdk package is not installed.
+        """
+        if mode not in TRACING_MODES:
+            raise ValueError(f"Unknown tracing mode {mode}, expected one of {TRACING_MODES}")
+        if mode == "file" and not path:
+            raise ValueError("The file tracing mode requires TRACING_FILE")
+        if mode == "xray":
+            if xray_recorder is None:
+                raise ImportError("The xray tracing mode requires the aws-xray-sdk package")
+            if not self._patched:
+                # boto calls become subsegments of the current span
+                patch(("botocore",))
+                self._patched = True
+        self.mode = mode
+        self.path = path
+        with self._lock:
+            self.spans = []
+
+    @property
+    def enabled(self) -> bool:
+        """Return True when the spans are recorded."""
+        return bool(self.mode)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Record the block as a child span of the current span.
+
+        :param str name:
+            The span name.
+        :param attributes:
+            The searchable values of the span, strings, numbers or
+            booleans.
+
+        :yield Span:
+            The span, None when tracing is disabled.
+        """
+        if not self.mode:
+            yield None
+            return
+        parent = _CURRENT_SPAN.get()
+        span = Span(name, parent.span_id if parent else None, attributes)
+        if self.mode == "xray":
+            span.entity = self._begin_entity(span, parent)
+        token = _CURRENT_SPAN.set(span)
+        try:
+            yield span
+        except Exception as err:
+            span.attributes["error"] = type(err).__name__
+            if span.entity is not None:
+                span.entity.add_exception(err, [])
+            raise
+        finally:
+            _CURRENT_SPAN.reset(token)
+            span.end = time.time()
+            self._export(span, parent)
+
+    def _begin_entity(self, span, parent):
+        if parent is not None and parent.entity is not None:
+            # Worker threads continue the trace of the span which started them
+            xray_recorder.set_trace_entity(parent.entity)
+        if _is_local_root(parent):
+            entity = xray_recorder.begin_segment(span.name)
+        else:
+            entity = xray_recorder.begin_subsegment(span.name)
+        if entity is not None:
+            for key, value in span.attributes.items():
+                if isinstance(value, (str, int, float, bool)):
+                    entity.put_annotation(key, value)
+        return entity
+
+    def _export(self, span, parent) -> None:
+        if span.entity is not None:
+            # The thread may have traced other spans since this one began
+            xray_recorder.set_trace_entity(span.entity)
+            if _is_local_root(parent):
+                xray_recorder.end_segment()
+            else:
+                xray_recorder.end_subsegment()
+        with self._lock:
+            self.spans.append(span)
+            if self.mode == "file":
+                with open(self.path, "a") as trace_file:
+                    trace_file.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+    def critical_path(self) -> list[Span]:
+        """Return the chain of spans ending last from the last root span."""
+        with self._lock:
+            spans = list(self.spans)
+        children = {}
+        for span in spans:
+            children.setdefault(span.parent_id, []).append(span)
+        path = []
+        candidates = children.get(None, [])
+        while candidates:
+            span = max(candidates, key=lambda item: item.end or 0)
+            path.append(span)
+            candidates = children.get(span.span_id, [])
+        return path
+
+
+def _is_local_root(parent) -> bool:
+    """Return True for a root span outside lambda, without X-Ray segment."""
+    return parent is None and not os.getenv("AWS_LAMBDA_FUNCTION_NAME")
+
+
+# Tracer of the invocations, configured by main.lambda_handler.
+TRACER = Tracer()
+
+
+def span(name: str, **attributes):
+    """Record a block as a span of the invocation tracer, see Tracer.span."""
+    return TRACER.span(name, **attributes)
+
+
+def propagate(function):
+    """Return the function running in the context of the caller.
+
+    Threads don't inherit the context variables, like the current span
+    or the account of the recorded errors, the functions given to a
+    worker thread or an executor are wrapped when they are submitted.
+
+    :param callable function:
+        The function run by another thread.
+    """
+    return partial(contextvars.copy_context().run, function)
@@ -1,35 +1,92 @@
 """Autoscaling instances scheduler."""
 
+import logging
+import time
 from typing import List
 
-import boto3
-from botocore.exceptions import ClientError
+from botocore.exceptions import ClientError, WaiterError
+
 from ..ec2.exceptions import ec2_exception
+from .aws_sessions import get_client
+from .deadline import wait_budget
+
 
 class AwsWaiters:
     """Abstract aws waiter in a class."""
 
-    def __init__(self, region_name=None) -> None:
+    def __init__(self, region_name=None, session=None) -> None:
         """Initialize aws waiter."""
-        if region_name:
-            self.ec2 = boto3.client("ec2", region_name=region_name)
-        else:
-            self.ec2 = boto3.client("ec2")
+        self.ec2 = get_client("ec2", region_name, session)
 
     def instance_running(self, instance_ids: list[str]) -> None:
         """Aws waiter for instance running.
 
-        Wait ec2 instances are in running state.
+        Wait ec2 instances are in running state, at most the time left
+        before the invocation deadline, see libs.deadline.
 
         :param list instance_ids:
             The instance IDs to wait.
         """
         if instance_ids:
             instance_waiter = self.ec2.get_waiter("instance_running")
+            max_attempts = int(wait_budget(60 * 5) // 60)
+            if not max_attempts:
+                logging.error(f"instances {instance_ids} not waited, deadline reached")
+                return
             try:
                 instance_waiter.wait(
                     InstanceIds=instance_ids,
-                    WaiterConfig={"Delay": 60, "MaxAttempts": 5},
+                    WaiterConfig={"Delay": 60, "MaxAttempts": max_attempts},
                 )
             except ClientError as exc:
-                ec2_exception("waiter", instance_waiter, exc)
+                ec2_exception("waiter", instance_waiter, exc, self.ec2.meta.region_name)
+            except WaiterError as exc:
+                logging.error(f"instances {instance_ids} not running: {exc}")
+
+    def instance_running_times(
+        self, started_at: dict, delay=5, timeout=300, sleep=time.sleep
+    ) -> dict:
+        """Wait ec2 instances are running and measure their start time.
+
+        Each poll describes all the pending instances, in chunks of
+        100 instance ids.
+
+        :param dict started_at:
+            The epoch time of the start request of each instance id.
+        :param int delay:
+            Seconds between two polls.
+        :param int timeout:
+            Seconds after which the pending instances are reported.
+
+        :return dict:
+            The seconds to running of each running instance id.
+        """
+        pending = dict(started_at)
+        running_times = {}
+        deadline = time.monotonic() + timeout
+        while pending:
+            pending_ids = list(pending)
+            for i in range(0, len(pending_ids), 100):
+                try:
+                    reservations = self.ec2.describe_instances(
+                        InstanceIds=pending_ids[i:i + 100]
+                    )["Reservations"]
+                except ClientError as exc:
+                    ec2_exception(
+                        "instances", ",".join(pending_ids[i:i + 100]), exc, self.ec2.meta.region_name
+                    )
+                    continue
+                for reservation in reservations:
+                    for instance in reservation["Instances"]:
+                        instance_id = instance["InstanceId"]
+                        if instance["State"]["Name"] == "running" and instance_id in pending:
+                            elapsed = round(time.time() - pending.pop(instance_id), 1)
+                            running_times[instance_id] = elapsed
+                            print(f"Instance {instance_id} running after {elapsed}s")
+            if not pending:
+                break
+            if time.monotonic() + delay > deadline:
+                logging.error(f"instances {sorted(pending)} not running")
+                break
+            sleep(delay)
+        return running_times
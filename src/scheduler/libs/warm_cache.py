@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+"""Caches kept between the invocations of a warm lambda.
+
+A lambda container serves many invocations, the caches created at
+module level keep the aws clients, the exclusion lists and the
+compiled tag selections from one invocation to the next. Each cache
+has its own time to live and size bound, all of them are invalidated
+when the configuration of the lambda changes, see configure_caches.
+The hits and misses of the running invocation are reported by
+cache_metrics.
+
+The resource states are not cached, the schedulers read them again on
+every invocation.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Caches created by the modules, by name.
+CACHES = {}
+
+_FINGERPRINT = {"value": None}
+
+
+class WarmCache:
+    """Abstract bounded cache with expiring entries in a class."""
+
+    def __init__(self, name: str, ttl: float, max_size: int) -> None:
+        """Initialize empty warm cache and register it in CACHES.
+
+        :param str name:
+            The cache name reported in the metrics.
+        :param float ttl:
+            Number of seconds an entry is kept, 0 disables the cache.
+        :param int max_size:
+            Maximum number of entries, the least recently used entry
+            is evicted first.
+        """
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        CACHES[name] = self
+
+    def get(self, key, factory):
+        """Return the cached value of a key, created by factory when missing.
+
+        :param key:
+            The hashable key of the value.
+        :param callable factory:
+            Function without argument creating the value.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        value = factory()
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[key] = (value, now + self.ttl)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return value
+
+    def cached(self, function):
+        """Decorate a function of hashable arguments with the cache."""
+
+        def wrapper(*args):
+            return self.get((function.__name__, args), lambda: function(*args))
+
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        wrapper.cache = self
+        return wrapper
+
+    def items(self) -> list:
+        """Return the keys and values of the entries not expired."""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                (key, value)
+                for key, (value, expires_at) in self._entries.items()
+                if expires_at > now
+            ]
+
+    def resize(self, max_size: int) -> None:
+        """Change the maximum number of entries.
+
+        :param int max_size:
+            The new maximum number of entries, the least recently
+            used entries above it are evicted.
+        """
+        with self._lock:
+            self.max_size = max_size
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        """Remove all the entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def reset_metrics(self) -> None:
+        """Reset the hit and miss counters."""
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def __len__(self) -> int:
+        """Return the number of entries."""
+        with self._lock:
+            return len(self._entries)
+
+
+def invalidate_caches() -> None:
+    """Remove the entries of all the caches."""
+    for cache in CACHES.values():
+        cache.invalidate()
+
+
+def configure_caches(config) -> bool:
+    """Start the metrics of an invocation and check its configuration.
+
+    :param config:
+        The json serializable configuration the cached values depend
+        on, like the configuration loaded by libs.event_config.
+
+    :return bool:
+        True when the configuration changed and the caches were
+        invalidated.
+    """
+    fingerprint = hashlib.sha256(
+        json.dumps(config, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    for cache in CACHES.values():
+        cache.reset_metrics()
+    changed = _FINGERPRINT["value"] not in (None, fingerprint)
+    if changed:
+        invalidate_caches()
+    _FINGERPRINT["value"] = fingerprint
+    return changed
+
+
+def cache_metrics() -> dict:
+    """Return the hits, misses and size of each cache since configure_caches."""
+    return {
+        name: {"hits": cache.hits, "misses": cache.misses, "size": len(cache)}
+        for name, cache in CACHES.items()
+    }
@@ -1,7 +1,12 @@
 """This script stop and start aws resources."""
 import logging
 import os
-from distutils.util import strtobool
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+
+from botocore.exceptions import ClientError
 
 import requests
 import validators
@@ -11,7 +16,54 @@ from .cloudwatch.handler import CloudWatchAlarmScheduler
 from .ec2.handler import InstanceScheduler
 from .ecs.handler import EcsScheduler
 from .rds.handler import RdsScheduler
+from .libs.async_engine import SERVICE_RESOURCES, AsyncScheduler
 from .libs.aws_secrets_manager import GetExceptionSecrets
+from .libs.api_calls import count_api_calls
+from .libs.aws_sessions import (
+    AssumeRoleSessions,
+    account_id_from_role_arn,
+    size_clients,
+)
+from .libs.deadline import DEFAULT_SAFETY_MARGIN, Deadline, set_deadline, wait_budget
+from .libs.error_classifier import ERRORS, account_errors, failed_accounts, retry_units
+from .libs.event_config import SERVICE_NAMES, load_config
+from .libs.lambda_invoker import invoke_async
+from .libs.orchestrator import build_waves, run_waves
+from .libs.run_report import RunReport
+from .libs.schedule_window import desired_state_from_tag
+from .libs.tracing import TRACER, propagate, span
+from .libs.warm_cache import WarmCache, cache_metrics, configure_caches
+
+SCHEDULERS = {
+    "autoscaling": AutoscalingScheduler,
+    "ec2": InstanceScheduler,
+    "ecs": EcsScheduler,
+    "rds": RdsScheduler,
+    "cloudwatch_alarm": CloudWatchAlarmScheduler,
+}
+
+# Actions implemented by another scheduler method.
+ACTION_METHODS = {"schedule": "reconcile", "reconcile": "reconcile"}
+
+# Maximum number of invocations chained to finish a run.
+MAX_CHECKPOINT_ATTEMPTS = 10
+
+# Maximum number of invocations retrying the resources with retry
+# errors, and seconds waited before the first retry, doubled after.
+MAX_RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 5
+
+# Event keys of the chained invocations, the progress of a run and not
+# its configuration, left out of the warm caches fingerprint.
+RUN_PROGRESS_KEYS = ("checkpoint", "started_at", "attempt")
+
+# Kept at module level to reuse the assumed role credentials
+# between invocations of a warm lambda.
+ASSUMED_ROLE_SESSIONS = AssumeRoleSessions()
+
+# Instance ids read from EXCLUDE_EC2_IDS_FROM_URL, by url.
+EXCLUSIONS = WarmCache("exclusions", ttl=300, max_size=8)
+
 
 def lambda_handler(event, context):
     """Main function entrypoint for lambda.
@@ -25,23 +77,286 @@ def lambda_handler(event, context):
     Suspend and resume AWS resources:
     - ec2 autoscaling groups
 
-    Terminate spot instances (spot instance cannot be stopped by a user)
+    Stop or hibernate the spot instances of persistent requests,
+    terminate the other spot instances and cancel their requests
+
+    The action, regions, services, tags and exclude list are read from
+    the lambda environment and can be overridden by the event payload,
+    see libs.event_config.validate_event.
+
+    Services are scheduled in waves following their dependencies, see
+    libs.orchestrator: databases are started first and stopped last.
+    With RDS_READINESS_FOLLOW_UP, started rds databases are not waited,
+    a follow-up invocation with the track action reports their time
+    to available.
+
+    With SCHEDULER_ENGINE=async, the ecs and cloudwatch alarm actions
+    run on the asyncio engine of libs.async_engine.
+
+    The schedule action stops or starts the resources with a schedule
+    tag, like Europe/Paris 08:00-20:00 MON-FRI, whose state differs
+    from their time window, see libs.schedule_window. The reconcile
+    action does the same for the resources matching the scheduler tags,
+    those without a schedule tag follow RECONCILE_WINDOW. Both only send
+    the calls needed to converge, the number of mutating api calls of
+    each account is logged.
+
+    The mutating api calls of the run are recorded in a report written
+    as gzipped NDJSON to RUN_REPORT_BUCKET, or RUN_REPORT_DIR for local
+    runs, see libs.run_report.
+
+    When ASSUME_ROLE_ARNS is defined, the resources of each account are
+    scheduled in parallel through the assumed roles and a status is
+    returned per account.
+
+    Errors on the resources are classified and logged in a summary at
+    the end of the invocation, see libs.error_classifier. The resources
+    with retry errors are scheduled again by a checkpoint invocation,
+    waiting RETRY_BASE_DELAY seconds doubled on each of the
+    MAX_RETRY_ATTEMPTS retries. Errors with the fail action mark their
+    account failed, or the invocation without assume roles.
+
+    The work stops DEADLINE_SAFETY_MARGIN seconds before the lambda
+    timeout, the unfinished regions and services are scheduled by a
+    new invocation, see request_checkpoint.
+
+    A warm lambda reuses its aws clients, exclusion lists and compiled
+    tag selections, until they expire or the loaded configuration
+    changes, see libs.warm_cache.
+
+    With TRACING, the invocation, accounts, service schedulers and
+    their batches are recorded as spans, see libs.tracing.
+    """
+    TRACER.configure(os.getenv("TRACING", ""), os.getenv("TRACING_FILE"))
+    config = load_config(event)
+    run_config = {
+        key: value for key, value in config.items() if key not in RUN_PROGRESS_KEYS
+    }
+    if configure_caches(run_config):
+        print("Lambda configuration changed, warm caches invalidated")
+    if config["exclude"] is None:
+        config["exclude"] = get_excluded_ids()
+    started_at = time.time()
+    report = RunReport(config["action"], run_id=getattr(context, "aws_request_id", None))
+
+    role_arns = [
+        role_arn
+        for role_arn in os.getenv("ASSUME_ROLE_ARNS", "").replace(" ", "").split(",")
+        if role_arn
+    ]
+    if config.get("checkpoint") is not None:
+        # Only the accounts with unfinished work are scheduled again
+        checkpoint_accounts = {unit.get("account") for unit in config["checkpoint"]}
+        role_arns = [
+            role_arn
+            for role_arn in role_arns
+            if account_id_from_role_arn(role_arn) in checkpoint_accounts
+        ]
+    size_clients(len(role_arns) or 1, len(config["regions"]), len(config["services"]))
+    safety_margin = int(os.getenv("DEADLINE_SAFETY_MARGIN", str(DEFAULT_SAFETY_MARGIN)))
+    set_deadline(Deadline(context, safety_margin))
+    retry = max(
+        (unit.get("retry", 0) for unit in config.get("checkpoint") or []), default=0
+    )
+    if retry:
+        # Backoff of the resources with retry errors, like throttled calls
+        time.sleep(wait_budget(RETRY_BASE_DELAY * 2 ** (retry - 1)))
+    result = None
+    with span("lambda_handler", action=config["action"]):
+        try:
+            if not role_arns:
+                account_id = ""
+                if context is not None:
+                    account_id = context.invoked_function_arn.split(":")[4]
+                unfinished = schedule_account(None, config, report, account_id)["unfinished"]
+            else:
+                max_workers = int(os.getenv("ACCOUNTS_MAX_CONCURRENCY", "5"))
+                result = {"accounts": schedule_accounts(role_arns, max_workers, config, report)}
+                unfinished = [
+                    unit
+                    for status in result["accounts"].values()
+                    for unit in status.get("unfinished", [])
+                ]
+        finally:
+            set_deadline(Deadline())
+            # One line per error class instead of one per resource
+            errors = ERRORS.flush()
+    if TRACER.mode in ("memory", "file"):
+        print(
+            "Critical path: "
+            + " > ".join(f"{item.name} {item.duration:.2f}s" for item in TRACER.critical_path())
+        )
+    metrics = cache_metrics()
+    print(
+        "Warm caches: "
+        + ", ".join(
+            f"{name} {item['hits']} hits {item['misses']} misses" for name, item in metrics.items()
+        )
+    )
+    failures = failed_accounts(errors)
+    if result is not None:
+        result["errors"] = errors
+        result["cache"] = metrics
+        for account_id, count in failures.items():
+            if account_id in result["accounts"]:
+                result["accounts"][account_id]["status"] = "failed"
+                result["accounts"][account_id]["error"] = f"{count} resource errors"
+    elif failures:
+        result = {"status": "failed", "errors": errors}
+        logging.error(
+            f"{sum(failures.values())} resource errors, see the errors summary"
+        )
+    write_run_report(report)
+
+    unfinished += retried_units(config, errors, unfinished)
+
+    if unfinished:
+        request_checkpoint(context, config, unfinished)
+
+    if config["action"] == "start" and config["rds_follow_up"] and "rds" in config["services"]:
+        request_rds_follow_up(context, config, started_at)
+    return result
+
+
+def retried_units(config, errors, unfinished):
+    """Return the checkpoint units retrying the resources of retry errors.
+
+    Only the resources with retry errors are scheduled again, at most
+    MAX_RETRY_ATTEMPTS times. Units already unfinished are scheduled
+    again whole.
+
+    :param dict config:
+        The configuration of the current invocation.
+    :param list[dict] errors:
+        The errors summary of the invocation, see libs.error_classifier.
+    :param list[dict] unfinished:
+        The account, region and service of the unfinished work.
+    """
+    previous = {
+        (unit.get("account", ""), unit["service"], unit["region"]): unit.get("retry", 0)
+        for unit in config.get("checkpoint") or []
+    }
+    scheduled = {
+        (unit["account"], unit["service"], unit["region"]) for unit in unfinished
+    }
+    units = []
+    for unit in retry_units(errors):
+        key = (unit["account"], unit["service"], unit["region"])
+        if unit["service"] not in config["services"] or key in scheduled:
+            continue
+        retry = previous.get(key, 0) + 1
+        if retry > MAX_RETRY_ATTEMPTS:
+            logging.error(
+                f"{unit['service']} {unit['region']} {unit['account']} resources not "
+                f"retried after {MAX_RETRY_ATTEMPTS} attempts: {unit['resource_ids']}"
+            )
+            continue
+        units.append({**unit, "cursors": {}, "retry": retry})
+    return units
+
+
+def request_rds_follow_up(context, config, started_at):
+    """Invoke the lambda again to track the readiness of started rds.
+
+    The start invocation returns without waiting the databases, the
+    follow-up invocation reports their time to available.
+
+    :param context:
+        The lambda context of the start invocation.
+    :param dict config:
+        The configuration of the start invocation.
+    :param float started_at:
+        Epoch time of the start invocation.
     """
-    # Retrieve variables from aws lambda ENVIRONMENT
-    schedule_action = os.getenv("SCHEDULE_ACTION")
-    aws_regions = os.getenv("AWS_REGIONS").replace(" ", "").split(",")
-    format_tags = [{"Key": os.getenv("TAG_KEY"), "Values": [os.getenv("TAG_VALUE")]}]
+    payload = {
+        "action": "track",
+        "services": ["rds"],
+        "regions": config["regions"],
+        "exclude": config["exclude"],
+        "started_at": started_at,
+        **event_tags(config),
+    }
+    invoke_async(context.invoked_function_arn, payload)
+    print(f"Rds readiness follow-up requested on {context.invoked_function_arn}")
 
+
+def request_checkpoint(context, config, unfinished):
+    """Invoke the lambda again to schedule the unfinished work.
+
+    The checkpoint of the unfinished regions and services is kept in
+    the payload of the asynchronous invocation, queued and retried by
+    the lambda service. A run is chained on MAX_CHECKPOINT_ATTEMPTS
+    invocations at most.
+
+    :param context:
+        The lambda context of the current invocation.
+    :param dict config:
+        The configuration of the current invocation.
+    :param list[dict] unfinished:
+        The account, region and service of the unfinished work.
+    """
+    attempt = config.get("attempt", 0) + 1
+    if context is None or attempt > MAX_CHECKPOINT_ATTEMPTS:
+        logging.error(f"Unfinished {config['action']} after {attempt} invocations: {unfinished}")
+        return
+    payload = {
+        "action": config["action"],
+        "services": config["services"],
+        "regions": config["regions"],
+        "exclude": config["exclude"],
+        "dependencies": config["dependencies"],
+        "checkpoint": unfinished,
+        "attempt": attempt,
+        **event_tags(config),
+    }
+    for key in ("started_at", "reconcile_window"):
+        if config.get(key):
+            payload[key] = config[key]
+    invoke_async(context.invoked_function_arn, payload)
+    print(f"Checkpoint of {len(unfinished)} services requested on {context.invoked_function_arn}")
+
+
+def event_tags(config):
+    """Return the event keys of the tags of a configuration.
+
+    :param dict config:
+        The scheduler configuration, see libs.event_config.load_config.
+    """
+    if isinstance(config["tags"], str):
+        return {"tag_expression": config["tags"]}
+    return {"tags": config["tags"]}
+
+
+def write_run_report(report):
+    """Write the run report, its errors don't fail the run.
+
+    :param RunReport report:
+        The report of the invocation.
+    """
+    try:
+        location = report.write(
+            bucket=os.getenv("RUN_REPORT_BUCKET"), directory=os.getenv("RUN_REPORT_DIR")
+        )
+    except (ClientError, OSError) as err:
+        logging.error(f"Run report write error: {err}")
+        return
+    if location:
+        print(f"Run report written to {location}")
+
+
+def get_excluded_ids():
+    """Retrieve the resource ids to exclude from the lambda environment."""
     exclude_ec2_ids = []
 
     if os.getenv("EXCLUDE_EC2_IDS_FROM_URL", None) and validators.url(os.getenv("EXCLUDE_EC2_IDS_FROM_URL")):
-        req = requests.get(url=os.getenv("EXCLUDE_EC2_IDS_FROM_URL"), timeout=5)
-        if req.status_code == 200:
-            to_exclude_from_url = req.json()
+        url = os.getenv("EXCLUDE_EC2_IDS_FROM_URL")
+        try:
+            # Failed downloads are not cached and retried by the next invocation
+            to_exclude_from_url = EXCLUSIONS.get(url, lambda: fetch_excluded_ids(url))
             exclude_ec2_ids += to_exclude_from_url
             logging.info(f"Exclude Instances ids list through file : {to_exclude_from_url}")
-        else:
-            logging.error(f"Invalid url response from {os.getenv('EXCLUDE_EC2_IDS_FROM_URL')}: HTTP/{req.status_code}")
+        except ValueError as err:
+            logging.error(err)
 
     if os.getenv("EXCLUDE_EC2_IDS_STATICS", None):
         try:
@@ -63,16 +378,199 @@ def lambda_handler(event, context):
         except Exception as err:
             logging.error(f"Invalid json answer: {err}")
     '''
+    return exclude_ec2_ids
+
+
+def fetch_excluded_ids(url):
+    """Download the excluded instance ids of an url.
 
-    _strategy = {}
-    _strategy[AutoscalingScheduler] = os.getenv("AUTOSCALING_SCHEDULE")
-    _strategy[InstanceScheduler] = os.getenv("EC2_SCHEDULE")
-    _strategy[EcsScheduler] = os.getenv("ECS_SCHEDULE")
-    _strategy[RdsScheduler] = os.getenv("RDS_SCHEDULE")
-    _strategy[CloudWatchAlarmScheduler] = os.getenv("CLOUDWATCH_ALARM_SCHEDULE")
-
-    for service, to_schedule in _strategy.items():
-        if strtobool(to_schedule):
-            for aws_region in aws_regions:
-                strategy = service(aws_region)
-                getattr(strategy, schedule_action)(aws_tags=format_tags, to_exclude=exclude_ec2_ids)
+    :param str url:
+        The url of a json list of instance ids.
+
+    :raises ValueError:
+        The url doesn't answer a json document.
+    """
+    req = requests.get(url=url, timeout=5)
+    if req.status_code != 200:
+        raise ValueError(f"Invalid url response from {url}: HTTP/{req.status_code}")
+    return tuple(req.json())
+
+
+def schedule_accounts(role_arns, max_workers, config, report=None):
+    """Schedule aws resources of several accounts in parallel.
+
+    :param list[str] role_arns:
+        The iam roles to assume, one per aws account.
+    :param int max_workers:
+        Maximum number of accounts scheduled at the same time.
+    :param dict config:
+        The scheduler configuration, see libs.event_config.load_config.
+    :param RunReport report:
+        The report recording the actions of the accounts.
+
+    :return dict:
+        The scheduling status of each aws account id.
+    """
+    def _schedule(role_arn):
+        session = ASSUMED_ROLE_SESSIONS.get_session(role_arn)
+        return schedule_account(session, config, report, account_id_from_role_arn(role_arn))
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            account_id_from_role_arn(role_arn): executor.submit(propagate(_schedule), role_arn)
+            for role_arn in role_arns
+        }
+        for account_id, future in futures.items():
+            try:
+                status = future.result()
+            except Exception as err:
+                logging.error(f"Account {account_id}: {err}")
+                results[account_id] = {"status": "failed", "error": str(err)}
+            else:
+                results[account_id] = {
+                    "status": "incomplete" if status["unfinished"] else "success",
+                    **status,
+                }
+    return results
+
+
+def get_scheduler_class(service_name, action):
+    """Return the scheduler class of a service and action.
+
+    :param str service_name:
+        The scheduled service, one of SCHEDULERS.
+    :param str action:
+        The scheduler action.
+    """
+    if (
+        os.getenv("SCHEDULER_ENGINE", "thread") == "async"
+        and action in ("start", "stop")
+        and service_name in SERVICE_RESOURCES
+    ):
+        return partial(AsyncScheduler, service_name)
+    return SCHEDULERS[service_name]
+
+
+def schedule_account(session, config, report=None, account_id=""):
+    """Schedule the aws resources of one account.
+
+    :param boto3.session.Session session:
+        The session of the aws account, None to use the lambda account.
+    :param dict config:
+        The scheduler configuration, see libs.event_config.load_config.
+    :param RunReport report:
+        The report recording the actions, default no report.
+    :param str account_id:
+        The aws account id, written in the report.
+
+    :return dict:
+        The number of api calls changing the resources, the page
+        position of each discovery, and the unfinished regions and
+        services with their discovery cursors when the deadline is
+        reached.
+    """
+    # Services without the action, like track, are skipped
+    method = ACTION_METHODS.get(config["action"], config["action"])
+    services = [
+        service
+        for service in SERVICE_NAMES
+        if service in config["services"] and hasattr(SCHEDULERS[service], method)
+    ]
+    options = {
+        "autoscaling": {"mode": config["autoscaling_mode"]},
+        "ec2": {"stop_mode": config["ec2_stop_mode"]},
+        "rds": {"wait_available": not config["rds_follow_up"]},
+    }
+    kwargs = {"aws_tags": config["tags"], "to_exclude": config["exclude"]}
+    if config["action"] == "track":
+        kwargs["started_at"] = config.get("started_at")
+    if config["action"] == "schedule":
+        # Resources with a schedule tag are reconciled with their window
+        kwargs["aws_tags"] = [{"Key": config["schedule_tag"]}]
+        kwargs["desired_state"] = desired_state_from_tag(config["schedule_tag"])
+    if config["action"] == "reconcile":
+        # Resources without a schedule tag follow the reconcile window
+        kwargs["desired_state"] = desired_state_from_tag(
+            config["schedule_tag"], default=config["reconcile_window"]
+        )
+    pending = None
+    if config.get("checkpoint") is not None:
+        pending = {
+            (unit["service"], unit["region"]): unit
+            for unit in config["checkpoint"]
+            if unit.get("account", account_id) == account_id
+        }
+    # Schedulers create their clients once the calls are counted
+    recording = report.recording(session, account_id) if report else nullcontext()
+    with span("account", account=account_id), account_errors(account_id), \
+            count_api_calls(session) as counter, recording:
+        units, retries, waves = {}, {}, []
+        for wave in build_waves(services, config["dependencies"]):
+            schedulers = []
+            for service_name in wave:
+                for aws_region in config["regions"]:
+                    scheduler_options = {
+                        "page_size": config["page_size"],
+                        **options.get(service_name, {}),
+                    }
+                    retried = {}
+                    if pending is not None:
+                        if (service_name, aws_region) not in pending:
+                            continue
+                        unit = pending[(service_name, aws_region)]
+                        if unit.get("cursors"):
+                            # Discovery resumes from the last page of the interrupted sweep
+                            scheduler_options["cursors"] = unit["cursors"]
+                        if unit.get("resource_ids"):
+                            # Only the resources of retry errors are scheduled again
+                            scheduler_options["resource_ids"] = unit["resource_ids"]
+                            retried = {
+                                "resource_ids": unit["resource_ids"],
+                                "retry": unit.get("retry", 0),
+                            }
+                    scheduler = get_scheduler_class(service_name, config["action"])(
+                        aws_region, session=session, **scheduler_options
+                    )
+                    units[id(scheduler)] = {
+                        "account": account_id,
+                        "region": aws_region,
+                        "service": service_name,
+                    }
+                    retries[id(scheduler)] = retried
+                    schedulers.append(scheduler)
+            waves.append(schedulers)
+        unfinished = run_waves(
+            waves,
+            method,
+            max_workers=int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "10")),
+            labels=units,
+            **kwargs,
+        )
+    discovery = [
+        {**units[id(scheduler)], "resource_type": resource_type, **cursor.to_dict()}
+        for wave in waves
+        for scheduler in wave
+        for resource_type, cursor in getattr(scheduler, "cursors", {}).items()
+    ]
+    print(
+        f"{config['action'].capitalize()} listed {sum(item['items'] for item in discovery)} "
+        f"resources in {sum(item['pages'] for item in discovery)} pages "
+        f"and sent {counter.mutating_calls} mutating api calls"
+    )
+    return {
+        "mutating_calls": counter.mutating_calls,
+        "discovery": discovery,
+        "unfinished": [
+            {
+                **units[id(scheduler)],
+                **retries[id(scheduler)],
+                "cursors": {
+                    resource_type: cursor.token
+                    for resource_type, cursor in getattr(scheduler, "cursors", {}).items()
+                    if cursor.token
+                },
+            }
+            for scheduler in unfinished
+        ],
+    }
@@ -2,15 +2,19 @@
 
 """Exception function for all aws scheduler."""
 
-import logging
-
 from botocore.exceptions import ClientError
 
+from ..libs.error_classifier import record_error
+
 
-def rds_exception(resource_name: str, resource_id: str, exception: ClientError) -> None:
+def rds_exception(
+    resource_name: str, resource_id: str, exception: ClientError, region_name=None
+) -> None:
     """Exception raised during execution of rds scheduler.
 
-    Log rds exceptions on the specific aws resources.
+    Count the rds exceptions on the specific aws resources, they
+    are logged in a summary at the end of the invocation, see
+    libs.error_classifier.
 
     :param str resource_name:
         Aws resource name
@@ -18,28 +22,7 @@ def rds_exception(resource_name: str, resource_id: str, exception: ClientError)
         Aws resource id
     :param str exception:
         Human-readable string describing the exception
+    :param str region_name:
+        Aws region of the resource
     """
-    info_codes = ["InvalidParameterCombination", "DBClusterNotFoundFault"]
-    warning_codes = ["InvalidDBClusterStateFault", "InvalidDBInstanceState"]
-
-    if exception.response["Error"]["Code"] in info_codes:
-        logging.info(
-            "%s %s: %s",
-            resource_name,
-            resource_id,
-            exception,
-        )
-    elif exception.response["Error"]["Code"] in warning_codes:
-        logging.warning(
-            "%s %s: %s",
-            resource_name,
-            resource_id,
-            exception,
-        )
-    else:
-        logging.error(
-            "Unexpected error on %s %s: %s",
-            resource_name,
-            resource_id,
-            exception,
-        )
+    record_error("rds", resource_name, resource_id, exception, region_name)
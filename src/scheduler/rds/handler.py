@@ -1,28 +1,86 @@
 """rds instances scheduler."""
 
+import logging
 from typing import Dict, List
 
-import boto3
 from botocore.exceptions import ClientError
-from scheduler.rds.exceptions import rds_exception
-from scheduler.libs.filter_resources_by_tags import FilterByTags
+
+from ..libs.aws_sessions import get_client
+from ..libs.filter_resources_by_tags import FilterByTags
+from ..libs.schedule_window import RUNNING, STOPPED
+from .exceptions import rds_exception
+from .readiness import RdsReadinessTracker
+
+# Classes of the rds instances, see classify_db_instance.
+STANDALONE = "standalone"
+CLUSTER_MEMBER = "cluster-member"
+REPLICA = "replica"
+
+# Status of the databases accepting each action.
+EXPECTED_STATUS = {"stop": "available", "start": "stopped"}
+
+
+def classify_db_instance(db: dict) -> str:
+    """Return the scheduling class of an rds instance.
+
+    Cluster members can only be stopped with their cluster, read
+    replicas and instances with read replicas cannot be stopped.
+
+    :param dict db:
+        The instance returned by describe_db_instances.
+    """
+    if db.get("DBClusterIdentifier"):
+        return CLUSTER_MEMBER
+    if db.get("ReadReplicaSourceDBInstanceIdentifier") or db.get(
+        "ReadReplicaDBInstanceIdentifiers"
+    ):
+        return REPLICA
+    return STANDALONE
 
 
 class RdsScheduler:
     """Abstract rds scheduler in a class."""
 
-    def __init__(self, region_name=None) -> None:
-        """Initialize rds scheduler."""
-        if region_name:
-            self.rds = boto3.client("rds", region_name=region_name)
-        else:
-            self.rds = boto3.client("rds")
-        self.tag_api = FilterByTags(region_name=region_name)
+    def __init__(
+        self,
+        region_name=None,
+        session=None,
+        wait_available=True,
+        page_size=None,
+        cursors=None,
+        resource_ids=None,
+    ) -> None:
+        """Initialize rds scheduler.
+
+        :param bool wait_available:
+            Wait the started databases are available before the next
+            scheduling wave, False when a follow-up invocation tracks
+            their readiness.
+        :param int page_size:
+            The number of tagged resources listed per page.
+        :param dict cursors:
+            The page token to resume a resource type listing from, see
+            libs.filter_resources_by_tags.FilterByTags.
+        :param list[str] resource_ids:
+            Only schedule these resources, default all the tagged ones.
+        """
+        self.rds = get_client("rds", region_name, session)
+        self.tag_api = FilterByTags(
+            region_name, session, page_size, cursors, resource_ids
+        )
+        # Discovery position of each listed resource type
+        self.cursors = self.tag_api.cursors
+        self.readiness = RdsReadinessTracker(region_name=region_name, session=session)
+        self.wait_available = wait_available
+        self.started_instances = []
+        self.started_clusters = []
 
-    def stop(self, aws_tags: list[dict]) -> None:
+    def stop(self, aws_tags: list[dict], to_exclude=None) -> None:
         """Aws rds cluster and instance stop function.
 
         Stop rds aurora clusters and rds db instances with defined tags.
+        Tagged cluster members stop their cluster, read replicas and
+        serverless v1 clusters, which cannot be stopped, are skipped.
 
         :param list[map] aws_tags:
             Aws tags to use for filter resources.
@@ -36,28 +94,14 @@ class RdsScheduler:
                 }
             ]
         """
-        for cluster_arn in self.tag_api.get_resources("rds:cluster", aws_tags):
-            cluster_id = cluster_arn.split(":")[-1]
-            try:
-                # Identifier must be cluster id, not resource id
-                self.rds.describe_db_clusters(DBClusterIdentifier=cluster_id)
-                self.rds.stop_db_cluster(DBClusterIdentifier=cluster_id)
-                print(f"Stop rds cluster {cluster_id}")
-            except ClientError as exc:
-                rds_exception("rds cluster", cluster_id, exc)
+        self._schedule("stop", aws_tags, to_exclude)
 
-        for db_arn in self.tag_api.get_resources("rds:db", aws_tags):
-            db_id = db_arn.split(":")[-1]
-            try:
-                self.rds.stop_db_instance(DBInstanceIdentifier=db_id)
-                print(f"Stop rds instance {db_id}")
-            except ClientError as exc:
-                rds_exception("rds instance", db_id, exc)
-
-    def start(self, aws_tags: list[dict]) -> None:
+    def start(self, aws_tags: list[dict], to_exclude=None) -> None:
         """Aws rds cluster start function.
 
         Start rds aurora clusters and db instances with defined tags.
+        Tagged cluster members start their cluster, read replicas and
+        serverless v1 clusters, which cannot be started, are skipped.
 
         :param list[map] aws_tags:
             Aws tags to use for filter resources.
@@ -71,20 +115,169 @@ class RdsScheduler:
                 }
             ]
         """
-        for cluster_arn in self.tag_api.get_resources("rds:cluster", aws_tags):
-            cluster_id = cluster_arn.split(":")[-1]
-            try:
-                # Identifier must be cluster id, not resource id
-                self.rds.describe_db_clusters(DBClusterIdentifier=cluster_id)
-                self.rds.start_db_cluster(DBClusterIdentifier=cluster_id)
-                print(f"Start rds cluster {cluster_id}")
-            except ClientError as exc:
-                rds_exception("rds cluster", cluster_id, exc)
+        self._schedule("start", aws_tags, to_exclude)
+
+    def reconcile(self, aws_tags, desired_state, to_exclude=None) -> None:
+        """Aws rds reconcile function.
+
+        Stop or start the tagged clusters and instances whose state
+        differs from the state wanted now, see libs.schedule_window.
+        Databases are described once for both actions.
+
+        :param list[map] aws_tags:
+            Aws tags to use for filter resources.
+        :param callable desired_state:
+            Function returning the state wanted for the tags of a
+            database, running, stopped or None to leave it.
+        """
+        clusters, db_instances = self._list_resources(aws_tags, to_exclude)
+        inventory = {}
+        for action, state in (("stop", STOPPED), ("start", RUNNING)):
+            self._apply(
+                action,
+                [cluster.resource_id for cluster in clusters if desired_state(cluster.tags) == state],
+                [db.resource_id for db in db_instances if desired_state(db.tags) == state],
+                inventory,
+            )
+
+    def _schedule(self, action: str, aws_tags, to_exclude) -> None:
+        """Stop or start the tagged clusters and standalone instances."""
+        clusters, db_instances = self._list_resources(aws_tags, to_exclude)
+        self._apply(
+            action,
+            [cluster.resource_id for cluster in clusters],
+            [db.resource_id for db in db_instances],
+            {},
+        )
+
+    def _list_resources(self, aws_tags, to_exclude) -> tuple:
+        """Return the tagged clusters and instances not excluded."""
+        to_exclude = set(to_exclude or [])
+        resources = {}
+        for resource_type in ("rds:cluster", "rds:db"):
+            resources[resource_type] = []
+            for resource in self.tag_api.get_resources(resource_type, aws_tags):
+                if resource.is_excluded(to_exclude):
+                    logging.info(f"{resource.resource_id} found in exclude list.")
+                else:
+                    resources[resource_type].append(resource)
+        return resources["rds:cluster"], resources["rds:db"]
+
+    def _apply(self, action: str, cluster_ids: list[str], tagged_db_ids: list[str], inventory: dict) -> None:
+        """Send the calls the api accepts for the current database states.
+
+        One describe_db_instances pass classifies the tagged instances
+        and one describe_db_clusters pass gives the state of the
+        clusters to schedule, they are kept in inventory for the next
+        action of the same run.
+        """
+        cluster_ids = list(cluster_ids)
+        if tagged_db_ids and "instances" not in inventory:
+            inventory["instances"] = self.describe_db_instances()
+        db_instances = inventory.get("instances", {})
 
-        for db_arn in self.tag_api.get_resources("rds:db", aws_tags):
-            db_id = db_arn.split(":")[-1]
+        standalone_ids = []
+        for db_id in tagged_db_ids:
+            db = db_instances.get(db_id)
+            if db is None:
+                logging.warning(f"rds instance {db_id} not found")
+                continue
+            db_class = classify_db_instance(db)
+            if db_class == CLUSTER_MEMBER:
+                # Cluster members are scheduled once with their cluster
+                if db["DBClusterIdentifier"] not in cluster_ids:
+                    cluster_ids.append(db["DBClusterIdentifier"])
+            elif db_class == REPLICA:
+                logging.info(f"rds instance {db_id} is a read replica or has replicas, skipped.")
+            elif action == "start" and db["DBInstanceStatus"] == "starting":
+                # Started by an interrupted invocation, only waited
+                self.started_instances.append(db_id)
+            elif db["DBInstanceStatus"] != EXPECTED_STATUS[action]:
+                logging.info(f"rds instance {db_id} is {db['DBInstanceStatus']}, skipped.")
+            else:
+                standalone_ids.append(db_id)
+
+        if cluster_ids and "clusters" not in inventory:
+            inventory["clusters"] = self.describe_db_clusters()
+        clusters = inventory.get("clusters", {})
+        for cluster_id in cluster_ids:
+            cluster = clusters.get(cluster_id)
+            if cluster is None:
+                logging.warning(f"rds cluster {cluster_id} not found")
+            elif cluster.get("EngineMode") == "serverless":
+                logging.info(f"rds cluster {cluster_id} is serverless v1, skipped.")
+            elif action == "start" and cluster["Status"] == "starting":
+                self.started_clusters.append(cluster_id)
+            elif cluster["Status"] != EXPECTED_STATUS[action]:
+                logging.info(f"rds cluster {cluster_id} is {cluster['Status']}, skipped.")
+            else:
+                try:
+                    getattr(self.rds, f"{action}_db_cluster")(DBClusterIdentifier=cluster_id)
+                    print(f"{action.capitalize()} rds cluster {cluster_id}")
+                except ClientError as exc:
+                    rds_exception("rds cluster", cluster_id, exc, self.rds.meta.region_name)
+                else:
+                    if action == "start":
+                        self.started_clusters.append(cluster_id)
+
+        for db_id in standalone_ids:
             try:
-                self.rds.start_db_instance(DBInstanceIdentifier=db_id)
-                print(f"Start rds instance {db_id}")
+                getattr(self.rds, f"{action}_db_instance")(DBInstanceIdentifier=db_id)
+                print(f"{action.capitalize()} rds instance {db_id}")
             except ClientError as exc:
-                rds_exception("rds instance", db_id, exc)
+                rds_exception("rds instance", db_id, exc, self.rds.meta.region_name)
+            else:
+                if action == "start":
+                    self.started_instances.append(db_id)
+
+    def describe_db_instances(self) -> dict:
+        """Return all the rds instances of the region by identifier."""
+        paginator = self.rds.get_paginator("describe_db_instances")
+        return {
+            db["DBInstanceIdentifier"]: db
+            for page in paginator.paginate(PaginationConfig={"PageSize": 100})
+            for db in page["DBInstances"]
+        }
+
+    def describe_db_clusters(self) -> dict:
+        """Return all the rds clusters of the region by identifier."""
+        paginator = self.rds.get_paginator("describe_db_clusters")
+        return {
+            cluster["DBClusterIdentifier"]: cluster
+            for page in paginator.paginate(PaginationConfig={"PageSize": 100})
+            for cluster in page["DBClusters"]
+        }
+
+    def wait_until_ready(self) -> None:
+        """Wait the rds databases started by this scheduler are available.
+
+        The databases still starting, like those of an invocation
+        stopped by its deadline, are waited too.
+
+        :raises DeadlineExceeded:
+            The invocation deadline is reached during the wait.
+        """
+        if self.wait_available:
+            self.readiness.track(self.started_instances, self.started_clusters)
+
+    def track(self, aws_tags: list[dict], to_exclude=None, started_at=None) -> dict:
+        """Aws rds readiness function.
+
+        Wait rds aurora clusters and db instances with defined tags
+        are available and report their time to available. Used by
+        the follow-up invocation of a start.
+
+        :param list[map] aws_tags:
+            Aws tags to use for filter resources.
+        :param float started_at:
+            Epoch time of the start request.
+        """
+        to_exclude = set(to_exclude or [])
+        db_ids = {}
+        for resource_type in ("rds:cluster", "rds:db"):
+            db_ids[resource_type] = [
+                resource.resource_id
+                for resource in self.tag_api.get_resources(resource_type, aws_tags)
+                if not resource.is_excluded(to_exclude)
+            ]
+        return self.readiness.track(db_ids["rds:db"], db_ids["rds:cluster"], started_at)
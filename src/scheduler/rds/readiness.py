@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+"""Rds readiness tracker."""
+
+import logging
+import time
+
+from botocore.exceptions import ClientError
+
+from ..libs.aws_sessions import get_client
+from ..libs.deadline import DeadlineExceeded, wait_budget
+from .exceptions import rds_exception
+
+
+class RdsReadinessTracker:
+    """Abstract rds availability tracker in a class."""
+
+    def __init__(
+        self,
+        region_name=None,
+        session=None,
+        min_delay=10,
+        max_delay=60,
+        timeout=480,
+        sleep=time.sleep,
+    ) -> None:
+        """Initialize rds readiness tracker.
+
+        :param int min_delay:
+            Seconds between two polls while databases become available.
+        :param int max_delay:
+            Maximum seconds between two polls, the delay doubles after
+            each poll without progress.
+        :param int timeout:
+            Seconds after which the remaining databases are reported
+            as not ready, shortened to the remaining invocation time,
+            see libs.deadline.
+        """
+        self.rds = get_client("rds", region_name, session)
+        self.region_name = region_name
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.sleep = sleep
+
+    def track(self, db_instance_ids=(), db_cluster_ids=(), started_at=None) -> dict:
+        """Wait rds instances and clusters are available.
+
+        Each poll pages describe_db_instances and describe_db_clusters
+        once for all the tracked databases of the region. The wait ends
+        with the timeout or the time left before the invocation deadline,
+        a failed poll, like a throttled describe, is recorded and the
+        databases are polled again after the delay.
+
+        :param list[str] db_instance_ids:
+            The identifiers of the rds instances to track.
+        :param list[str] db_cluster_ids:
+            The identifiers of the rds clusters to track.
+        :param float started_at:
+            Epoch time of the start request, default now.
+
+        :raises DeadlineExceeded:
+            The invocation deadline is reached before the databases
+            are available.
+
+        :return dict:
+            The seconds to available of each ready instance and cluster,
+            and the identifiers of the databases not ready.
+            For example:
+            {
+                'instances': {'database-1': 312.5},
+                'clusters': {'aurora-1': 421.0},
+                'not_ready': ['database-2'],
+            }
+        """
+        started_at = started_at or time.time()
+        budget = wait_budget(self.timeout)
+        deadline = time.monotonic() + budget
+        pending = {
+            "instances": set(db_instance_ids),
+            "clusters": set(db_cluster_ids),
+        }
+        report = {"instances": {}, "clusters": {}, "not_ready": []}
+        delay = self.min_delay
+
+        while pending["instances"] or pending["clusters"]:
+            progress = False
+            for kind, statuses in (
+                ("instances", self._instance_statuses),
+                ("clusters", self._cluster_statuses),
+            ):
+                if not pending[kind]:
+                    continue
+                try:
+                    found = statuses()
+                except ClientError as exc:
+                    rds_exception(
+                        f"rds {kind}", ", ".join(sorted(pending[kind])), exc, self.region_name
+                    )
+                    continue
+                for db_id in list(pending[kind]):
+                    if db_id not in found:
+                        logging.warning(f"rds {kind} {db_id} not found")
+                        pending[kind].discard(db_id)
+                        report["not_ready"].append(db_id)
+                    elif found[db_id] == "available":
+                        elapsed = round(time.time() - started_at, 1)
+                        report[kind][db_id] = elapsed
+                        pending[kind].discard(db_id)
+                        progress = True
+                        print(f"rds {kind} {db_id} available after {elapsed}s")
+
+            if not (pending["instances"] or pending["clusters"]):
+                break
+            if time.monotonic() + delay > deadline:
+                if budget < self.timeout:
+                    raise DeadlineExceeded(
+                        "rds databases not available before the invocation deadline: "
+                        f"{sorted(pending['instances'] | pending['clusters'])}"
+                    )
+                report["not_ready"] += sorted(pending["instances"] | pending["clusters"])
+                logging.error(f"rds databases not available: {report['not_ready']}")
+                break
+            if progress:
+                delay = self.min_delay
+            self.sleep(delay)
+            delay = min(delay * 2, self.max_delay)
+        return report
+
+    def _instance_statuses(self) -> dict:
+        """Return the status of all rds instances of the region."""
+        paginator = self.rds.get_paginator("describe_db_instances")
+        return {
+            db["DBInstanceIdentifier"]: db["DBInstanceStatus"]
+            for page in paginator.paginate(PaginationConfig={"PageSize": 100})
+            for db in page["DBInstances"]
+        }
+
+    def _cluster_statuses(self) -> dict:
+        """Return the status of all rds clusters of the region."""
+        paginator = self.rds.get_paginator("describe_db_clusters")
+        return {
+            cluster["DBClusterIdentifier"]: cluster["Status"]
+            for page in paginator.paginate(PaginationConfig={"PageSize": 100})
+            for cluster in page["DBClusters"]
+        }
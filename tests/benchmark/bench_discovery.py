@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""Memory benchmark of the resource discovery on large inventories.
+
+Lists generated tagging api and autoscaling pages through the
+scheduler discovery, without aws calls, and reports the time, the
+memory kept by the discovered records, the python peak allocation and
+the peak RSS of the process. The peak RSS only grows, run one discovery
+at a time to compare it with a lambda memory size. Run from the
+repository root:
+
+    python3 -m tests.benchmark.bench_discovery --resources 50000 --discovery tagged
+"""
+
+import argparse
+import gc
+import resource
+import sys
+import time
+import tracemalloc
+
+from src.scheduler.autoscaling.handler import AutoscalingScheduler
+from src.scheduler.libs.filter_resources_by_tags import FilterByTags
+
+REGION = "eu-west-1"
+ACCOUNT_ID = "123456789012"
+TAGS = [{"Key": "tostop", "Values": ["true"]}]
+
+
+class FakeApi:
+    """Client answering generated pages of a list api."""
+
+    def __init__(self, count, page_size, token_name, result_key, make_item):
+        self.count = count
+        self.page_size = page_size
+        self.token_name = token_name
+        self.result_key = result_key
+        self.make_item = make_item
+
+    def list_page(self, **kwargs):
+        start = int(kwargs.get(self.token_name) or 0)
+        end = min(start + self.page_size, self.count)
+        page = {self.result_key: [self.make_item(index) for index in range(start, end)]}
+        if end < self.count:
+            page[self.token_name] = str(end)
+        return page
+
+
+def tag_mapping(index):
+    """Return the tagging api mapping of a generated instance."""
+    return {
+        "ResourceARN": f"arn:aws:ec2:{REGION}:{ACCOUNT_ID}:instance/i-{index:017x}",
+        "Tags": [
+            {"Key": "Name", "Value": f"instance-{index}"},
+            {"Key": "tostop", "Value": "true"},
+            {"Key": "env", "Value": "prod" if index % 2 else "dev"},
+            {"Key": "team", "Value": f"team-{index % 20}"},
+            {"Key": "aws:autoscaling:groupName", "Value": f"asg-{index % 500}"},
+        ],
+    }
+
+
+def auto_scaling_group(index):
+    """Return the description of a generated group of 4 instances."""
+    return {
+        "AutoScalingGroupName": f"asg-{index}",
+        "AutoScalingGroupARN": (
+            f"arn:aws:autoscaling:{REGION}:{ACCOUNT_ID}:autoScalingGroup:"
+            f"00000000-0000-0000-0000-{index:012d}:autoScalingGroupName/asg-{index}"
+        ),
+        "LaunchTemplate": {"LaunchTemplateId": "lt-0123456789abcdef0", "Version": "$Latest"},
+        "MinSize": 1,
+        "MaxSize": 8,
+        "DesiredCapacity": 4,
+        "DefaultCooldown": 300,
+        "AvailabilityZones": [f"{REGION}a", f"{REGION}b", f"{REGION}c"],
+        "LoadBalancerNames": [],
+        "TargetGroupARNs": [
+            f"arn:aws:elasticloadbalancing:{REGION}:{ACCOUNT_ID}:targetgroup/tg-{index}/0123456789abcdef"
+        ],
+        "HealthCheckType": "ELB",
+        "HealthCheckGracePeriod": 300,
+        "Instances": [
+            {
+                "InstanceId": f"i-{index * 4 + offset:017x}",
+                "InstanceType": "t3.micro",
+                "AvailabilityZone": f"{REGION}a",
+                "LifecycleState": "InService",
+                "HealthStatus": "Healthy",
+                "LaunchTemplate": {"LaunchTemplateId": "lt-0123456789abcdef0", "Version": "1"},
+                "ProtectedFromScaleIn": False,
+            }
+            for offset in range(4)
+        ],
+        "SuspendedProcesses": [],
+        "VPCZoneIdentifier": "subnet-0123456789abcdef0,subnet-0123456789abcdef1",
+        "EnabledMetrics": [],
+        "Tags": [
+            {
+                "ResourceId": f"asg-{index}",
+                "ResourceType": "auto-scaling-group",
+                "Key": key,
+                "Value": value,
+                "PropagateAtLaunch": True,
+            }
+            for key, value in (("tostop", "true"), ("env", "prod"), ("team", f"team-{index % 20}"))
+        ],
+        "TerminationPolicies": ["Default"],
+        "NewInstancesProtectedFromScaleIn": False,
+        "ServiceLinkedRoleARN": (
+            f"arn:aws:iam::{ACCOUNT_ID}:role/aws-service-role/autoscaling.amazonaws.com/"
+            "AWSServiceRoleForAutoScaling"
+        ),
+    }
+
+
+def tagged_resources(count):
+    """Keep the tagged instances of the inventory, like a reconcile run."""
+    tag_api = FilterByTags(REGION)
+    tag_api.rgta = FakeApi(count, 100, "PaginationToken", "ResourceTagMappingList", tag_mapping)
+    tag_api.rgta.get_resources = tag_api.rgta.list_page
+    return list(tag_api.get_resources("ec2:instance", TAGS))
+
+
+def autoscaling_groups(count):
+    """Keep the described groups and their instance index."""
+    scheduler = AutoscalingScheduler(REGION)
+    scheduler.asg = FakeApi(count, 100, "NextToken", "AutoScalingGroups", auto_scaling_group)
+    scheduler.asg.describe_auto_scaling_groups = scheduler.asg.list_page
+    return list(scheduler.describe_groups(TAGS)), scheduler.index
+
+
+def peak_rss_mb():
+    """Return the peak resident memory of the process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on linux
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def measure(name, function, count):
+    """Run a discovery and print its time and memory."""
+    gc.collect()
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    kept = function(count)
+    elapsed = time.perf_counter() - started_at
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{name:<22} {count:>8} {elapsed:>8.2f}s {current / 2**20:>10.1f} MB"
+        f" {peak / 2**20:>10.1f} MB {peak_rss_mb():>10.1f} MB"
+    )
+    del kept
+
+
+def main(argv=None):
+    """Run the discovery benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--resources", type=int, default=50000)
+    parser.add_argument("--groups", type=int, default=5000)
+    parser.add_argument("--discovery", choices=("all", "tagged", "autoscaling"), default="all")
+    args = parser.parse_args(argv)
+    print(f"{'discovery':<22} {'count':>8} {'time':>9} {'kept':>13} {'peak':>13} {'peak rss':>13}")
+    if args.discovery in ("all", "tagged"):
+        measure("tagged ec2 instances", tagged_resources, args.resources)
+    if args.discovery in ("all", "autoscaling"):
+        measure("autoscaling groups", autoscaling_groups, args.groups)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+
+"""Local harness running the scheduler lambda against moto server mode.
+
+The aws calls of lambda_handler are sent to a moto server through the
+AWS_ENDPOINT_URL variable read by libs.aws_sessions.get_client. PROFILES
+holds the lambda environment of each scheduler combination and
+FaultInjector answers some calls with throttling, latency or partial
+failures before they reach moto, so the retries, batches and fallbacks
+run like against a live account. It also answers the listings moto
+doesn't implement, like the ecs services of the tagging api.
+"""
+
+import asyncio
+import fnmatch
+import json
+import socket
+import threading
+import time
+import uuid
+
+from botocore.awsrequest import AWSResponse
+
+try:
+    from aiobotocore.awsrequest import AioAWSResponse
+except ImportError:
+    AioAWSResponse = None
+
+from src.scheduler.libs.aws_sessions import register_handlers
+from src.scheduler.main import lambda_handler
+
+REGION = "eu-west-1"
+
+# Lambda environment shared by the profiles.
+BASE_ENVIRONMENT = {
+    "SCHEDULE_ACTION": "stop",
+    "AWS_REGIONS": REGION,
+    "TAG_KEY": "tostop",
+    "TAG_VALUE": "true",
+    "AWS_RETRY_MODE": "standard",
+    "AWS_MAX_ATTEMPTS": "4",
+}
+
+# Lambda environment of each scheduler combination.
+PROFILES = {
+    "ec2": {"EC2_SCHEDULE": "true"},
+    "ec2_hibernate": {"EC2_SCHEDULE": "true", "EC2_STOP_MODE": "hibernate"},
+    "autoscaling": {"AUTOSCALING_SCHEDULE": "true"},
+    "autoscaling_capacity": {
+        "AUTOSCALING_SCHEDULE": "true",
+        "AUTOSCALING_SCHEDULE_MODE": "capacity",
+    },
+    "rds": {"RDS_SCHEDULE": "true"},
+    "ecs": {"ECS_SCHEDULE": "true"},
+    "cloudwatch_alarm": {"CLOUDWATCH_ALARM_SCHEDULE": "true"},
+    "all": {
+        "AUTOSCALING_SCHEDULE": "true",
+        "EC2_SCHEDULE": "true",
+        "ECS_SCHEDULE": "true",
+        "RDS_SCHEDULE": "true",
+        "CLOUDWATCH_ALARM_SCHEDULE": "true",
+    },
+    "reconcile": {
+        "EC2_SCHEDULE": "true",
+        "SCHEDULE_ACTION": "reconcile",
+        "RECONCILE_WINDOW": "UTC 00:00-00:01",
+    },
+    "async": {"ECS_SCHEDULE": "true", "SCHEDULER_ENGINE": "async"},
+    "paged": {"EC2_SCHEDULE": "true", "DISCOVERY_PAGE_SIZE": "2"},
+}
+
+
+def profile_environment(name: str, **overrides) -> dict:
+    """Return the lambda environment of a profile.
+
+    :param str name:
+        The profile name, a key of PROFILES.
+    :param overrides:
+        Variables replacing the values of the profile.
+    """
+    return {**BASE_ENVIRONMENT, **PROFILES[name], **overrides}
+
+
+def free_port() -> int:
+    """Return a free local tcp port for the moto server."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Fault:
+    """Abstract fault injected on matching aws calls in a class."""
+
+    __slots__ = ("operation", "code", "status", "delay", "resource", "times", "body")
+
+    def __init__(
+        self,
+        operation,
+        code=None,
+        status=400,
+        delay=0,
+        resource=None,
+        times=None,
+        body=None,
+    ):
+        """Initialize fault.
+
+        :param str operation:
+            The matched service and operation, with shell wildcards,
+            for example ec2.StopInstances or rds.*.
+        :param str code:
+            The error code answered, default only the delay is added.
+        :param int status:
+            The http status of the error.
+        :param float delay:
+            Seconds of latency added before the call.
+        :param str resource:
+            Only match the calls naming this resource id.
+        :param int times:
+            Number of calls matched, default all of them.
+        :param dict body:
+            The json document answered instead of calling moto.
+        """
+        self.operation = operation
+        self.code = code
+        self.status = status
+        self.delay = delay
+        self.resource = resource
+        self.times = times
+        self.body = body
+
+
+class FaultInjector:
+    """Abstract fault injection on the boto3 clients in a class.
+
+    The faults are answered from the botocore before-send event, inside
+    the retry loop, so the throttling errors are retried like the real
+    ones. The injector is registered with libs.aws_sessions.register_handlers,
+    the aiobotocore clients of the async engine are affected too.
+    """
+
+    def __init__(self) -> None:
+        """Initialize fault injector without faults."""
+        self.faults = []
+        self.calls = []
+        self.invocations = []
+        self._lock = threading.Lock()
+        self._registration = None
+
+    def add(self, *args, **kwargs) -> Fault:
+        """Add a fault, see Fault for the arguments."""
+        fault = Fault(*args, **kwargs)
+        with self._lock:
+            self.faults.append(fault)
+        return fault
+
+    def throttle(self, operation, times=1, code="Throttling") -> Fault:
+        """Answer the first calls of an operation with a throttling error."""
+        return self.add(operation, code=code, times=times)
+
+    def latency(self, operation, delay) -> Fault:
+        """Add latency to the calls of an operation."""
+        return self.add(operation, delay=delay)
+
+    def fail(self, operation, resource, code="UnsupportedOperation") -> Fault:
+        """Fail the calls of an operation naming a resource."""
+        return self.add(operation, code=code, resource=resource)
+
+    def answer(self, operation, body, resource=None) -> Fault:
+        """Answer the calls of an operation with a json document."""
+        return self.add(operation, resource=resource, body=body)
+
+    def register(self, session=None) -> None:
+        """Send the calls of the session clients through the injector.
+
+        :param boto3.session.Session session:
+            The session of the clients, default the boto3 default
+            session used by libs.aws_sessions.get_client.
+        """
+        self._registration = register_handlers(
+            session, [("before-send", self.before_send)]
+        )
+        self._registration.__enter__()
+
+    def unregister(self) -> None:
+        """Remove the injector from the session."""
+        if self._registration is not None:
+            self._registration.__exit__(None, None, None)
+            self._registration = None
+
+    def before_send(self, request, event_name, **kwargs):
+        """Answer a call with a fault, botocore before-send event handler."""
+        _, service, operation = event_name.split(".", 2)
+        body = request.body or b""
+        if not isinstance(body, bytes):
+            body = body.encode() if isinstance(body, str) else b""
+        with self._lock:
+            self.calls.append(f"{service}.{operation}")
+        if service == "lambda" and operation == "Invoke":
+            # Asynchronous invocations are kept to be replayed by run
+            with self._lock:
+                self.invocations.append(json.loads(body or b"{}"))
+            return AWSResponse(request.url, 202, {}, None)
+        fault = self._match(f"{service}.{operation}", body)
+        if fault is None:
+            return None
+        if fault.delay:
+            time.sleep(fault.delay)
+        if fault.body is not None:
+            return _response(
+                request,
+                200,
+                {"Content-Type": "application/x-amz-json-1.1"},
+                json.dumps(fault.body).encode(),
+            )
+        if fault.code is None:
+            return None
+        return error_response(request, service, fault.code, fault.status)
+
+    def _match(self, name, body):
+        with self._lock:
+            for fault in self.faults:
+                if fault.times == 0 or not fnmatch.fnmatch(name, fault.operation):
+                    continue
+                if fault.resource and fault.resource.encode() not in body:
+                    continue
+                if fault.times is not None:
+                    fault.times -= 1
+                return fault
+        return None
+
+
+class _RawBody:
+    """Response body read by botocore."""
+
+    def __init__(self, content: bytes) -> None:
+        self.content = content
+
+    def stream(self, **kwargs):
+        yield self.content
+
+
+class _AioRawBody(_RawBody):
+    """Response body read by aiobotocore."""
+
+    def __init__(self, content: bytes, headers: dict) -> None:
+        super().__init__(content)
+        self.raw_headers = [
+            (key.encode(), value.encode()) for key, value in headers.items()
+        ]
+
+    async def read(self):
+        return self.content
+
+
+def _response(request, status, headers, content: bytes) -> AWSResponse:
+    """Return an answer read by botocore or aiobotocore."""
+    try:
+        # The aiobotocore clients send their calls from the event loop
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return AWSResponse(request.url, status, headers, _RawBody(content))
+    return AioAWSResponse(request.url, status, headers, _AioRawBody(content, headers))
+
+
+def error_response(request, service, code, status=400) -> AWSResponse:
+    """Return an aws error answer in the protocol of a request.
+
+    :param request:
+        The prepared botocore request.
+    :param str service:
+        The hyphenized service id, for example ec2 or auto-scaling.
+    :param str code:
+        The aws error code.
+    :param int status:
+        The http status of the error.
+    """
+    message = f"Injected {code}"
+    request_id = str(uuid.uuid4())
+    content_type = request.headers.get("Content-Type", b"")
+    if isinstance(content_type, bytes):
+        content_type = content_type.decode()
+    if "json" in content_type:
+        body = json.dumps({"__type": code, "message": message})
+        headers = {"Content-Type": content_type, "x-amzn-RequestId": request_id}
+    elif service == "ec2":
+        body = (
+            f"<Response><Errors><Error><Code>{code}</Code><Message>{message}</Message>"
+            f"</Error></Errors><RequestID>{request_id}</RequestID></Response>"
+        )
+        headers = {"Content-Type": "text/xml"}
+    elif "x-www-form-urlencoded" in content_type:
+        body = (
+            f"<ErrorResponse><Error><Type>Sender</Type><Code>{code}</Code>"
+            f"<Message>{message}</Message></Error>"
+            f"<RequestId>{request_id}</RequestId></ErrorResponse>"
+        )
+        headers = {"Content-Type": "text/xml"}
+    else:
+        raise ValueError(f"No injected error for the protocol of {service}: {content_type}")
+    return _response(request, status, headers, body.encode())
+
+
+class LambdaContext:
+    """Abstract lambda context of a local invocation in a class."""
+
+    def __init__(self, timeout=900, account_id="123456789012") -> None:
+        """Initialize lambda context.
+
+        :param float timeout:
+            Seconds before the invocation timeout.
+        :param str account_id:
+            The aws account of the function.
+        """
+        self.aws_request_id = str(uuid.uuid4())
+        self.function_name = "scheduler-local"
+        self.invoked_function_arn = (
+            f"arn:aws:lambda:{REGION}:{account_id}:function:{self.function_name}"
+        )
+        self._ends_at = time.time() + timeout
+
+    def get_remaining_time_in_millis(self) -> int:
+        """Return the milliseconds before the invocation timeout."""
+        return max(int((self._ends_at - time.time()) * 1000), 0)
+
+
+def run(injector: FaultInjector, event=None, timeout=900, max_invocations=10) -> list:
+    """Invoke lambda_handler and replay its asynchronous invocations.
+
+    The checkpoint and follow-up invocations requested by the handler
+    are run in turn, like the lambda service would.
+
+    :param FaultInjector injector:
+        The registered injector keeping the asynchronous invocations.
+    :param dict event:
+        The event of the first invocation.
+    :param float timeout:
+        Seconds before the timeout of each invocation.
+    :param int max_invocations:
+        Maximum number of invocations run.
+
+    :return list:
+        The event and result of each invocation.
+    """
+    events = [event or {}]
+    invocations = []
+    while events and len(invocations) < max_invocations:
+        event = events.pop(0)
+        injector.invocations.clear()
+        result = lambda_handler(event, LambdaContext(timeout))
+        invocations.append((event, result))
+        events += injector.invocations
+    return invocations
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+
+"""End-to-end tests of lambda_handler against moto server mode."""
+
+import importlib.util
+
+import boto3
+
+import pytest
+
+import requests
+
+moto_server = pytest.importorskip("moto.server")
+if not hasattr(moto_server, "ThreadedMotoServer"):
+    pytest.skip("moto server mode not available", allow_module_level=True)
+
+from src.scheduler.libs.async_engine import AsyncScheduler  # noqa: E402
+from src.scheduler import main  # noqa: E402
+from src.scheduler.libs.error_classifier import ERRORS  # noqa: E402
+
+from .harness import REGION, FaultInjector, free_port, profile_environment, run  # noqa: E402
+from ..unit.utils import (  # noqa: E402
+    launch_asg,
+    launch_ec2_instances,
+    launch_rds_instance,
+)
+
+
+@pytest.fixture
+def moto_endpoint(monkeypatch):
+    """Start a moto server and return its endpoint url.
+
+    The scheduler clients read AWS_ENDPOINT_URL, the clients of the
+    tests get the endpoint url explicitly: boto3 before 1.28 ignores
+    the variable and would call aws.
+    """
+    port = free_port()
+    server = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=port)
+    server.start()
+    # Moto backends are shared by the servers of the process
+    requests.post(f"http://127.0.0.1:{port}/moto-api/reset", timeout=5)
+    endpoint_url = f"http://127.0.0.1:{port}"
+    monkeypatch.setenv("AWS_ENDPOINT_URL", endpoint_url)
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", REGION)
+    monkeypatch.setattr(boto3, "DEFAULT_SESSION", None)
+    # Errors recorded by the unit tests are not part of the invocations
+    ERRORS.clear()
+    yield endpoint_url
+    server.stop()
+
+
+@pytest.fixture
+def lambda_env(moto_endpoint, monkeypatch):
+    """Return a function applying the lambda environment of a profile."""
+
+    def apply(name, **overrides):
+        for key, value in profile_environment(name, **overrides).items():
+            monkeypatch.setenv(key, value)
+
+    return apply
+
+
+@pytest.fixture
+def injector(moto_endpoint):
+    """Return a fault injector registered on the default session."""
+    fault_injector = FaultInjector()
+    fault_injector.register()
+    yield fault_injector
+    fault_injector.unregister()
+
+
+def instance_states(instance_ids, endpoint_url):
+    """Return the state name of ec2 instances."""
+    ec2 = boto3.client("ec2", region_name=REGION, endpoint_url=endpoint_url)
+    reservations = ec2.describe_instances(InstanceIds=instance_ids)["Reservations"]
+    return {
+        instance["InstanceId"]: instance["State"]["Name"]
+        for reservation in reservations
+        for instance in reservation["Instances"]
+    }
+
+
+def launch_ecs_service(endpoint_url):
+    """Create an ecs service of two tasks, return its arn."""
+    ecs = boto3.client("ecs", region_name=REGION, endpoint_url=endpoint_url)
+    ecs.create_cluster(clusterName="cluster-test")
+    ecs.register_task_definition(
+        family="task-test",
+        containerDefinitions=[{"name": "app", "image": "nginx", "memory": 128}],
+    )
+    service = ecs.create_service(
+        cluster="cluster-test",
+        serviceName="service-test",
+        taskDefinition="task-test",
+        desiredCount=2,
+    )
+    return service["service"]["serviceArn"]
+
+
+@pytest.mark.parametrize("profile", ["ec2", "paged", "reconcile"])
+def test_lambda_handler_stop_ec2(moto_endpoint, lambda_env, injector, profile):
+    """Verify each ec2 profile stops the tagged instances."""
+    lambda_env(profile)
+    instances = launch_ec2_instances(
+        5, REGION, "tostop", "true", endpoint_url=moto_endpoint
+    )["Instances"]
+    instance_ids = [instance["InstanceId"] for instance in instances]
+
+    run(injector)
+
+    assert set(instance_states(instance_ids, moto_endpoint).values()) == {"stopped"}
+
+
+@pytest.mark.skipif(
+    importlib.util.find_spec("aiobotocore") is None, reason="aiobotocore not installed"
+)
+def test_lambda_handler_stop_ecs_async(
+    moto_endpoint, lambda_env, injector, monkeypatch
+):
+    """Verify the async profile stops the tagged ecs services on the async engine."""
+    lambda_env("async")
+    service_arn = launch_ecs_service(moto_endpoint)
+    # Moto doesn't list the ecs services in the tagging api
+    injector.answer(
+        "resource-groups-tagging-api.GetResources",
+        {
+            "ResourceTagMappingList": [
+                {
+                    "ResourceARN": service_arn,
+                    "Tags": [{"Key": "tostop", "Value": "true"}],
+                }
+            ]
+        },
+        resource="ecs:service",
+    )
+    runs = []
+    async_run = AsyncScheduler._run
+
+    async def _run(self, *args):
+        runs.append(self.service_name)
+        await async_run(self, *args)
+
+    monkeypatch.setattr(AsyncScheduler, "_run", _run)
+
+    run(injector)
+
+    ecs = boto3.client("ecs", region_name=REGION, endpoint_url=moto_endpoint)
+    service = ecs.describe_services(cluster="cluster-test", services=["service-test"])
+    assert service["services"][0]["desiredCount"] == 0
+    assert runs == ["ecs"]
+    assert "ecs.UpdateService" in injector.calls
+
+
+def test_lambda_handler_stop_rds(moto_endpoint, lambda_env, injector):
+    """Verify the rds profile stops the tagged databases."""
+    lambda_env("rds")
+    launch_rds_instance(REGION, "tostop", "true", endpoint_url=moto_endpoint)
+
+    run(injector)
+
+    rds = boto3.client("rds", region_name=REGION, endpoint_url=moto_endpoint)
+    instance = rds.describe_db_instances(DBInstanceIdentifier="db-instance")["DBInstances"][0]
+    assert instance["DBInstanceStatus"] == "stopped"
+
+
+def test_lambda_handler_suspend_autoscaling(moto_endpoint, lambda_env, injector):
+    """Verify the autoscaling profile suspends the tagged groups."""
+    lambda_env("autoscaling")
+    launch_asg(REGION, "tostop", "true", endpoint_url=moto_endpoint)
+
+    run(injector)
+
+    autoscaling = boto3.client(
+        "autoscaling", region_name=REGION, endpoint_url=moto_endpoint
+    )
+    group = autoscaling.describe_auto_scaling_groups(AutoScalingGroupNames=["asg-test"])
+    assert group["AutoScalingGroups"][0]["SuspendedProcesses"]
+
+
+def test_lambda_handler_retries_throttling(moto_endpoint, lambda_env, injector):
+    """Verify throttled stop calls are retried by botocore."""
+    lambda_env("ec2")
+    instances = launch_ec2_instances(
+        3, REGION, "tostop", "true", endpoint_url=moto_endpoint
+    )["Instances"]
+    instance_ids = [instance["InstanceId"] for instance in instances]
+    injector.throttle("ec2.StopInstances", times=2, code="RequestLimitExceeded")
+
+    run(injector)
+
+    assert set(instance_states(instance_ids, moto_endpoint).values()) == {"stopped"}
+    assert injector.calls.count("ec2.StopInstances") == 3
+
+
+def test_lambda_handler_partial_failure(
+    moto_endpoint, lambda_env, injector, caplog
+):
+    """Verify one failing instance does not block the rest of its batch."""
+    lambda_env("ec2")
+    instances = launch_ec2_instances(
+        3, REGION, "tostop", "true", endpoint_url=moto_endpoint
+    )["Instances"]
+    instance_ids = [instance["InstanceId"] for instance in instances]
+    injector.fail("ec2.StopInstances", resource=instance_ids[0])
+
+    run(injector)
+
+    states = instance_states(instance_ids, moto_endpoint)
+    assert states[instance_ids[0]] == "running"
+    assert {states[instance_id] for instance_id in instance_ids[1:]} == {"stopped"}
+    assert "1 UnsupportedOperation errors on ec2 eu-west-1" in caplog.text
+
+
+def test_lambda_handler_retry_errors_checkpointed(
+    moto_endpoint, lambda_env, injector, monkeypatch
+):
+    """Verify the resources with retry errors are scheduled again."""
+    monkeypatch.setattr(main, "RETRY_BASE_DELAY", 0)
+    lambda_env("ec2")
+    instances = launch_ec2_instances(
+        3, REGION, "tostop", "true", endpoint_url=moto_endpoint
+    )["Instances"]
+    instance_ids = [instance["InstanceId"] for instance in instances]
+    injector.add(
+        "ec2.StopInstances",
+        code="InsufficientInstanceCapacity",
+        resource=instance_ids[0],
+        times=2,
+    )
+
+    invocations = run(injector)
+
+    assert len(invocations) == 2
+    assert invocations[1][0]["checkpoint"] == [
+        {
+            "account": "123456789012",
+            "service": "ec2",
+            "region": REGION,
+            "resource_ids": [instance_ids[0]],
+            "cursors": {},
+            "retry": 1,
+        }
+    ]
+    assert set(instance_states(instance_ids, moto_endpoint).values()) == {"stopped"}
+
+
+def test_lambda_handler_retries_capped(
+    moto_endpoint, lambda_env, injector, monkeypatch
+):
+    """Verify the resources with retry errors are retried a few times only."""
+    monkeypatch.setattr(main, "RETRY_BASE_DELAY", 0)
+    lambda_env("ec2")
+    instances = launch_ec2_instances(
+        2, REGION, "tostop", "true", endpoint_url=moto_endpoint
+    )["Instances"]
+    instance_ids = [instance["InstanceId"] for instance in instances]
+    injector.fail(
+        "ec2.StopInstances", resource=instance_ids[0], code="InsufficientInstanceCapacity"
+    )
+
+    invocations = run(injector)
+
+    assert len(invocations) == main.MAX_RETRY_ATTEMPTS + 1
+    assert [event.get("attempt") for event, _ in invocations[1:]] == [1, 2, 3]
+    assert injector.calls.count("ec2.StopInstances") >= main.MAX_RETRY_ATTEMPTS + 1
+
+
+def test_lambda_handler_fail_errors_reported(moto_endpoint, lambda_env, injector):
+    """Verify errors with the fail action mark the invocation failed."""
+    lambda_env("ec2")
+    instances = launch_ec2_instances(
+        2, REGION, "tostop", "true", endpoint_url=moto_endpoint
+    )["Instances"]
+    instance_ids = [instance["InstanceId"] for instance in instances]
+    injector.fail("ec2.StopInstances", resource=instance_ids[0], code="AuthFailure")
+
+    invocations = run(injector)
+
+    assert len(invocations) == 1
+    assert invocations[0][1]["status"] == "failed"
+    assert instance_states(instance_ids, moto_endpoint)[instance_ids[1]] == "stopped"
+
+
+def test_lambda_handler_checkpoint_on_latency(
+    moto_endpoint, lambda_env, injector
+):
+    """Verify a slow run stops at the deadline and resumes in a new invocation."""
+    lambda_env("ec2", RDS_SCHEDULE="true", DEADLINE_SAFETY_MARGIN="1")
+    instances = launch_ec2_instances(
+        3, REGION, "tostop", "true", endpoint_url=moto_endpoint
+    )["Instances"]
+    instance_ids = [instance["InstanceId"] for instance in instances]
+    launch_rds_instance(REGION, "tostop", "true", endpoint_url=moto_endpoint)
+    injector.add("resource-groups-tagging-api.GetResources", delay=2, times=1)
+
+    invocations = run(injector, timeout=2.5)
+
+    assert len(invocations) == 2
+    assert invocations[1][0]["attempt"] == 1
+    assert invocations[1][0]["checkpoint"]
+    assert set(instance_states(instance_ids, moto_endpoint).values()) == {"stopped"}
+
+
+def test_lambda_handler_event_invalidates_caches(
+    moto_endpoint, lambda_env, injector, capsys
+):
+    """Verify event overrides invalidate the warm caches, checkpoints don't."""
+    lambda_env("ec2")
+    run(injector)
+    capsys.readouterr()
+
+    run(injector, {"checkpoint": [], "attempt": 1, "started_at": 0})
+    assert "warm caches invalidated" not in capsys.readouterr().out
+    run(injector, {"tags": [{"Key": "tostop", "Values": ["false"]}]})
+    assert "warm caches invalidated" in capsys.readouterr().out
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+"""Api call budgets of the schedulers at several fleet sizes.
+
+Each scheduler action declares the maximum number of calls of each
+operation for N resources, so an api call per resource coming back in
+a listing or a classification fails the tests.
+"""
+
+import io
+
+import boto3
+from botocore.awsrequest import AWSResponse
+
+from moto import (
+    mock_autoscaling,
+    mock_ec2,
+    mock_ecs,
+    mock_rds2,
+    mock_resourcegroupstaggingapi,
+)
+
+from src.scheduler.autoscaling.handler import AutoscalingScheduler
+from src.scheduler.cloudwatch.handler import CloudWatchAlarmScheduler
+from src.scheduler.ec2.handler import InstanceScheduler
+from src.scheduler.ecs.handler import EcsScheduler
+from src.scheduler.libs.api_calls import count_api_calls
+from src.scheduler.libs.aws_sessions import register_handlers
+from src.scheduler.libs.filter_resources_by_tags import TaggedResource
+from src.scheduler.libs.pipeline import BATCH_SIZE
+from src.scheduler.rds.handler import RdsScheduler
+
+from .test_rds_scheduler import FakeTagApi
+from .utils import assert_api_budget, launch_ec2_instances
+
+import pytest
+
+AWS_TAGS = [{"Key": "tostop", "Values": ["true"]}]
+FLEET_SIZES = [1, 10, 60]
+
+
+def batches(size):
+    """Return the number of pipeline batches of a fleet."""
+    return -(-size // BATCH_SIZE)
+
+
+def pages(size, page_size):
+    """Return the maximum number of pages listing a fleet."""
+    return 1 + size // page_size
+
+
+class ArnTagApi:
+    """Tagging api returning fixed resource arns."""
+
+    def __init__(self, arns):
+        self.arns = arns
+
+    def get_resources(self, resource_type, aws_tags):
+        return [TaggedResource(arn, {}) for arn in self.arns]
+
+
+class RawBody(io.BytesIO):
+    """Http response body read by botocore."""
+
+    def stream(self, **kwargs):
+        yield self.read()
+
+
+EC2_BUDGETS = {
+    "stop": {
+        ("resourcegroupstaggingapi", "GetResources"): lambda n: pages(n, 50),
+        ("ec2", "DescribeInstances"): batches,
+        ("ec2", "StopInstances"): batches,
+    },
+    "start": {
+        ("resourcegroupstaggingapi", "GetResources"): lambda n: pages(n, 50),
+        ("ec2", "DescribeInstances"): batches,
+        ("ec2", "StartInstances"): batches,
+    },
+}
+
+RDS_BUDGETS = {
+    "stop": {
+        ("rds", "DescribeDBInstances"): lambda n: pages(n, 100),
+        ("rds", "DescribeDBClusters"): lambda n: pages(n, 100),
+        ("rds", "StopDBInstance"): lambda n: n,
+    },
+    "start": {
+        ("rds", "DescribeDBInstances"): lambda n: pages(n, 100),
+        ("rds", "DescribeDBClusters"): lambda n: pages(n, 100),
+        ("rds", "StartDBInstance"): lambda n: n,
+    },
+}
+
+# Budgets for N groups of 2 instances.
+AUTOSCALING_BUDGETS = {
+    "stop": {
+        ("autoscaling", "DescribeAutoScalingGroups"): lambda n: pages(n, 50),
+        ("autoscaling", "SuspendProcesses"): lambda n: n,
+        ("ec2", "StopInstances"): lambda n: n,
+    },
+    "start": {
+        ("autoscaling", "DescribeAutoScalingGroups"): lambda n: pages(n, 50),
+        ("autoscaling", "ResumeProcesses"): lambda n: n,
+        ("ec2", "StartInstances"): lambda n: n,
+        ("ec2", "DescribeInstances"): lambda n: n,
+    },
+}
+
+# The ecs api has no call updating several services.
+ECS_BUDGETS = {
+    "stop": {("ecs", "UpdateService"): lambda n: n},
+    "start": {("ecs", "UpdateService"): lambda n: n},
+}
+
+# The alarm actions calls accept up to 100 alarms.
+CLOUDWATCH_BUDGETS = {
+    "stop": {
+        ("cloudwatch", "DisableAlarmActions"): lambda n: -(-n // 100),
+    },
+    "start": {
+        ("cloudwatch", "EnableAlarmActions"): lambda n: -(-n // 100),
+    },
+}
+
+
+@pytest.mark.parametrize("size", FLEET_SIZES)
+@pytest.mark.parametrize("action", ["stop", "start"])
+@mock_ec2
+@mock_resourcegroupstaggingapi
+def test_ec2_api_budget(action, size):
+    """Verify the ec2 calls grow with the batches, not the instances."""
+    launch_ec2_instances(size, "eu-west-1", "tostop", "true")
+    with count_api_calls() as counter:
+        getattr(InstanceScheduler("eu-west-1"), action)(AWS_TAGS)
+    assert counter.service_calls[("ec2", f"{action.capitalize()}Instances")] >= 1
+    assert_api_budget(counter, EC2_BUDGETS[action], size)
+
+
+@pytest.mark.parametrize("size", FLEET_SIZES)
+@pytest.mark.parametrize("action", ["stop", "start"])
+@mock_rds2
+def test_rds_api_budget(action, size):
+    """Verify the rds databases are described once per page."""
+    rds = boto3.client("rds", region_name="eu-west-1")
+    for index in range(size):
+        rds.create_db_instance(
+            DBInstanceIdentifier=f"db-{index}",
+            AllocatedStorage=10,
+            DBInstanceClass="db.m4.large",
+            Engine="mariadb",
+            MasterUsername="root",
+            MasterUserPassword="IamNotHere",
+        )
+        if action == "start":
+            rds.stop_db_instance(DBInstanceIdentifier=f"db-{index}")
+    with count_api_calls() as counter:
+        rds_scheduler = RdsScheduler("eu-west-1")
+        rds_scheduler.tag_api = FakeTagApi([f"db:db-{index}" for index in range(size)])
+        getattr(rds_scheduler, action)(AWS_TAGS)
+    assert counter.service_calls[("rds", f"{action.capitalize()}DBInstance")] == size
+    assert_api_budget(counter, RDS_BUDGETS[action], size)
+
+
+@pytest.mark.parametrize("size", FLEET_SIZES)
+@pytest.mark.parametrize("action", ["stop", "start"])
+@mock_ec2
+@mock_autoscaling
+def test_autoscaling_api_budget(action, size, monkeypatch):
+    """Verify the groups are described once per page."""
+    autoscaling = boto3.client("autoscaling", region_name="eu-west-1")
+    autoscaling.create_launch_configuration(
+        LaunchConfigurationName="lc-test",
+        ImageId="ami-02df9ea15c1778c9c",
+        InstanceType="t2.micro",
+    )
+    for index in range(size):
+        autoscaling.create_auto_scaling_group(
+            AutoScalingGroupName=f"asg-{index}",
+            MaxSize=5,
+            DesiredCapacity=2,
+            MinSize=1,
+            LaunchConfigurationName="lc-test",
+            AvailabilityZones=["eu-west-1a"],
+            Tags=[
+                {
+                    "ResourceId": f"asg-{index}",
+                    "ResourceType": "auto-scaling-group",
+                    "Key": "tostop",
+                    "Value": "true",
+                    "PropagateAtLaunch": True,
+                }
+            ],
+        )
+    with count_api_calls() as counter:
+        asg_scheduler = AutoscalingScheduler("eu-west-1")
+        # moto doesn't implement the resume_processes action
+        monkeypatch.setattr(asg_scheduler.asg, "resume_processes", lambda **kwargs: None)
+        getattr(asg_scheduler, action)(AWS_TAGS)
+    assert counter.service_calls[("ec2", f"{action.capitalize()}Instances")] == size
+    assert_api_budget(counter, AUTOSCALING_BUDGETS[action], size)
+
+
+@pytest.mark.parametrize("size", FLEET_SIZES)
+@pytest.mark.parametrize("action", ["stop", "start"])
+@mock_ecs
+def test_ecs_api_budget(action, size):
+    """Verify the ecs services are updated without other calls."""
+    ecs = boto3.client("ecs", region_name="eu-west-1")
+    ecs.create_cluster(clusterName="cluster")
+    arns = [
+        ecs.create_service(
+            cluster="cluster", serviceName=f"service-{index}", desiredCount=1
+        )["service"]["serviceArn"]
+        for index in range(size)
+    ]
+    with count_api_calls() as counter:
+        ecs_scheduler = EcsScheduler("eu-west-1")
+        ecs_scheduler.tag_api = ArnTagApi(arns)
+        getattr(ecs_scheduler, action)(AWS_TAGS)
+    assert counter.service_calls[("ecs", "UpdateService")] == size
+    assert_api_budget(counter, ECS_BUDGETS[action], size)
+
+
+@pytest.mark.parametrize("size", [1, 60, 250])
+@pytest.mark.parametrize("action", ["stop", "start"])
+def test_cloudwatch_api_budget(action, size, monkeypatch):
+    """Verify the alarm actions are updated by chunks of alarms."""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    alarm_names = []
+
+    def answer(request, event_name, **kwargs):
+        # moto doesn't implement the enable and disable alarm actions
+        alarm_names.append(str(request.body).count("AlarmNames.member"))
+        return AWSResponse(request.url, 200, {}, RawBody(b"<Response/>"))
+
+    arns = [
+        f"arn:aws:cloudwatch:eu-west-1:123456789012:alarm:alarm-{index}"
+        for index in range(size)
+    ]
+    with register_handlers(None, [("before-send.monitoring", answer)]):
+        with count_api_calls() as counter:
+            cloudwatch_scheduler = CloudWatchAlarmScheduler("eu-west-1")
+            cloudwatch_scheduler.tag_api = ArnTagApi(arns)
+            getattr(cloudwatch_scheduler, action)(AWS_TAGS)
+    assert sum(alarm_names) == size
+    assert_api_budget(counter, CLOUDWATCH_BUDGETS[action], size)
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the count of the aws api calls."""
+
+import boto3
+
+from moto import mock_ec2, mock_resourcegroupstaggingapi
+
+from src.scheduler.ec2.handler import InstanceScheduler
+from src.scheduler.libs.api_calls import count_api_calls, is_mutating
+from src.scheduler.libs.schedule_window import STOPPED
+
+from .utils import launch_ec2_instances
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "operation_name, mutating",
+    [
+        ("StopInstances", True),
+        ("UpdateService", True),
+        ("DescribeInstances", False),
+        ("GetResources", False),
+        ("ListTagsForResource", False),
+    ],
+)
+def test_is_mutating(operation_name, mutating):
+    """Verify read operations are not counted as mutating."""
+    assert is_mutating(operation_name) is mutating
+
+
+@mock_ec2
+@mock_resourcegroupstaggingapi
+def test_converged_reconcile_sends_no_mutating_call():
+    """Verify a second reconcile run doesn't change anything."""
+    launch_ec2_instances(2, "eu-west-1", "tostop", "true")
+
+    def _reconcile():
+        with count_api_calls() as counter:
+            ec2_scheduler = InstanceScheduler("eu-west-1")
+            ec2_scheduler.reconcile([{"Key": "tostop", "Values": ["true"]}], lambda tags: STOPPED)
+        return counter
+
+    first = _reconcile()
+    assert first.mutating_calls > 0
+    assert first.calls["DescribeInstances"] >= 1
+    assert _reconcile().mutating_calls == 0
+
+    ec2 = boto3.client("ec2", region_name="eu-west-1")
+    with count_api_calls() as counter:
+        pass
+    ec2.describe_instances()
+    assert counter.calls == {}
@@ -6,8 +6,16 @@ import boto3
 
 from moto import mock_autoscaling, mock_cloudwatch, mock_ec2
 
-from src.scheduler.autoscaling.handler import AutoscalingScheduler
+from src.scheduler.autoscaling.handler import (
+    SAVED_CAPACITY_TAG,
+    SUSPENDED_PROCESSES,
+    AutoscalingScheduler,
+    compact_group,
+    format_capacity,
+    parse_capacity,
+)
 from src.scheduler.cloudwatch.handler import CloudWatchAlarmScheduler
+from src.scheduler.libs.schedule_window import RUNNING, STOPPED
 
 from .utils import launch_asg
 
@@ -20,16 +28,17 @@ import pytest
         ("eu-west-1", [{"Key": "tostop", "Values": ["true"]}], 1),
         ("eu-west-2", [{"Key": "tostop", "Values": ["true"]}], 1),
         ("eu-west-2", [{"Key": "badtagkey", "Values": ["badtagvalue"]}], 0),
+        ("eu-west-1", [{"Key": "tostop", "Values": ["false", "true"]}], 1),
+        ("eu-west-1", "tostop=t* AND NOT env", 1),
+        ("eu-west-1", "tostop!=true", 0),
     ],
 )
 @mock_autoscaling
 def test_list_autoscaling_group(aws_region, aws_tags, result_count):
     """Verify list autoscaling group function."""
     launch_asg(aws_region, "tostop", "true")
-    tag_key = aws_tags[0]["Key"]
-    tag_value = "".join(aws_tags[0]["Values"])
     asg_scheduler = AutoscalingScheduler(aws_region)
-    taglist = asg_scheduler.list_groups(tag_key, tag_value)
+    taglist = asg_scheduler.list_groups(aws_tags)
     assert len(list(taglist)) == result_count
 
 
@@ -85,3 +94,201 @@ def test_asg_instance_stop(aws_region, aws_tags, result_count):
     assert len(asg_instance) == 3
     for instance in asg_instance:
         assert instance["State"] == result_count
+
+
+@pytest.mark.parametrize("aws_region", ["eu-west-1", "eu-west-2"])
+@mock_ec2
+@mock_autoscaling
+def test_asg_group_results(aws_region, monkeypatch):
+    """Verify a result is recorded for each scheduled group."""
+    launch_asg(aws_region, "tostop", "true")
+    asg_scheduler = AutoscalingScheduler(aws_region)
+    # moto doesn't implement the resume_processes action
+    monkeypatch.setattr(asg_scheduler.asg, "resume_processes", lambda **kwargs: None)
+    aws_tags = [{"Key": "tostop", "Values": ["true"]}]
+
+    asg_scheduler.stop(aws_tags)
+    [result] = asg_scheduler.results
+    assert (result.name, result.mode, result.status) == ("asg-test", "suspend", "suspended")
+    assert (result.instance_count, result.scheduled_count) == (3, 3)
+
+    asg_scheduler.start(aws_tags)
+    [result] = asg_scheduler.results
+    assert result.status == "resumed"
+    assert (result.instance_count, result.scheduled_count) == (3, 3)
+
+
+@mock_ec2
+@mock_autoscaling
+def test_asg_skip_standby_and_excluded_instances():
+    """Verify Standby and excluded instances are left running."""
+    instance_ids = [
+        instance["InstanceId"]
+        for instance in launch_asg("eu-west-1", "tostop", "true")["AutoScalingGroups"][0]["Instances"]
+    ]
+    boto3.client("autoscaling", region_name="eu-west-1").enter_standby(
+        AutoScalingGroupName="asg-test",
+        InstanceIds=[instance_ids[0]],
+        ShouldDecrementDesiredCapacity=True,
+    )
+    asg_scheduler = AutoscalingScheduler("eu-west-1")
+    asg_scheduler.stop([{"Key": "tostop", "Values": ["true"]}], to_exclude=[instance_ids[1]])
+
+    assert [instance.lifecycle_state for instance in asg_scheduler.index["asg-test"]] == [
+        "Standby",
+        "InService",
+        "InService",
+    ]
+    [result] = asg_scheduler.results
+    assert (result.instance_count, result.scheduled_count) == (3, 1)
+    ec2 = boto3.client("ec2", region_name="eu-west-1")
+    states = {
+        instance["InstanceId"]: instance["State"]["Name"]
+        for reservation in ec2.describe_instances(InstanceIds=instance_ids)["Reservations"]
+        for instance in reservation["Instances"]
+    }
+    assert [states[instance_id] for instance_id in instance_ids] == ["running", "running", "stopped"]
+
+    asg_scheduler.stop([{"Key": "tostop", "Values": ["true"]}], to_exclude=["asg-test"])
+    assert asg_scheduler.results == []
+
+
+def test_compact_group():
+    """Verify described groups only keep the keys used by the scheduler."""
+    group = {
+        "AutoScalingGroupName": "asg-test",
+        "AutoScalingGroupARN": "arn:aws:autoscaling:eu-west-1:123456789012:autoScalingGroup:asg",
+        "MinSize": 1,
+        "MaxSize": 5,
+        "DesiredCapacity": 3,
+        "Instances": [{"InstanceId": "i-0123456789", "LifecycleState": "InService"}],
+        "SuspendedProcesses": [],
+        "Tags": [{"ResourceId": "asg-test", "Key": "tostop", "Value": "true", "PropagateAtLaunch": True}],
+    }
+    assert compact_group(group) == {
+        "AutoScalingGroupName": "asg-test",
+        "MinSize": 1,
+        "MaxSize": 5,
+        "DesiredCapacity": 3,
+        "SuspendedProcesses": [],
+        "Tags": [{"Key": "tostop", "Value": "true"}],
+    }
+
+
+@pytest.mark.parametrize("aws_region", ["eu-west-1", "eu-west-2"])
+@mock_ec2
+@mock_autoscaling
+def test_asg_capacity_mode(aws_region, monkeypatch):
+    """Verify capacity mode scales the group to 0 and restores it."""
+    launch_asg(aws_region, "tostop", "true")
+    client = boto3.client("autoscaling", region_name=aws_region)
+    asg_scheduler = AutoscalingScheduler(aws_region, mode="capacity")
+    # moto doesn't implement the autoscaling delete_tags action
+    deleted_tags = []
+    monkeypatch.setattr(
+        asg_scheduler.asg, "delete_tags", lambda Tags: deleted_tags.extend(Tags)
+    )
+    aws_tags = [{"Key": "tostop", "Values": ["true"]}]
+
+    asg_scheduler.stop(aws_tags)
+    group = client.describe_auto_scaling_groups()["AutoScalingGroups"][0]
+    assert (group["MinSize"], group["MaxSize"], group["DesiredCapacity"]) == (0, 0, 0)
+    assert asg_scheduler.group_tags(group)[SAVED_CAPACITY_TAG] == "min=1,max=5,desired=3"
+
+    asg_scheduler.start(aws_tags)
+    group = client.describe_auto_scaling_groups()["AutoScalingGroups"][0]
+    assert (group["MinSize"], group["MaxSize"], group["DesiredCapacity"]) == (1, 5, 3)
+    assert [tag["Key"] for tag in deleted_tags] == [SAVED_CAPACITY_TAG]
+
+
+@pytest.mark.parametrize(
+    "group, value",
+    [
+        ({"MinSize": 1, "MaxSize": 5, "DesiredCapacity": 3}, "min=1,max=5,desired=3"),
+        (
+            {
+                "MinSize": 0,
+                "MaxSize": 2,
+                "DesiredCapacity": 1,
+                "WarmPoolConfiguration": {"MinSize": 1, "PoolState": "Stopped"},
+            },
+            "min=0,max=2,desired=1,warm-min=1,warm-max=-1",
+        ),
+    ],
+)
+def test_saved_capacity_format(group, value):
+    """Verify the saved capacity round trip, with warm pools."""
+    assert format_capacity(group) == value
+    capacity = parse_capacity(value)
+    assert capacity["desired"] == group["DesiredCapacity"]
+
+
+class FakeAsg:
+    """Autoscaling client recording its calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, operation):
+        def _call(**kwargs):
+            self.calls.append((operation, kwargs))
+        return _call
+
+
+@pytest.mark.parametrize(
+    "capacity, calls",
+    [
+        ((0, 0, 0), []),
+        (
+            (1, 5, 3),
+            [
+                (
+                    "update_auto_scaling_group",
+                    {
+                        "AutoScalingGroupName": "asg-test",
+                        "MinSize": 0,
+                        "MaxSize": 0,
+                        "DesiredCapacity": 0,
+                    },
+                )
+            ],
+        ),
+    ],
+)
+def test_saved_capacity_scaled_to_0_again(capacity, calls):
+    """Verify a group with a saved capacity still running is scaled to 0."""
+    asg_scheduler = AutoscalingScheduler("eu-west-1", mode="capacity")
+    asg_scheduler.asg = FakeAsg()
+    group = {
+        "AutoScalingGroupName": "asg-test",
+        "MinSize": capacity[0],
+        "MaxSize": capacity[1],
+        "DesiredCapacity": capacity[2],
+        "Tags": [{"Key": SAVED_CAPACITY_TAG, "Value": "min=1,max=5,desired=3"}],
+    }
+    assert asg_scheduler.save_capacity(group)
+    assert asg_scheduler.asg.calls == calls
+
+
+@pytest.mark.parametrize(
+    "suspended, state, action",
+    [
+        (["AZRebalance"], RUNNING, None),
+        (["AZRebalance"], STOPPED, "stop"),
+        (list(SUSPENDED_PROCESSES), RUNNING, "start"),
+        (list(SUSPENDED_PROCESSES), STOPPED, None),
+    ],
+)
+def test_reconcile_group_suspended_by_hand(suspended, state, action):
+    """Verify processes suspended by hand don't make a group stopped."""
+    asg_scheduler = AutoscalingScheduler("eu-west-1")
+    actions = []
+    asg_scheduler.stop_group = lambda group, to_exclude: actions.append("stop")
+    asg_scheduler.start_group = lambda group, to_exclude: actions.append("start")
+    group = {
+        "AutoScalingGroupName": "asg-test",
+        "SuspendedProcesses": [{"ProcessName": name} for name in suspended],
+        "Tags": [],
+    }
+    asg_scheduler.reconcile_group(group, lambda tags: state)
+    assert actions == ([action] if action else [])
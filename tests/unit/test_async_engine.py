@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the asyncio scheduler engine."""
+
+import contextlib
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+
+import pytest
+
+pytest.importorskip("aiobotocore")
+
+from src.scheduler.libs.api_calls import count_api_calls  # noqa: E402
+from src.scheduler.libs.async_engine import AsyncScheduler  # noqa: E402
+from src.scheduler.libs.deadline import (  # noqa: E402
+    Deadline,
+    DeadlineExceeded,
+    set_deadline,
+)
+
+
+ALARM_ARN = "arn:aws:cloudwatch:eu-west-1:123456789012:alarm"
+
+
+class FakeEvents:
+    """Event emitter recording the registered handlers."""
+
+    def __init__(self):
+        self.handlers = []
+
+    def register(self, event_name, handler, unique_id=None):
+        self.handlers.append((event_name, handler))
+
+
+class FakeClient:
+    """Aiobotocore client recording its calls, failing on some alarms."""
+
+    def __init__(self, pages=(), failing=()):
+        self.meta = SimpleNamespace(events=FakeEvents())
+        self.pages = list(pages)
+        self.failing = set(failing)
+        self.calls = []
+        self.tokens = []
+
+    async def get_resources(self, PaginationToken=None, **kwargs):
+        # The token of a page is the index of the page
+        self.tokens.append(PaginationToken)
+        index = int(PaginationToken or 0)
+        page = dict(self.pages[index])
+        if index + 1 < len(self.pages):
+            page["PaginationToken"] = str(index + 1)
+        return page
+
+    async def disable_alarm_actions(self, AlarmNames):
+        self.calls.append(AlarmNames)
+        if self.failing.intersection(AlarmNames):
+            raise ClientError(
+                {"Error": {"Code": "ValidationError"}}, "DisableAlarmActions"
+            )
+
+
+def alarm_page(names):
+    """Return a tagging api page of tagged alarms."""
+    return {
+        "ResourceTagMappingList": [
+            {
+                "ResourceARN": f"{ALARM_ARN}:{name}",
+                "Tags": [{"Key": "tostop", "Value": "true"}],
+            }
+            for name in names
+        ]
+    }
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    """Replace the aiobotocore clients of the engine by fake clients."""
+    fake_clients = {
+        "resourcegroupstaggingapi": FakeClient(
+            pages=[
+                alarm_page(["alarm-0", "alarm-1"]),
+                alarm_page(["alarm-2", "alarm-3"]),
+            ]
+        ),
+        "cloudwatch": FakeClient(failing=["alarm-3"]),
+    }
+
+    @contextlib.asynccontextmanager
+    async def _create_client(self, service_name):
+        yield fake_clients[service_name]
+
+    monkeypatch.setattr(AsyncScheduler, "_create_client", _create_client)
+    return fake_clients
+
+
+def test_async_stop_cloudwatch_alarm_batches(clients):
+    """Verify each page of alarms is sent in one call, retried one by one."""
+    AsyncScheduler("cloudwatch_alarm", "eu-west-1").stop(
+        [{"Key": "tostop", "Values": ["true"]}], to_exclude=["alarm-1"]
+    )
+    assert sorted(clients["cloudwatch"].calls) == [
+        ["alarm-0"],
+        ["alarm-2"],
+        ["alarm-2", "alarm-3"],
+        ["alarm-3"],
+    ]
+
+
+def test_async_clients_counted(clients):
+    """Verify the engine clients get the api call counter handlers."""
+    with count_api_calls() as counter:
+        AsyncScheduler("cloudwatch_alarm", "eu-west-1").stop(
+            [{"Key": "tostop", "Values": ["true"]}]
+        )
+    for client in clients.values():
+        assert client.meta.events.handlers == [("before-call", counter.count)]
+
+
+class FakeContext:
+    """Lambda context spending its time budget on each call."""
+
+    def __init__(self, remaining):
+        self.remaining = remaining
+
+    def get_remaining_time_in_millis(self):
+        self.remaining -= 1000
+        return self.remaining
+
+
+def test_async_stops_at_deadline(clients):
+    """Verify the listing position is kept when the deadline is reached."""
+    scheduler = AsyncScheduler("cloudwatch_alarm", "eu-west-1")
+    set_deadline(Deadline(FakeContext(63000), safety_margin=60))
+    try:
+        with pytest.raises(DeadlineExceeded):
+            scheduler.stop([{"Key": "tostop", "Values": ["true"]}])
+    finally:
+        set_deadline(Deadline())
+    assert clients["cloudwatch"].calls == [["alarm-0", "alarm-1"]]
+    assert scheduler.cursors["cloudwatch:alarm"].token == "1"
+
+
+def test_async_resumes_from_cursors(clients):
+    """Verify a checkpoint resumes the listing from its cursor."""
+    AsyncScheduler("cloudwatch_alarm", "eu-west-1", cursors={"cloudwatch:alarm": "1"}).stop(
+        [{"Key": "tostop", "Values": ["true"]}]
+    )
+    assert clients["resourcegroupstaggingapi"].tokens == ["1"]
+    assert sorted(clients["cloudwatch"].calls) == [
+        ["alarm-2"],
+        ["alarm-2", "alarm-3"],
+        ["alarm-3"],
+    ]
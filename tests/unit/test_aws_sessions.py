@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the assumed role sessions class."""
+
+import threading
+from datetime import datetime, timedelta, timezone
+
+from moto import mock_sts
+
+from src.scheduler.libs import aws_sessions
+from src.scheduler.libs.aws_sessions import (
+    AssumeRoleSessions,
+    account_id_from_role_arn,
+)
+
+import pytest
+
+
+ROLE_ARN = "arn:aws:iam::123456789012:role/scheduler"
+
+
+@mock_sts
+def test_assumed_role_session_is_cached():
+    """Verify credentials are reused until their expiration."""
+    sessions = AssumeRoleSessions()
+    assert sessions.get_session(ROLE_ARN) is sessions.get_session(ROLE_ARN)
+
+
+@mock_sts
+def test_assumed_role_session_is_refreshed():
+    """Verify a new role is assumed when credentials are about to expire."""
+    sessions = AssumeRoleSessions(expiry_margin=7200)
+    assert sessions.get_session(ROLE_ARN) is not sessions.get_session(ROLE_ARN)
+
+
+def test_roles_assumed_in_parallel(monkeypatch):
+    """Verify the roles of different accounts are assumed at the same time."""
+    barrier = threading.Barrier(2, timeout=5)
+
+    class FakeSts:
+        def assume_role(self, RoleArn, RoleSessionName):
+            # Both calls must be in flight to cross the barrier
+            barrier.wait()
+            return {
+                "Credentials": {
+                    "AccessKeyId": "key",
+                    "SecretAccessKey": "secret",
+                    "SessionToken": "token",
+                    "Expiration": datetime.now(timezone.utc) + timedelta(hours=1),
+                }
+            }
+
+    monkeypatch.setattr(aws_sessions, "get_client", lambda service_name: FakeSts())
+    sessions = AssumeRoleSessions()
+    errors = []
+
+    def _get_session(role_arn):
+        try:
+            sessions.get_session(role_arn)
+        except threading.BrokenBarrierError as err:
+            errors.append(err)
+
+    threads = [
+        threading.Thread(target=_get_session, args=(f"arn:aws:iam::{i}:role/scheduler",))
+        for i in ("111111111111", "222222222222")
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+
+
+@pytest.mark.parametrize(
+    "role_arn, account_id",
+    [
+        (ROLE_ARN, "123456789012"),
+        ("arn:aws-cn:iam::210987654321:role/path/scheduler", "210987654321"),
+    ],
+)
+def test_account_id_from_role_arn(role_arn, account_id):
+    """Verify account id extraction from role arn."""
+    assert account_id_from_role_arn(role_arn) == account_id
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the classification of the aws errors."""
+
+import logging
+import threading
+
+from botocore.exceptions import ClientError
+
+from src.scheduler.libs.error_classifier import (
+    FAIL,
+    RETRY,
+    SKIP,
+    ErrorAggregator,
+    account_errors,
+    classify_error,
+    failed_accounts,
+    retry_units,
+)
+from src.scheduler.libs.tracing import propagate
+
+import pytest
+
+
+def client_error(code, message="error message"):
+    """Build an aws api error."""
+    return ClientError({"Error": {"Code": code, "Message": message}}, "StopInstances")
+
+
+@pytest.mark.parametrize(
+    "service, code, result",
+    [
+        ("ec2", "IncorrectInstanceState", ("info", SKIP)),
+        ("ec2", "InvalidParameterCombination", ("warning", SKIP)),
+        ("rds", "InvalidParameterCombination", ("info", SKIP)),
+        ("ecs", "ThrottlingException", ("warning", RETRY)),
+        ("cloudwatch_alarm", "ResourceNotFound", ("info", SKIP)),
+        ("ec2", "AccessDenied", ("error", SKIP)),
+        ("ec2", "InvalidVolume.NotFound", ("info", SKIP)),
+        ("rds", "InvalidDBSnapshotState", ("info", SKIP)),
+        ("ec2", "InternalError", ("error", FAIL)),
+    ],
+)
+def test_classify_error(service, code, result):
+    """Verify error codes are classified per service."""
+    assert classify_error(service, code) == result
+
+
+def test_errors_are_aggregated(caplog):
+    """Verify one summary line is logged per error class."""
+    errors = ErrorAggregator(max_samples=2)
+    for i in range(1000):
+        errors.record(
+            "ec2", "instance", f"i-{i}", client_error("IncorrectInstanceState"), "eu-west-1"
+        )
+    errors.record("ec2", "instance", "i-x", client_error("InternalError"), "eu-west-2")
+
+    with caplog.at_level(logging.INFO):
+        summary = errors.flush()
+
+    assert [(item["code"], item["count"]) for item in summary] == [
+        ("IncorrectInstanceState", 1000),
+        ("InternalError", 1),
+    ]
+    assert summary[0]["samples"] == ["instance i-0: error message", "instance i-1: error message"]
+    assert summary[1]["region"] == "eu-west-2"
+    assert [record.levelno for record in caplog.records] == [logging.INFO, logging.ERROR]
+    assert errors.summary() == []
+
+
+def test_errors_recorded_per_account():
+    """Verify the worker threads record their errors for the account."""
+    errors = ErrorAggregator()
+
+    def _record(instance_id, code):
+        errors.record("ec2", "instance", instance_id, client_error(code), "eu-west-1")
+
+    with account_errors("111111111111"):
+        thread = threading.Thread(target=propagate(_record), args=("i-0,i-3", "Throttling"))
+        thread.start()
+        thread.join()
+        _record("i-1", "AuthFailure")
+    _record("i-2", "AuthFailure")
+
+    summary = errors.summary()
+
+    assert sorted((item["account"], item["code"]) for item in summary) == [
+        ("", "AuthFailure"),
+        ("111111111111", "AuthFailure"),
+        ("111111111111", "Throttling"),
+    ]
+    assert retry_units(summary) == [
+        {
+            "account": "111111111111",
+            "service": "ec2",
+            "region": "eu-west-1",
+            "resource_ids": ["i-0", "i-3"],
+        }
+    ]
+    assert failed_accounts(summary) == {"111111111111": 1, "": 1}
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the lambda event configuration."""
+
+from src.scheduler.libs.event_config import load_config, validate_event
+
+import pytest
+
+
+@pytest.fixture
+def scheduler_env(monkeypatch):
+    """Lambda environment of an ec2 stop scheduler."""
+    monkeypatch.setenv("SCHEDULE_ACTION", "stop")
+    monkeypatch.setenv("AWS_REGIONS", "eu-west-1, eu-west-2")
+    monkeypatch.setenv("TAG_KEY", "tostop")
+    monkeypatch.setenv("TAG_VALUE", "true")
+    monkeypatch.setenv("EC2_SCHEDULE", "true")
+    monkeypatch.setenv("RDS_SCHEDULE", "false")
+
+
+def test_load_config_from_environment(scheduler_env):
+    """Verify configuration is read from the environment."""
+    config = load_config({})
+    assert config["action"] == "stop"
+    assert config["regions"] == ["eu-west-1", "eu-west-2"]
+    assert config["services"] == ["ec2"]
+    assert config["tags"] == [{"Key": "tostop", "Values": ["true"]}]
+    assert config["exclude"] is None
+
+
+def test_load_config_event_override(scheduler_env):
+    """Verify event keys override the environment."""
+    config = load_config(
+        {
+            "action": "start",
+            "regions": ["us-east-1"],
+            "services": ["rds", "ecs"],
+            "exclude": ["i-0123456789abcdef0"],
+        }
+    )
+    assert config["action"] == "start"
+    assert config["regions"] == ["us-east-1"]
+    assert config["services"] == ["rds", "ecs"]
+    assert config["tags"] == [{"Key": "tostop", "Values": ["true"]}]
+    assert config["exclude"] == ["i-0123456789abcdef0"]
+
+
+def test_scheduled_event_is_ignored():
+    """Verify cloudwatch scheduled events don't override anything."""
+    event = {"source": "aws.events", "region": "eu-west-1", "detail": {}}
+    assert validate_event(event) == {}
+
+
+@pytest.mark.parametrize(
+    "event",
+    [
+        {"action": "terminate"},
+        {"regions": "eu-west-1"},
+        {"services": ["lambda"]},
+        {"tags": [{"Values": ["true"]}]},
+        {"tags": [{"Key": "tostop", "Values": [True]}]},
+        {"exclude": [1]},
+        {"reconcile_window": "08:00-20:00"},
+        {"checkpoint": [{"region": "eu-west-1", "service": "lambda"}]},
+        {"unknown": "key"},
+        ["stop"],
+    ],
+)
+def test_invalid_event(event):
+    """Verify invalid events are rejected."""
+    with pytest.raises(ValueError):
+        validate_event(event)
+
+
+def test_load_config_reconcile_window(scheduler_env, monkeypatch):
+    """Verify the reconcile window is read from the environment."""
+    monkeypatch.setenv("RECONCILE_WINDOW", "UTC 08:00-20:00 MON-FRI")
+    assert load_config({"action": "reconcile"})["reconcile_window"] == "UTC 08:00-20:00 MON-FRI"
+
+    monkeypatch.setenv("RECONCILE_WINDOW", "UTC 08:00")
+    with pytest.raises(ValueError):
+        load_config({})
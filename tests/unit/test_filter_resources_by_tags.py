@@ -9,7 +9,11 @@ from moto import (
     mock_resourcegroupstaggingapi,
 )
 
-from src.scheduler.libs.filter_resources_by_tags import FilterByTags
+from src.scheduler.libs.filter_resources_by_tags import (
+    FilterByTags,
+    TaggedResource,
+    compact_tags,
+)
 from src.scheduler.ec2.handler import InstanceScheduler
 
 from .utils import launch_ec2_instances
@@ -32,6 +36,18 @@ import pytest
             [{"Key": "tostop-ec2-test-1", "Values": ["true"]}],
             0,
         ),
+        (
+            "eu-west-1",
+            [{"Key": "tostop-ec2-test-1", "Values": ["true"]}],
+            "tostop-ec2-test-1 AND NOT wrongkey",
+            2,
+        ),
+        (
+            "eu-west-1",
+            [{"Key": "tostop-ec2-test-1", "Values": ["true"]}],
+            "tostop-ec2-test-1=t* OR wrongkey=wrongvalue",
+            5,
+        ),
     ],
 )
 @mock_ec2
@@ -47,3 +63,67 @@ def test_filter_instances(aws_region, instance_tag, scheduler_tag, result_count)
     instance_arns = tag_api.get_resources("ec2:instance", scheduler_tag)
 
     assert len(list(instance_arns)) == result_count
+
+
+@pytest.mark.parametrize(
+    "arn, resource_type, parent_id, resource_id",
+    [
+        ("arn:aws:ec2:eu-west-1:123456789012:instance/i-0123456789", "instance", None, "i-0123456789"),
+        ("arn:aws:ecs:eu-west-1:123456789012:service/cluster/web", "service", "cluster", "web"),
+        ("arn:aws:ecs:eu-west-1:123456789012:service/web", "service", None, "web"),
+        ("arn:aws:rds:eu-west-1:123456789012:db:database-1", "db", None, "database-1"),
+        ("arn:aws:cloudwatch:eu-west-1:123456789012:alarm:cpu:high", "alarm", None, "cpu:high"),
+        ("arn:aws:s3:::bucket", "", None, "bucket"),
+    ],
+)
+def test_tagged_resource_arn(arn, resource_type, parent_id, resource_id):
+    """Verify arn parsing of tagged resources."""
+    resource = TaggedResource(arn, {})
+    assert resource.resource_type == resource_type
+    assert resource.parent_id == parent_id
+    assert resource.resource_id == resource_id
+
+
+@pytest.mark.parametrize(
+    "tags, to_exclude, result",
+    [
+        ({}, [], False),
+        ({}, ["i-0123456789"], True),
+        ({"scheduler:exclude": "True"}, [], True),
+        ({"scheduler:exclude": "false"}, [], False),
+    ],
+)
+def test_tagged_resource_is_excluded(tags, to_exclude, result):
+    """Verify resource exclusion by id or by tag."""
+    arn = "arn:aws:ec2:eu-west-1:123456789012:instance/i-0123456789"
+    assert TaggedResource(arn, tags).is_excluded(to_exclude) is result
+
+
+@pytest.mark.parametrize(
+    "resource_ids, result",
+    [
+        (None, True),
+        ({"web"}, True),
+        ({"cluster"}, True),
+        ({"api"}, False),
+    ],
+)
+def test_tagged_resource_is_selected(resource_ids, result):
+    """Verify resource selection by id or by parent id."""
+    arn = "arn:aws:ecs:eu-west-1:123456789012:service/cluster/web"
+    assert TaggedResource(arn, {}).is_selected(resource_ids) is result
+
+
+def test_tagged_resources_share_repeated_strings():
+    """Verify the repeated arn parts and tags are stored once."""
+    first, second = (
+        TaggedResource(
+            f"arn:aws:ecs:eu-west-1:123456789012:service/cluster/web-{index}",
+            compact_tags([{"Key": "tostop", "Value": "".join(["tr", "ue"])}]),
+        )
+        for index in range(2)
+    )
+    assert first.region is second.region
+    assert first.parent_id is second.parent_id
+    assert first.tags == {"tostop": "true"}
+    assert first.tags["tostop"] is second.tags["tostop"]
@@ -12,7 +12,8 @@ from moto import (
 )
 
 from src.scheduler.cloudwatch.handler import CloudWatchAlarmScheduler
-from src.scheduler.ec2.handler import InstanceScheduler
+from src.scheduler.ec2.handler import InstanceScheduler, apply_instances_action
+from src.scheduler.libs.schedule_window import RUNNING, STOPPED
 
 from .utils import launch_asg, launch_ec2_instances
 
@@ -160,3 +161,200 @@ def test_do_not_start_asg_instance(aws_region, aws_tags, result_count):
     assert len(instances) == 3
     for instance in instances:
         assert instance["State"] == result_count
+
+
+@mock_ec2
+def test_batch_action_retries_instances_one_by_one():
+    """Verify an invalid instance doesn't fail the rest of its batch."""
+    client = boto3.client("ec2", region_name="eu-west-1")
+    instances = launch_ec2_instances(2, "eu-west-1", "tostop", "true")["Instances"]
+    instance_ids = [instance["InstanceId"] for instance in instances]
+
+    stopped_ids = apply_instances_action(client, "stop", ["i-00000000000000000"] + instance_ids)
+    assert stopped_ids == instance_ids
+    for instance in client.describe_instances()["Reservations"][0]["Instances"]:
+        assert instance["State"] == {"Code": 80, "Name": "stopped"}
+
+
+class FakeSpotEc2:
+    """Ec2 client with on-demand and spot instances."""
+
+    def __init__(self):
+        self.calls = []
+
+    def describe_instances(self, InstanceIds):
+        self.calls.append(("describe_instances", InstanceIds))
+        return {
+            "Reservations": [
+                {
+                    "Instances": [
+                        {"InstanceId": "i-ondemand"},
+                        {
+                            "InstanceId": "i-persistent",
+                            "InstanceLifecycle": "spot",
+                            "SpotInstanceRequestId": "sir-persistent",
+                        },
+                        {
+                            "InstanceId": "i-hibernate",
+                            "InstanceLifecycle": "spot",
+                            "SpotInstanceRequestId": "sir-hibernate",
+                        },
+                        {
+                            "InstanceId": "i-onetime",
+                            "InstanceLifecycle": "spot",
+                            "SpotInstanceRequestId": "sir-onetime",
+                        },
+                    ]
+                }
+            ]
+        }
+
+    def describe_spot_instance_requests(self, SpotInstanceRequestIds):
+        self.calls.append(("describe_spot_instance_requests", SpotInstanceRequestIds))
+        return {
+            "SpotInstanceRequests": [
+                {
+                    "SpotInstanceRequestId": "sir-persistent",
+                    "Type": "persistent",
+                    "InstanceInterruptionBehavior": "stop",
+                },
+                {
+                    "SpotInstanceRequestId": "sir-hibernate",
+                    "Type": "persistent",
+                    "InstanceInterruptionBehavior": "hibernate",
+                },
+                {
+                    "SpotInstanceRequestId": "sir-onetime",
+                    "Type": "one-time",
+                    "InstanceInterruptionBehavior": "terminate",
+                },
+            ]
+        }
+
+    def __getattr__(self, operation):
+        def _call(**kwargs):
+            self.calls.append((operation, kwargs))
+        return _call
+
+
+def test_stop_batch_by_instance_class():
+    """Verify each instance class gets its own bulk action."""
+    ec2_scheduler = InstanceScheduler("eu-west-1")
+    ec2_scheduler.ec2 = FakeSpotEc2()
+    ec2_scheduler.stop_batch(["i-ondemand", "i-persistent", "i-hibernate", "i-onetime"])
+    assert ec2_scheduler.ec2.calls[2:] == [
+        ("stop_instances", {"InstanceIds": ["i-ondemand", "i-persistent"]}),
+        ("stop_instances", {"InstanceIds": ["i-hibernate"], "Hibernate": True}),
+        ("cancel_spot_instance_requests", {"SpotInstanceRequestIds": ["sir-onetime"]}),
+        ("terminate_instances", {"InstanceIds": ["i-onetime"]}),
+    ]
+
+
+def test_start_batch_skips_terminated_spot():
+    """Verify terminated spot instances are not started."""
+    ec2_scheduler = InstanceScheduler("eu-west-1")
+    ec2_scheduler.ec2 = FakeSpotEc2()
+    ec2_scheduler.start_batch(["i-ondemand", "i-persistent", "i-hibernate", "i-onetime"])
+    assert ec2_scheduler.ec2.calls[2:] == [
+        ("start_instances", {"InstanceIds": ["i-ondemand", "i-persistent", "i-hibernate"]}),
+    ]
+    assert list(ec2_scheduler.started) == ["i-ondemand", "i-persistent", "i-hibernate"]
+
+
+class FakeFleetSpotEc2(FakeSpotEc2):
+    """Ec2 client with spot instances without spot request."""
+
+    def describe_instances(self, InstanceIds):
+        self.calls.append(("describe_instances", InstanceIds))
+        return {
+            "Reservations": [
+                {
+                    "Instances": [
+                        {"InstanceId": "i-fleet-1", "InstanceLifecycle": "spot"},
+                        {"InstanceId": "i-fleet-2", "InstanceLifecycle": "spot"},
+                        {"InstanceId": "i-ondemand"},
+                    ]
+                }
+            ]
+        }
+
+
+def test_stop_batch_spot_without_request(caplog):
+    """Verify spot instances without request are stopped as on-demand."""
+    ec2_scheduler = InstanceScheduler("eu-west-1")
+    ec2_scheduler.ec2 = FakeFleetSpotEc2()
+    ec2_scheduler.stop_batch(["i-fleet-1", "i-fleet-2", "i-ondemand"])
+    assert ec2_scheduler.ec2.calls[1:] == [
+        ("stop_instances", {"InstanceIds": ["i-fleet-1", "i-fleet-2", "i-ondemand"]}),
+    ]
+    assert "spot instance i-fleet-2 without spot request" in caplog.text
+
+
+class FakeHibernateEc2(FakeSpotEc2):
+    """Ec2 client with hibernation enabled and disabled instances."""
+
+    def describe_instances(self, InstanceIds):
+        self.calls.append(("describe_instances", InstanceIds))
+        return {
+            "Reservations": [
+                {
+                    "Instances": [
+                        {
+                            "InstanceId": "i-enabled",
+                            "HibernationOptions": {"Configured": True},
+                            "State": {"Name": "running"},
+                            "StateReason": {"Code": "Client.UserInitiatedHibernate"},
+                        },
+                        {
+                            "InstanceId": "i-disabled",
+                            "HibernationOptions": {"Configured": False},
+                            "State": {"Name": "running"},
+                        },
+                    ]
+                }
+            ]
+        }
+
+
+def test_stop_batch_hibernate_fallback():
+    """Verify instances without hibernation enabled are stopped."""
+    ec2_scheduler = InstanceScheduler("eu-west-1")
+    ec2_scheduler.ec2 = FakeHibernateEc2()
+    ec2_scheduler.stop_batch(["i-enabled", "i-disabled"], ["i-enabled", "i-disabled"])
+    assert ec2_scheduler.ec2.calls[1:] == [
+        ("stop_instances", {"InstanceIds": ["i-disabled"]}),
+        ("stop_instances", {"InstanceIds": ["i-enabled"], "Hibernate": True}),
+    ]
+
+
+def test_running_times_by_stop_mode():
+    """Verify the time to running is recorded per stop mode."""
+    ec2_scheduler = InstanceScheduler("eu-west-1")
+    ec2_scheduler.ec2 = FakeHibernateEc2()
+    ec2_scheduler.waiter.ec2 = ec2_scheduler.ec2
+    ec2_scheduler.start_batch(["i-enabled", "i-disabled"])
+    ec2_scheduler.wait_until_ready()
+    assert list(ec2_scheduler.running_times["hibernate"]) == ["i-enabled"]
+    assert list(ec2_scheduler.running_times["stop"]) == ["i-disabled"]
+
+
+@mock_ec2
+@mock_cloudwatch
+@mock_autoscaling
+@mock_resourcegroupstaggingapi
+def test_reconcile_ec2_instance():
+    """Verify instances are stopped or started to match their schedule."""
+    client = boto3.client("ec2", region_name="eu-west-1")
+    instances = launch_ec2_instances(2, "eu-west-1", "schedule", "UTC 08:00-20:00")["Instances"]
+    instance_ids = [instance["InstanceId"] for instance in instances]
+    client.stop_instances(InstanceIds=[instance_ids[0]])
+
+    ec2_scheduler = InstanceScheduler("eu-west-1")
+    ec2_scheduler.cloudwatch_alarm = CloudWatchAlarmScheduler("eu-west-1")
+    ec2_scheduler.reconcile([{"Key": "schedule"}], lambda tags: RUNNING)
+    assert list(ec2_scheduler.started) == [instance_ids[0]]
+
+    ec2_scheduler.reconcile([{"Key": "schedule"}], lambda tags: STOPPED)
+    for reservation in client.describe_instances(InstanceIds=instance_ids)["Reservations"]:
+        for instance in reservation["Instances"]:
+            assert instance["State"] == {"Code": 80, "Name": "stopped"}
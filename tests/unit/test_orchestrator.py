@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the dependency aware orchestration."""
+
+from src.scheduler.libs.deadline import (
+    Deadline,
+    DeadlineExceeded,
+    set_deadline,
+    wait_budget,
+)
+from src.scheduler.ecs.handler import EcsScheduler
+from src.scheduler.libs.orchestrator import (
+    DEFAULT_DEPENDENCIES,
+    build_waves,
+    parse_dependencies,
+    run_waves,
+)
+
+import pytest
+
+
+class FakeScheduler:
+    """Scheduler recording its calls."""
+
+    def __init__(self, name, calls, fail=False):
+        self.name = name
+        self.calls = calls
+        self.fail = fail
+
+    def start(self, **kwargs):
+        self.calls.append(("start", self.name))
+        if self.fail:
+            raise RuntimeError(self.name)
+
+    def stop(self, **kwargs):
+        self.calls.append(("stop", self.name))
+
+    def reconcile(self, desired_state, **kwargs):
+        for tags in ({"schedule": "off"}, {"schedule": "on"}):
+            if desired_state(tags):
+                self.calls.append((desired_state(tags), self.name))
+
+    def wait_until_ready(self):
+        self.calls.append(("ready", self.name))
+
+
+@pytest.mark.parametrize(
+    "services, waves",
+    [
+        (
+            ["autoscaling", "ec2", "ecs", "rds", "cloudwatch_alarm"],
+            [["rds"], ["autoscaling", "ec2", "ecs"], ["cloudwatch_alarm"]],
+        ),
+        (["ec2", "cloudwatch_alarm"], [["ec2"], ["cloudwatch_alarm"]]),
+        (["ec2", "ecs"], [["ec2", "ecs"]]),
+    ],
+)
+def test_build_waves(services, waves):
+    """Verify services are grouped following their dependencies."""
+    assert build_waves(services, DEFAULT_DEPENDENCIES) == waves
+
+
+def test_build_waves_cycle():
+    """Verify dependency cycles are rejected."""
+    with pytest.raises(ValueError):
+        build_waves(["ec2", "rds"], {"ec2": ["rds"], "rds": ["ec2"]})
+
+
+def test_parse_dependencies():
+    """Verify dependency graph parsing."""
+    assert parse_dependencies("ec2:rds, cloudwatch_alarm:ec2|rds, ecs:") == {
+        "ec2": ["rds"],
+        "cloudwatch_alarm": ["ec2", "rds"],
+        "ecs": [],
+    }
+
+
+def test_run_waves_start():
+    """Verify a wave starts when the previous one is ready."""
+    calls = []
+    waves = [[FakeScheduler("rds", calls)], [FakeScheduler("ec2", calls)]]
+    run_waves(waves, "start", max_workers=2)
+    assert calls == [
+        ("start", "rds"),
+        ("ready", "rds"),
+        ("start", "ec2"),
+        ("ready", "ec2"),
+    ]
+
+
+def test_run_waves_stop():
+    """Verify stop runs the waves in reverse order."""
+    calls = []
+    waves = [[FakeScheduler("rds", calls)], [FakeScheduler("ec2", calls)]]
+    run_waves(waves, "stop", max_workers=2)
+    assert calls == [("stop", "ec2"), ("stop", "rds")]
+
+
+def test_run_waves_reconcile():
+    """Verify reconcile stops in the stop order then starts in the start order."""
+    calls = []
+    waves = [[FakeScheduler("rds", calls)], [FakeScheduler("ec2", calls)]]
+    run_waves(
+        waves,
+        "reconcile",
+        max_workers=2,
+        desired_state=lambda tags: {"off": "stopped", "on": "running"}[tags["schedule"]],
+    )
+    assert calls == [
+        ("stopped", "ec2"),
+        ("stopped", "rds"),
+        ("running", "rds"),
+        ("ready", "rds"),
+        ("running", "ec2"),
+        ("ready", "ec2"),
+    ]
+
+
+def test_run_waves_error():
+    """Verify a failing wave prevents the next waves to run."""
+    calls = []
+    waves = [
+        [FakeScheduler("rds", calls, fail=True), FakeScheduler("ecs", calls)],
+        [FakeScheduler("ec2", calls)],
+    ]
+    with pytest.raises(RuntimeError):
+        run_waves(waves, "start", max_workers=2)
+    assert ("start", "ecs") in calls
+    assert ("start", "ec2") not in calls
+
+
+class FakeContext:
+    """Lambda context with a fixed remaining time."""
+
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+def test_run_waves_deadline():
+    """Verify the schedulers are not run once the deadline is reached."""
+    calls = []
+    context = FakeContext(120000)
+    rds, ec2 = FakeScheduler("rds", calls), FakeScheduler("ec2", calls)
+
+    def _stop_clock():
+        calls.append(("ready", "rds"))
+        context.remaining_ms = 30000
+
+    rds.wait_until_ready = _stop_clock
+    set_deadline(Deadline(context, safety_margin=60))
+    try:
+        unfinished = run_waves([[rds], [ec2]], "start", max_workers=2)
+    finally:
+        set_deadline(Deadline())
+    assert calls == [("start", "rds"), ("ready", "rds")]
+    assert unfinished == [ec2]
+
+
+class FakeWaiter:
+    """Waiter recording its configurations."""
+
+    def __init__(self):
+        self.configs = []
+
+    def wait(self, WaiterConfig, **kwargs):
+        self.configs.append(WaiterConfig)
+
+
+class FakeEcs:
+    """Ecs client returning a fake waiter."""
+
+    def __init__(self):
+        self.waiter = FakeWaiter()
+
+    def get_waiter(self, name):
+        return self.waiter
+
+
+@pytest.mark.parametrize(
+    "remaining_ms, max_attempts", [(900000, [40]), (150000, [6]), (70000, [])]
+)
+def test_readiness_wait_bounded_by_deadline(remaining_ms, max_attempts):
+    """Verify readiness waits don't outlast the invocation."""
+    ecs_scheduler = EcsScheduler("eu-west-1")
+    ecs_scheduler.ecs = FakeEcs()
+    ecs_scheduler.started_services = {"cluster": ["service"]}
+    set_deadline(Deadline(FakeContext(remaining_ms), safety_margin=60))
+    try:
+        budget = wait_budget(1200)
+        if max_attempts:
+            ecs_scheduler.wait_until_ready()
+        else:
+            with pytest.raises(DeadlineExceeded):
+                ecs_scheduler.wait_until_ready()
+    finally:
+        set_deadline(Deadline())
+    assert budget == min(1200, remaining_ms / 1000 - 60)
+    configs = ecs_scheduler.ecs.waiter.configs
+    assert [config["MaxAttempts"] for config in configs] == max_attempts
+
+
+def test_run_waves_readiness_deadline():
+    """Verify a readiness wait cut by the deadline checkpoints its wave."""
+    calls = []
+    rds, ec2 = FakeScheduler("rds", calls), FakeScheduler("ec2", calls)
+
+    def _deadline():
+        calls.append(("ready", "rds"))
+        raise DeadlineExceeded("rds not available")
+
+    rds.wait_until_ready = _deadline
+    unfinished = run_waves([[rds], [ec2]], "start", max_workers=2)
+    assert calls == [("start", "rds"), ("ready", "rds")]
+    assert unfinished == [rds, ec2]
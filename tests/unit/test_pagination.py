@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the resumable paging of the aws list apis."""
+
+from moto import mock_ec2, mock_resourcegroupstaggingapi
+
+from src.scheduler.libs.filter_resources_by_tags import FilterByTags
+from src.scheduler.libs.pagination import PageCursor, paginate
+
+from .utils import launch_ec2_instances
+
+
+class FakeListApi:
+    """Paged list api of 7 items."""
+
+    def __init__(self):
+        self.requests = []
+
+    def list_items(self, NextToken="0", MaxRecords=3):
+        self.requests.append({"NextToken": NextToken, "MaxRecords": MaxRecords})
+        start = int(NextToken)
+        page = {"Items": list(range(7))[start:start + MaxRecords]}
+        if start + MaxRecords < 7:
+            page["NextToken"] = str(start + MaxRecords)
+        return page
+
+
+def test_paginate_all_pages():
+    """Verify every page is listed with the cursor page size."""
+    api = FakeListApi()
+    cursor = PageCursor(page_size=2)
+    items = list(paginate(api.list_items, "NextToken", "Items", cursor, size_name="MaxRecords"))
+    assert items == list(range(7))
+    assert cursor.to_dict() == {"token": None, "pages": 4, "items": 7}
+
+
+def test_paginate_resume():
+    """Verify an interrupted listing resumes from its last page."""
+    api = FakeListApi()
+    cursor = PageCursor()
+    listing = paginate(api.list_items, "NextToken", "Items", cursor)
+    assert [next(listing) for _ in range(4)] == [0, 1, 2, 3]
+    # The token only moves once the whole page is consumed
+    assert cursor.token == "3"
+
+    resumed = PageCursor(token=cursor.token)
+    assert list(paginate(api.list_items, "NextToken", "Items", resumed)) == [3, 4, 5, 6]
+    assert api.requests[-2:] == [
+        {"NextToken": "3", "MaxRecords": 3},
+        {"NextToken": "6", "MaxRecords": 3},
+    ]
+
+
+@mock_ec2
+@mock_resourcegroupstaggingapi
+def test_filter_by_tags_cursor():
+    """Verify the tagged resources listing position is recorded."""
+    launch_ec2_instances(5, "eu-west-1", "tostop", "true")
+    aws_tags = [{"Key": "tostop", "Values": ["true"]}]
+
+    tag_api = FilterByTags("eu-west-1", page_size=2)
+    listing = tag_api.get_resources("ec2:instance", aws_tags)
+    next(listing)
+    assert tag_api.cursors["ec2:instance"].to_dict() == {"token": None, "pages": 1, "items": 1}
+    assert len(list(listing)) == 4
+    assert tag_api.cursors["ec2:instance"].to_dict() == {"token": None, "pages": 3, "items": 5}
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the discovery to action pipeline."""
+
+import threading
+
+from src.scheduler.libs.deadline import Deadline, DeadlineExceeded, set_deadline
+from src.scheduler.libs.pipeline import batched, run_pipeline
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "items, size, result",
+    [
+        (range(5), 2, [[0, 1], [2, 3], [4]]),
+        (range(4), 2, [[0, 1], [2, 3]]),
+        ([], 3, []),
+    ],
+)
+def test_batched(items, size, result):
+    """Verify items are grouped in batches."""
+    assert list(batched(items, size)) == result
+
+
+def test_pipeline_consumes_all_batches():
+    """Verify every discovered item is consumed once."""
+    consumed = []
+    run_pipeline(iter(range(103)), consumed.extend, batch_size=10, workers=3)
+    assert sorted(consumed) == list(range(103))
+
+
+def test_pipeline_is_bounded():
+    """Verify discovery pauses while the workers are busy."""
+    release = threading.Event()
+    produced = []
+
+    def _items():
+        for item in range(100):
+            produced.append(item)
+            yield item
+
+    def _consume(batch):
+        release.wait(timeout=5)
+
+    thread = threading.Thread(
+        target=run_pipeline,
+        args=(_items(), _consume),
+        kwargs={"batch_size": 5, "workers": 1, "max_pending": 2},
+    )
+    thread.start()
+    thread.join(timeout=0.5)
+    # one batch in the worker, two in the queue, one waiting to be queued
+    assert len(produced) <= 4 * 5
+    release.set()
+    thread.join()
+    assert len(produced) == 100
+
+
+def test_pipeline_raises_worker_error():
+    """Verify the first worker error stops the pipeline."""
+    consumed = []
+
+    def _consume(batch):
+        consumed.append(batch)
+        raise ValueError("batch failed")
+
+    with pytest.raises(ValueError):
+        run_pipeline(iter(range(100)), _consume, batch_size=10, workers=1, max_pending=1)
+    assert len(consumed) == 1
+
+
+def test_pipeline_stops_at_deadline():
+    """Verify no batch is queued once the deadline is reached."""
+
+    class _Context:
+        remaining_ms = 120000
+
+        def get_remaining_time_in_millis(self):
+            return self.remaining_ms
+
+    context = _Context()
+    consumed = []
+
+    def _consume(batch):
+        consumed.append(batch)
+        context.remaining_ms = 1000
+
+    set_deadline(Deadline(context, safety_margin=60))
+    try:
+        with pytest.raises(DeadlineExceeded):
+            run_pipeline(iter(range(100)), _consume, batch_size=10, workers=1, max_pending=1)
+    finally:
+        set_deadline(Deadline())
+    assert 1 <= len(consumed) <= 3
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the rds scheduler classes."""
+
+from botocore.exceptions import ClientError
+
+from moto import mock_rds2
+
+from src.scheduler.libs.deadline import Deadline, DeadlineExceeded, set_deadline
+from src.scheduler.libs.filter_resources_by_tags import TaggedResource
+from src.scheduler.rds.handler import RdsScheduler, classify_db_instance
+from src.scheduler.rds.readiness import RdsReadinessTracker
+
+from .utils import launch_rds_instance
+
+import pytest
+
+
+class FakePaginator:
+    """Paginator returning the next page of a status sequence."""
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, **kwargs):
+        page = self.pages.pop(0) if len(self.pages) > 1 else self.pages[0]
+        if isinstance(page, Exception):
+            raise page
+        return [page]
+
+
+class FakeRds:
+    """Rds client with scripted database statuses."""
+
+    def __init__(self, instance_statuses):
+        self.paginator = FakePaginator(
+            [
+                {
+                    "DBInstances": [
+                        {"DBInstanceIdentifier": db_id, "DBInstanceStatus": status}
+                        for db_id, status in statuses.items()
+                    ]
+                }
+                for statuses in instance_statuses
+            ]
+        )
+
+    def get_paginator(self, operation_name):
+        return self.paginator
+
+
+@pytest.mark.parametrize("aws_region", ["eu-west-1", "eu-west-2"])
+@mock_rds2
+def test_track_available_rds_instance(aws_region):
+    """Verify available rds instances are reported without waiting."""
+    launch_rds_instance(aws_region, "tostop", "true")
+    sleeps = []
+    tracker = RdsReadinessTracker(aws_region, sleep=sleeps.append)
+    report = tracker.track(["db-instance", "missing"])
+    assert list(report["instances"]) == ["db-instance"]
+    assert report["not_ready"] == ["missing"]
+    assert sleeps == []
+
+
+def test_track_adaptive_delay():
+    """Verify the poll delay grows without progress and resets after."""
+    sleeps = []
+    tracker = RdsReadinessTracker(
+        "eu-west-1", min_delay=10, max_delay=30, sleep=sleeps.append
+    )
+    tracker.rds = FakeRds(
+        [
+            {"db-1": "starting", "db-2": "starting"},
+            {"db-1": "starting", "db-2": "starting"},
+            {"db-1": "starting", "db-2": "starting"},
+            {"db-1": "available", "db-2": "starting"},
+            {"db-1": "available", "db-2": "available"},
+        ]
+    )
+    report = tracker.track(["db-1", "db-2"])
+    assert sorted(report["instances"]) == ["db-1", "db-2"]
+    assert report["not_ready"] == []
+    assert sleeps == [10, 20, 30, 10]
+
+
+def test_track_timeout():
+    """Verify databases still starting at the timeout are reported."""
+    tracker = RdsReadinessTracker(
+        "eu-west-1", min_delay=10, timeout=25, sleep=lambda delay: None
+    )
+    tracker.rds = FakeRds([{"db-1": "starting"}])
+    report = tracker.track(["db-1"])
+    assert report == {"instances": {}, "clusters": {}, "not_ready": ["db-1"]}
+
+
+def test_track_polls_again_after_errors():
+    """Verify a throttled poll is recorded and the databases polled again."""
+    sleeps = []
+    tracker = RdsReadinessTracker("eu-west-1", min_delay=10, sleep=sleeps.append)
+    tracker.rds = FakeRds([{"db-1": "starting"}, {"db-1": "available"}])
+    tracker.rds.paginator.pages.insert(
+        0, ClientError({"Error": {"Code": "Throttling"}}, "DescribeDBInstances")
+    )
+    report = tracker.track(["db-1"])
+    assert list(report["instances"]) == ["db-1"]
+    assert sleeps == [10, 20]
+
+
+class FakeContext:
+    """Lambda context with a fixed remaining time."""
+
+    def get_remaining_time_in_millis(self):
+        return 85000
+
+
+def test_track_bounded_by_deadline():
+    """Verify the tracker stops waiting before the invocation deadline."""
+    sleeps = []
+    tracker = RdsReadinessTracker("eu-west-1", min_delay=10, sleep=sleeps.append)
+    tracker.rds = FakeRds([{"db-1": "starting"}])
+    set_deadline(Deadline(FakeContext(), safety_margin=60))
+    try:
+        with pytest.raises(DeadlineExceeded):
+            tracker.track(["db-1"])
+    finally:
+        set_deadline(Deadline())
+    assert sleeps == [10, 20]
+
+
+class FakeTagApi:
+    """Tagging api returning fixed rds resources."""
+
+    def __init__(self, resources):
+        self.resources = resources
+
+    def get_resources(self, resource_type, aws_tags):
+        return [
+            TaggedResource(f"arn:aws:rds:eu-west-1:123456789012:{arn}", {})
+            for arn in self.resources
+            if arn.startswith(resource_type.split(":")[1] + ":")
+        ]
+
+
+class FakeClusterRds:
+    """Rds client with clusters, members, replicas and standalone instances."""
+
+    pages = {
+        "describe_db_instances": {
+            "DBInstances": [
+                {"DBInstanceIdentifier": "standalone", "DBInstanceStatus": "available"},
+                {"DBInstanceIdentifier": "stopping", "DBInstanceStatus": "stopping"},
+                {
+                    "DBInstanceIdentifier": "member-1",
+                    "DBInstanceStatus": "available",
+                    "DBClusterIdentifier": "aurora",
+                },
+                {
+                    "DBInstanceIdentifier": "member-2",
+                    "DBInstanceStatus": "available",
+                    "DBClusterIdentifier": "aurora",
+                },
+                {
+                    "DBInstanceIdentifier": "replica",
+                    "DBInstanceStatus": "available",
+                    "ReadReplicaSourceDBInstanceIdentifier": "standalone",
+                },
+            ]
+        },
+        "describe_db_clusters": {
+            "DBClusters": [
+                {"DBClusterIdentifier": "aurora", "Status": "available", "EngineMode": "provisioned"},
+                {"DBClusterIdentifier": "serverless", "Status": "available", "EngineMode": "serverless"},
+            ]
+        },
+    }
+
+    def __init__(self):
+        self.calls = []
+
+    def get_paginator(self, operation_name):
+        return FakePaginator([self.pages[operation_name]])
+
+    def __getattr__(self, operation):
+        def _call(**kwargs):
+            self.calls.append((operation, kwargs))
+        return _call
+
+
+def test_stop_clusters_once_and_skip_rejected_calls():
+    """Verify members stop their cluster once and replicas are skipped."""
+    rds_scheduler = RdsScheduler("eu-west-1")
+    rds_scheduler.rds = FakeClusterRds()
+    rds_scheduler.tag_api = FakeTagApi(
+        ["cluster:serverless", "db:standalone", "db:stopping", "db:member-1", "db:member-2", "db:replica"]
+    )
+    rds_scheduler.stop([{"Key": "tostop", "Values": ["true"]}])
+    assert rds_scheduler.rds.calls == [
+        ("stop_db_cluster", {"DBClusterIdentifier": "aurora"}),
+        ("stop_db_instance", {"DBInstanceIdentifier": "standalone"}),
+    ]
+
+
+class FakeStartingRds(FakeClusterRds):
+    """Rds client with databases started by an interrupted invocation."""
+
+    pages = {
+        "describe_db_instances": {
+            "DBInstances": [
+                {"DBInstanceIdentifier": "starting", "DBInstanceStatus": "starting"},
+                {"DBInstanceIdentifier": "stopped", "DBInstanceStatus": "stopped"},
+            ]
+        },
+        "describe_db_clusters": {"DBClusters": []},
+    }
+
+
+def test_start_waits_starting_databases():
+    """Verify the databases still starting are waited without a start call."""
+    rds_scheduler = RdsScheduler("eu-west-1")
+    rds_scheduler.rds = FakeStartingRds()
+    rds_scheduler.tag_api = FakeTagApi(["db:starting", "db:stopped"])
+    rds_scheduler.start([{"Key": "tostart", "Values": ["true"]}])
+    assert rds_scheduler.rds.calls == [
+        ("start_db_instance", {"DBInstanceIdentifier": "stopped"}),
+    ]
+    assert rds_scheduler.started_instances == ["starting", "stopped"]
+
+
+@pytest.mark.parametrize(
+    "db, result",
+    [
+        ({"DBInstanceIdentifier": "db"}, "standalone"),
+        ({"DBInstanceIdentifier": "db", "DBClusterIdentifier": "aurora"}, "cluster-member"),
+        ({"DBInstanceIdentifier": "db", "ReadReplicaDBInstanceIdentifiers": ["db-2"]}, "replica"),
+        ({"DBInstanceIdentifier": "db", "ReadReplicaDBInstanceIdentifiers": []}, "standalone"),
+    ],
+)
+def test_classify_db_instance(db, result):
+    """Verify rds instances classification."""
+    assert classify_db_instance(db) == result
+
+
+@pytest.mark.parametrize("aws_region", ["eu-west-1", "eu-west-2"])
+@mock_rds2
+def test_stop_standalone_rds_instance(aws_region):
+    """Verify standalone rds instances are stopped."""
+    launch_rds_instance(aws_region, "tostop", "true")
+    rds_scheduler = RdsScheduler(aws_region)
+    rds_scheduler.tag_api = FakeTagApi(["db:db-instance"])
+    rds_scheduler.stop([{"Key": "tostop", "Values": ["true"]}])
+    db = rds_scheduler.describe_db_instances()["db-instance"]
+    assert db["DBInstanceStatus"] == "stopped"
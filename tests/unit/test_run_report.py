@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the run report of the scheduler actions."""
+
+import gzip
+import json
+
+import socket
+
+import boto3
+
+from botocore.config import Config
+from botocore.exceptions import EndpointConnectionError
+
+from moto import (
+    mock_cloudwatch,
+    mock_ec2,
+    mock_resourcegroupstaggingapi,
+    mock_s3,
+)
+
+from src.scheduler.cloudwatch.handler import CloudWatchAlarmScheduler
+from src.scheduler.ec2.handler import InstanceScheduler
+from src.scheduler.libs.run_report import ReportRow, RunReport, resource_ids
+
+from .utils import launch_ec2_instances
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "params, ids",
+    [
+        ({"InstanceIds": ["i-1", "i-2"], "Hibernate": True}, ["i-1", "i-2"]),
+        ({"cluster": "default", "service": "web", "desiredCount": 0}, ["web"]),
+        ({"DBClusterIdentifier": "aurora"}, ["aurora"]),
+        ({"Tags": []}, [""]),
+        (
+            {
+                "Tags": [
+                    {"ResourceId": "asg-1", "Key": "scheduler:capacity"},
+                    {"ResourceId": "asg-1", "Key": "other"},
+                ]
+            },
+            ["asg-1"],
+        ),
+    ],
+)
+def test_resource_ids(params, ids):
+    """Verify the resources of a call are read from its parameters."""
+    assert resource_ids(params) == ids
+
+
+def _read_report(path):
+    with gzip.open(path, "rt") as report_file:
+        return [json.loads(line) for line in report_file]
+
+
+@mock_ec2
+@mock_cloudwatch
+@mock_resourcegroupstaggingapi
+def test_run_report_rows(tmp_path):
+    """Verify one row is written per resource action."""
+    instances = launch_ec2_instances(2, "eu-west-1", "tostop", "true")["Instances"]
+    instance_ids = sorted(instance["InstanceId"] for instance in instances)
+    report = RunReport("stop", run_id="run-1")
+
+    with report.recording(account="123456789012"):
+        ec2_scheduler = InstanceScheduler("eu-west-1")
+        ec2_scheduler.cloudwatch_alarm = CloudWatchAlarmScheduler("eu-west-1")
+        ec2_scheduler.stop([{"Key": "tostop", "Values": ["true"]}])
+        with pytest.raises(Exception):
+            ec2_scheduler.ec2.start_instances(InstanceIds=["i-0123456789abcdef0"])
+
+    path = report.write(directory=str(tmp_path))
+    assert "/run-reports/date=" in path
+    rows = _read_report(path)
+    stopped = [row for row in rows if row["operation"] == "StopInstances"]
+    assert sorted(row["resource_id"] for row in stopped) == instance_ids
+    assert {row["outcome"] for row in stopped} == {"success"}
+    assert stopped[0]["run_id"] == "run-1"
+    assert stopped[0]["account"] == "123456789012"
+    assert stopped[0]["region"] == "eu-west-1"
+    assert stopped[0]["service"] == "ec2"
+    failed = [row for row in rows if row["operation"] == "StartInstances"]
+    assert failed[0]["outcome"] == "failed"
+    assert failed[0]["error_code"] == "InvalidInstanceID.NotFound"
+    assert not [row for row in rows if row["operation"].startswith("Describe")]
+
+
+def test_run_report_network_error():
+    """Verify a connection error is recorded as a failed row."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    session = boto3.session.Session(
+        aws_access_key_id="testing", aws_secret_access_key="testing"
+    )
+    report = RunReport("stop")
+
+    with report.recording(session, account="123456789012"):
+        ec2 = session.client(
+            "ec2",
+            region_name="eu-west-1",
+            endpoint_url=f"http://127.0.0.1:{port}",
+            config=Config(retries={"max_attempts": 0}, connect_timeout=1),
+        )
+        with pytest.raises(EndpointConnectionError):
+            ec2.stop_instances(InstanceIds=["i-0123456789abcdef0"])
+
+    [row] = report.rows
+    assert (row.operation, row.resource_id) == ("StopInstances", "i-0123456789abcdef0")
+    assert (row.outcome, row.error_code) == ("failed", "EndpointConnectionError")
+
+
+@mock_s3
+def test_run_report_s3():
+    """Verify the report is written to s3 in one object."""
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="reports")
+    report = RunReport("start")
+    assert report.write(bucket="reports") is None
+
+    report.rows.append(
+        ReportRow("", "eu-west-1", "rds", "StartDBInstance", "db", "success", "", "", 1)
+    )
+    location = report.write(bucket="reports")
+    keys = [item["Key"] for item in s3.list_objects_v2(Bucket="reports")["Contents"]]
+    assert location == f"s3://reports/{keys[0]}"
+    body = s3.get_object(Bucket="reports", Key=keys[0])["Body"].read()
+    assert json.loads(gzip.decompress(body))["operation"] == "StartDBInstance"
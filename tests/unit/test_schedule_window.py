@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the time-window schedules."""
+
+from datetime import datetime, timezone
+
+from src.scheduler.libs.schedule_window import (
+    RUNNING,
+    STOPPED,
+    desired_state_from_tag,
+    parse_schedule,
+)
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "schedule, now, active",
+    [
+        # Wednesday 2024-01-10, Paris is UTC+1 in winter
+        ("Europe/Paris 08:00-20:00 MON-FRI", datetime(2024, 1, 10, 7, 30), True),
+        ("Europe/Paris 08:00-20:00 MON-FRI", datetime(2024, 1, 10, 6, 30), False),
+        ("Europe/Paris 08:00-20:00 MON-FRI", datetime(2024, 1, 10, 19, 0), False),
+        ("Europe/Paris 08:00-20:00 MON-FRI", datetime(2024, 1, 13, 10, 0), False),
+        ("UTC 08:00-20:00 SAT+SUN", datetime(2024, 1, 13, 10, 0), True),
+        ("UTC 08:00-20:00 MON,WED", datetime(2024, 1, 10, 10, 0), True),
+        ("UTC 08:00-24:00", datetime(2024, 1, 10, 23, 59), True),
+        # Overnight windows belong to the day of their start
+        ("UTC 22:00-06:00 FRI", datetime(2024, 1, 12, 23, 0), True),
+        ("UTC 22:00-06:00 FRI", datetime(2024, 1, 13, 5, 0), True),
+        ("UTC 22:00-06:00 FRI", datetime(2024, 1, 12, 5, 0), False),
+        ("UTC 22:00-06:00 SAT-MON", datetime(2024, 1, 8, 23, 0), True),
+    ],
+)
+def test_schedule_is_active(schedule, now, active):
+    """Verify the window and the days of a schedule."""
+    assert parse_schedule(schedule).is_active(now.replace(tzinfo=timezone.utc)) is active
+
+
+@pytest.mark.parametrize(
+    "schedule",
+    [
+        "08:00-20:00",
+        "Mars/Olympus 08:00-20:00",
+        "UTC 8h-20h",
+        "UTC 08:60-20:00",
+        "UTC 08:00-24:01",
+        "UTC 08:00-20:00 MONDAY",
+        "UTC 08:00-20:00 MON FRI",
+    ],
+)
+def test_invalid_schedule(schedule):
+    """Verify invalid schedules are rejected."""
+    with pytest.raises(ValueError):
+        parse_schedule(schedule)
+
+
+def test_desired_state_from_tag():
+    """Verify the state wanted for the tags of a resource."""
+    now = datetime(2024, 1, 10, 10, 0, tzinfo=timezone.utc)
+    desired_state = desired_state_from_tag("schedule", now=now)
+
+    assert desired_state({"schedule": "UTC 08:00-20:00"}) == RUNNING
+    assert desired_state({"schedule": "UTC 12:00-20:00"}) == STOPPED
+    assert desired_state({"schedule": "invalid"}) is None
+    assert desired_state({"other": "UTC 08:00-20:00"}) is None
+
+    with_default = desired_state_from_tag("schedule", now=now, default="UTC 12:00-20:00")
+    assert with_default({}) == STOPPED
+
+
+def test_schedules_are_cached():
+    """Verify a schedule is only parsed once."""
+    parse_schedule.cache_clear()
+    desired_state = desired_state_from_tag("schedule")
+    for _ in range(10):
+        desired_state({"schedule": "UTC 08:00-20:00"})
+    assert parse_schedule.cache_info().misses == 1
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the tag expression compiler."""
+
+from src.scheduler.libs.tag_expression import compile_tags, parse_tag_expression
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "expression, tags, result",
+    [
+        ("tostop=true", {"tostop": "true"}, True),
+        ("tostop=true", {"tostop": "false"}, False),
+        ("tostop", {"tostop": "whatever"}, True),
+        ("tostop", {"other": "true"}, False),
+        ("env=dev|staging", {"env": "staging"}, True),
+        ("env!=prod", {"env": "dev"}, True),
+        ("env!=prod", {}, True),
+        ("env=prod-*", {"env": "prod-eu"}, True),
+        ("env=prod-*", {"env": "preprod-eu"}, False),
+        ("tostop=true AND NOT keep", {"tostop": "true", "keep": ""}, False),
+        ("tostop=true AND NOT keep", {"tostop": "true"}, True),
+        ("a=1 OR b=2 AND c=3", {"a": "1"}, True),
+        ("(a=1 OR b=2) AND c=3", {"a": "1"}, False),
+        ('"my key"="my value"', {"my key": "my value"}, True),
+        ("NOT NOT a", {"a": "1"}, True),
+    ],
+)
+def test_tag_expression_matches(expression, tags, result):
+    """Verify tag expression evaluation."""
+    assert parse_tag_expression(expression).matches(tags) is result
+
+
+@pytest.mark.parametrize(
+    "expression, tag_filters",
+    [
+        ("tostop=true", [{"Key": "tostop", "Values": ["true"]}]),
+        (
+            "tostop=true AND env=dev|qa",
+            [{"Key": "tostop", "Values": ["true"]}, {"Key": "env", "Values": ["dev", "qa"]}],
+        ),
+        ("tostop AND env=prod-*", [{"Key": "tostop"}]),
+        ("tostop=true OR env=dev", []),
+        ("tostop=true AND NOT env=prod", [{"Key": "tostop", "Values": ["true"]}]),
+    ],
+)
+def test_tag_expression_push_down(expression, tag_filters):
+    """Verify the terms sent to the tagging api."""
+    assert parse_tag_expression(expression).tag_filters == tag_filters
+
+
+def test_compile_tag_filters():
+    """Verify TagFilters with several values are an OR of values."""
+    expression = compile_tags([{"Key": "tostop", "Values": ["true", "yes"]}])
+    assert expression.matches({"tostop": "yes"})
+    assert not expression.matches({"tostop": "no"})
+    assert expression.tag_filters == [{"Key": "tostop", "Values": ["true", "yes"]}]
+    assert compile_tags([{"Key": "tostop", "Values": ["true", "yes"]}]) is expression
+
+
+@pytest.mark.parametrize(
+    "expression",
+    ["", "a AND", "(a=1", "a=1)", "a=", "AND a", "a ! b", 'a="b'],
+)
+def test_invalid_tag_expression(expression):
+    """Verify invalid expressions are rejected."""
+    with pytest.raises(ValueError):
+        parse_tag_expression(expression)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the tracing spans of the scheduler runs."""
+
+import json
+import time
+
+from src.scheduler.libs.orchestrator import run_waves
+from src.scheduler.libs.pipeline import run_pipeline
+from src.scheduler.libs.tracing import TRACER, Tracer, span
+
+import pytest
+
+
+class FakeScheduler:
+    """Scheduler consuming its resources in a pipeline."""
+
+    def __init__(self, delay=0):
+        self.delay = delay
+
+    def start(self):
+        run_pipeline(iter(range(5)), lambda batch: time.sleep(self.delay), batch_size=2)
+
+
+@pytest.fixture
+def tracer():
+    TRACER.configure("memory")
+    yield TRACER
+    TRACER.configure("")
+
+
+def test_spans_nested_across_threads(tracer):
+    """Verify the scheduler and batch spans are children of the run span."""
+    fast, slow = FakeScheduler(), FakeScheduler(delay=0.05)
+    labels = {
+        id(fast): {"service": "ec2", "region": "eu-west-1"},
+        id(slow): {"service": "rds", "region": "eu-west-1"},
+    }
+    with span("lambda_handler", action="start") as root:
+        run_waves([[fast, slow]], "start", labels=labels)
+
+    spans = {item.span_id: item for item in tracer.spans}
+    schedulers = [item for item in tracer.spans if item.parent_id == root.span_id]
+    assert sorted(item.name for item in schedulers) == ["start ec2 eu-west-1", "start rds eu-west-1"]
+    assert schedulers[0].attributes["region"] == "eu-west-1"
+    batches = [item for item in tracer.spans if item.name == "batch"]
+    assert sorted(item.attributes["size"] for item in batches) == [1, 1, 2, 2, 2, 2]
+    assert all(spans[item.parent_id].name.startswith("start ") for item in batches)
+    assert [item.name for item in tracer.critical_path()][:2] == [
+        "lambda_handler",
+        "start rds eu-west-1",
+    ]
+
+
+def test_span_records_error(tracer):
+    """Verify a failed span is exported with its error."""
+    with pytest.raises(KeyError):
+        with span("account", account="123456789012"):
+            raise KeyError("missing")
+    assert tracer.spans[0].attributes == {"account": "123456789012", "error": "KeyError"}
+    assert tracer.spans[0].end is not None
+
+
+def test_file_exporter(tmp_path):
+    """Verify the spans are written as NDJSON lines."""
+    path = tmp_path / "trace.ndjson"
+    tracer = Tracer()
+    tracer.configure("file", str(path))
+    with tracer.span("lambda_handler"):
+        with tracer.span("discover"):
+            pass
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["name"] for line in lines] == ["discover", "lambda_handler"]
+    assert lines[0]["parent_id"] == lines[1]["span_id"]
+    assert lines[1]["parent_id"] is None
+
+
+def test_disabled_tracer():
+    """Verify nothing is recorded without tracing mode."""
+    tracer = Tracer()
+    with tracer.span("lambda_handler") as current:
+        assert current is None
+    assert tracer.spans == []
+
+
+@pytest.mark.parametrize("mode, path", [("jaeger", None), ("file", None)])
+def test_configure_invalid_mode(mode, path):
+    """Verify an unknown mode or a file mode without path is refused."""
+    with pytest.raises(ValueError):
+        Tracer().configure(mode, path)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the caches kept by warm lambdas."""
+
+import boto3
+
+from moto import mock_ec2
+
+from src.scheduler.libs import warm_cache
+from src.scheduler.libs.api_calls import count_api_calls
+from src.scheduler.libs.aws_sessions import (
+    CLIENTS,
+    CLIENTS_MIN_SIZE,
+    CLIENTS_PER_SERVICE,
+    GLOBAL_CLIENTS,
+    get_client,
+    size_clients,
+)
+from src.scheduler.libs.warm_cache import WarmCache, cache_metrics, configure_caches
+
+
+def test_warm_cache_ttl_and_size(monkeypatch):
+    """Verify entries expire and the least recently used is evicted."""
+    now = [0.0]
+    monkeypatch.setattr(warm_cache.time, "monotonic", lambda: now[0])
+    cache = WarmCache("test", ttl=10, max_size=2)
+    assert cache.get("a", lambda: 1) == 1
+    assert cache.get("a", lambda: 2) == 1
+    cache.get("b", lambda: 3)
+    cache.get("a", lambda: 4)
+    cache.get("c", lambda: 5)
+    assert [key for key, _ in cache.items()] == ["a", "c"]
+    now[0] = 11
+    assert cache.get("a", lambda: 6) == 6
+    assert (cache.hits, cache.misses) == (2, 4)
+    del warm_cache.CACHES["test"]
+
+
+def test_configure_caches_invalidates_on_change(monkeypatch):
+    """Verify a new configuration empties the caches and resets metrics."""
+    monkeypatch.setattr(warm_cache, "_FINGERPRINT", {"value": None})
+    cache = WarmCache("test", ttl=10, max_size=2)
+    assert configure_caches({"TAG_KEY": "tostop"}) is False
+    cache.get("a", lambda: 1)
+    cache.get("a", lambda: 1)
+    assert cache_metrics()["test"] == {"hits": 1, "misses": 1, "size": 1}
+    assert configure_caches({"TAG_KEY": "tostop"}) is False
+    assert cache_metrics()["test"] == {"hits": 0, "misses": 0, "size": 1}
+    assert configure_caches({"TAG_KEY": "tostart"}) is True
+    assert len(cache) == 0
+    del warm_cache.CACHES["test"]
+
+
+@mock_ec2
+def test_count_api_calls_of_cached_clients():
+    """Verify the cached clients are counted and released after the block."""
+    CLIENTS.invalidate()
+    ec2 = get_client("ec2", "eu-west-1")
+    assert get_client("ec2", "eu-west-1") is ec2
+    assert get_client("ec2", "eu-west-1", boto3.session.Session()) is not ec2
+
+    with count_api_calls() as counter:
+        ec2.describe_instances()
+    ec2.describe_instances()
+    assert counter.calls == {"DescribeInstances": 1}
+
+
+def test_size_clients_keeps_run_clients():
+    """Verify the client cache grows with the accounts, regions and services."""
+    size_clients(1, 1, 1)
+    assert CLIENTS.max_size == CLIENTS_MIN_SIZE
+    size_clients(20, 4, 5)
+    assert CLIENTS.max_size == 20 * 4 * 5 * CLIENTS_PER_SERVICE + GLOBAL_CLIENTS
+    size_clients(1, 1, 1)
+
+
+def test_warm_cache_resize_evicts_least_recent():
+    """Verify a smaller cache evicts its least recently used entries."""
+    cache = WarmCache("test", ttl=10, max_size=3)
+    for key in "abc":
+        cache.get(key, lambda: key)
+    cache.get("a", lambda: None)
+    cache.resize(2)
+    assert [key for key, _ in cache.items()] == ["c", "a"]
+    del warm_cache.CACHES["test"]
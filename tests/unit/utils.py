@@ -5,9 +5,9 @@
 import boto3
 
 
-def launch_ec2_instances(count, region_name, tag_key, tag_value):
+def launch_ec2_instances(count, region_name, tag_key, tag_value, endpoint_url=None):
     """Create ec2 instances."""
-    client = boto3.client("ec2", region_name=region_name)
+    client = boto3.client("ec2", region_name=region_name, endpoint_url=endpoint_url)
     instance = client.run_instances(
         ImageId="ami-02df9ea15c1778c9c",
         MaxCount=count,
@@ -25,9 +25,9 @@ def launch_ec2_instances(count, region_name, tag_key, tag_value):
     return instance
 
 
-def launch_ec2_spot(count, region_name, tag_key, tag_value):
+def launch_ec2_spot(count, region_name, tag_key, tag_value, endpoint_url=None):
     """Create ec2 spot instances."""
-    client = boto3.client("ec2", region_name=region_name)
+    client = boto3.client("ec2", region_name=region_name, endpoint_url=endpoint_url)
     spot = client.run_instances(
         ImageId="ami-02df9ea15c1778c9c",
         MaxCount=count,
@@ -52,9 +52,11 @@ def launch_ec2_spot(count, region_name, tag_key, tag_value):
     return spot
 
 
-def launch_asg(region_name, tag_key, tag_value):
+def launch_asg(region_name, tag_key, tag_value, endpoint_url=None):
     """Create autoscaling group with aws tags."""
-    client = boto3.client("autoscaling", region_name=region_name)
+    client = boto3.client(
+        "autoscaling", region_name=region_name, endpoint_url=endpoint_url
+    )
     client.create_launch_configuration(
         LaunchConfigurationName="lc-test",
         ImageId="ami-02df9ea15c1778c9c",
@@ -80,9 +82,9 @@ def launch_asg(region_name, tag_key, tag_value):
     return client.describe_auto_scaling_groups(AutoScalingGroupNames=["asg-test"])
 
 
-def launch_rds_instance(region_name, tag_key, tag_value):
+def launch_rds_instance(region_name, tag_key, tag_value, endpoint_url=None):
     """Create rds instances with aws tags."""
-    client = boto3.client("rds", region_name=region_name)
+    client = boto3.client("rds", region_name=region_name, endpoint_url=endpoint_url)
     rds_instance = client.create_db_instance(
         DBInstanceIdentifier="db-instance",
         AllocatedStorage=10,
@@ -97,3 +99,21 @@ def launch_rds_instance(region_name, tag_key, tag_value):
         ],
     )
     return rds_instance
+
+
+def assert_api_budget(counter, budget, size):
+    """Verify the api calls of a run stay within their budget.
+
+    :param ApiCallCounter counter:
+        The counter of the calls of the run.
+    :param dict budget:
+        The maximum number of calls of each service and operation for
+        a number of resources, like {("ec2", "StopInstances"): f}.
+        Operations missing from the budget must not be called.
+    :param int size:
+        The number of scheduled resources.
+    """
+    for operation, count in counter.service_calls.items():
+        assert operation in budget, f"{operation} is not in the api budget"
+        limit = budget[operation](size)
+        assert count <= limit, f"{count} calls of {operation} for {size} resources, budget {limit}"
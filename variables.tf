@@ -33,7 +33,7 @@ variable "aws_regions" {
 }
 
 variable "schedule_action" {
-  description = "Define schedule action to apply on resources, accepted value are 'stop or 'start"
+  description = "Define schedule action to apply on resources, accepted value are 'stop', 'start', 'schedule' or 'reconcile'"
   type        = string
   default     = "stop"
 }
@@ -55,6 +55,12 @@ variable "scheduler_tag" {
   }
 }
 
+variable "scheduler_tag_expression" {
+  description = "Boolean tag expression to identify aws resources to stop or start, for example 'tostop=true AND NOT env=prod*'. Replace scheduler_tag when defined"
+  type        = string
+  default     = ""
+}
+
 variable "scheduler_exclude_ec2_ids" {
   description = "List of instance IDS to exclude temporary of the schedule"
   type        = list(string)
@@ -110,6 +116,90 @@ variable "tags" {
   default     = null
 }
 
+variable "scheduler_dependencies" {
+  description = "Services started before the services depending on them, for example 'ec2:rds, cloudwatch_alarm:ec2|rds'. Default start rds, then autoscaling, ec2 and ecs, then cloudwatch alarms"
+  type        = string
+  default     = ""
+}
+
+variable "scheduler_max_concurrency" {
+  description = "Maximum number of service schedulers running in parallel in each dependency wave"
+  type        = number
+  default     = 10
+}
+
+variable "scheduler_schedule_tag" {
+  description = "Tag key holding the time-window schedule of the resources, used by the schedule action"
+  type        = string
+  default     = "schedule"
+}
+
+variable "reconcile_window" {
+  description = "Schedule of the resources without a schedule tag used by the reconcile action, for example 'Europe/Paris 08:00-20:00 MON-FRI'"
+  type        = string
+  default     = ""
+}
+
+variable "run_report_bucket" {
+  description = "S3 bucket receiving the gzipped NDJSON report of each run, no report when empty"
+  type        = string
+  default     = ""
+}
+
+variable "scheduler_deadline_safety_margin" {
+  description = "Seconds kept before the lambda timeout, the unfinished work is then handed to a new invocation"
+  type        = number
+  default     = 60
+}
+
+variable "scheduler_discovery_page_size" {
+  description = "Number of resources listed per page by the tagging and autoscaling apis, at most 100, 0 for the api default"
+  type        = number
+  default     = 0
+}
+
+variable "autoscaling_schedule_mode" {
+  description = "Schedule mode of the autoscaling groups without the scheduler:asg-mode tag, suspend or capacity"
+  type        = string
+  default     = "suspend"
+}
+
+variable "ec2_stop_mode" {
+  description = "Stop mode of the ec2 instances without the scheduler:stop-mode tag, stop or hibernate"
+  type        = string
+  default     = "stop"
+}
+
+variable "scheduler_engine" {
+  description = "Execution engine of the scheduler actions, thread or async (requires aiobotocore in the lambda package)"
+  type        = string
+  default     = "thread"
+}
+
+variable "rds_readiness_follow_up" {
+  description = "Don't wait started rds databases, a follow-up invocation of the lambda reports their time to available"
+  type        = bool
+  default     = false
+}
+
+variable "scheduler_assume_role_arns" {
+  description = "List of iam role arns assumed by the lambda to schedule the resources of other aws accounts, default schedule the lambda account"
+  type        = list(string)
+  default     = []
+}
+
+variable "scheduler_accounts_max_concurrency" {
+  description = "Maximum number of aws accounts scheduled in parallel"
+  type        = number
+  default     = 5
+}
+
+variable "scheduler_tracing" {
+  description = "Tracing of the scheduler runs, xray (requires aws-xray-sdk in the lambda package) or an empty string to disable it"
+  type        = string
+  default     = ""
+}
+
 variable "aws_accounts_arn" {
   description = "List of the accounts arn authorized to see & edit exceptions"
   type        = list(string)